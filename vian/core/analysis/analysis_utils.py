@@ -1,4 +1,9 @@
+import pickle
+import multiprocessing
 from threading import Lock
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from PyQt6.QtCore import QObject
 from vian.core.data.interfaces import IAnalysisJob
 from vian.core.container.container_interfaces import BaseProjectEntity
 from typing import List, Dict
@@ -11,12 +16,144 @@ def progress_dummy(args, **kwargs):
     pass
 
 
+def _pack_qobject(obj, exclude=()):
+    """
+    QObjects can not be pickled, hence we send their class and attributes to the worker process.
+    Attributes listed in exclude are replaced with None.
+    """
+    state = dict()
+    for k, v in obj.__dict__.items():
+        state[k] = None if k in exclude else v
+    return obj.__class__, state
+
+
+def _unpack_qobject(packed):
+    cls, state = packed
+    obj = cls.__new__(cls)
+    QObject.__init__(obj)
+    obj.__dict__.update(state)
+    return obj
+
+
+def _is_picklable(obj):
+    try:
+        pickle.dumps(obj)
+        return True
+    except Exception:
+        return False
+
+
+def _process_packed(packed_analysis, arg):
+    analysis = _unpack_qobject(packed_analysis)
+    result = analysis.process(arg, progress_dummy)
+    if result is None:
+        return None
+    return _pack_qobject(result)
+
+
+def process_parallel(analysis: IAnalysisJob, args, n_workers, is_aborted=None):
+    """
+    Performs analysis.process() for each of the given args on a pool of worker processes
+    and yields (index, result) in the order of args, as soon as the respective result is available.
+
+    The analysis and the args are pickled to the workers, args which can not be pickled
+    (e.g. because they reference a semantic segmentation stored in the project) are
+    processed in the calling process instead.
+
+    :param analysis: The IAnalysisJob to perform
+    :param args: The list of arguments as returned by IAnalysisJob.prepare()
+    :param n_workers: The number of worker processes
+    :param is_aborted: An optional function returning True if the remaining args should be skipped
+    """
+    packed = _pack_qobject(analysis, exclude=("hdf5_manager", "target_class_obj"))
+    if not _is_picklable(packed):
+        for i, arg in enumerate(args):
+            if is_aborted is not None and is_aborted():
+                return
+            yield i, analysis.process(arg, progress_dummy)
+        return
+
+    # Forking a process with running Qt and HDF5 threads is not safe, hence the workers are spawned
+    executor = ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn"))
+    futures = []
+    try:
+        for arg in args:
+            if _is_picklable(arg):
+                futures.append(executor.submit(_process_packed, packed, arg))
+            else:
+                futures.append(None)
+
+        for i, (arg, f) in enumerate(zip(args, futures)):
+            if is_aborted is not None and is_aborted():
+                return
+            if f is None:
+                result = analysis.process(arg, progress_dummy)
+            else:
+                result = f.result()
+                if result is not None:
+                    result = _unpack_qobject(result)
+            yield i, result
+    finally:
+        for f in futures:
+            if f is not None:
+                f.cancel()
+        executor.shutdown(wait=True)
+
+
+class AnalysisProcessPool:
+    """
+    Runs a multiple_result IAnalysisJob for a list of arguments on a pool of worker processes.
+    Shares the interface of FramePipeline, such that the AnalysisWorker can schedule both.
+    """
+    def __init__(self, analysis: IAnalysisJob, args, n_workers):
+        self.tasks = [(analysis, arg) for arg in args]
+        self.n_workers = n_workers
+        self.aborted = False
+
+    def abort(self):
+        self.aborted = True
+
+    def run(self, sign_progress=None):
+        results = [None] * len(self.tasks)
+        if len(self.tasks) == 0:
+            return results
+
+        analysis = self.tasks[0][0]
+        args = [arg for a, arg in self.tasks]
+        for i, result in process_parallel(analysis, args, self.n_workers, is_aborted=lambda: self.aborted):
+            results[i] = result
+            if sign_progress is not None:
+                sign_progress((i + 1) / len(args))
+        return results
+
+
+def _store_result(project: VIANProject, analysis: IAnalysisJob, res):
+    if isinstance(res, list):
+        for r in res:
+            if r is not None:
+                with PROJECT_LOCK:
+                    analysis.modify_project(project, r)
+                    project.add_analysis(r)
+    else:
+        if res is not None:
+            with PROJECT_LOCK:
+                analysis.modify_project(project, res)
+                project.add_analysis(res)
+
+
 def run_analysis(project:VIANProject,
                  analysis: IAnalysisJob,
                  targets: List[BaseProjectEntity],
                  class_objs: List[ClassificationObject]=None,
                  progress_callback=None,
-                 override = True):
+                 override = True,
+                 n_workers = 1):
+    """
+    Performs an analysis on the given targets and adds the results to the project.
+
+    :param n_workers: The number of worker processes used for multiple_result analyses,
+    with 1 all targets are processed in the calling thread.
+    """
 
     if progress_callback is None:
         progress_callback = progress_dummy
@@ -28,37 +165,38 @@ def run_analysis(project:VIANProject,
 
     n, n_total = 0, len(class_objs) * len(targets)
 
-    for clobj in class_objs:
-
-        if override is False:
-            tgts = []
-            for t in targets:
-                ret = t.get_connected_analysis(analysis.__class__, as_clobj_dict=True)
-                if clobj in ret:
-                    continue
-                tgts.append(t)
-        else:
-            tgts = targets
-        args = analysis.prepare(project, tgts, fps, clobj)
-        res = []
-        if analysis.multiple_result:
-            for i, arg in enumerate(args):
-                progress_callback(n / n_total)
-                res.append(analysis.process(arg, progress_dummy))
-                n += 1
-        else:
-            res = analysis.process(args, progress_callback)
-
-        if isinstance(res, list):
-            for r in res:
-                if r is not None:
-                    with PROJECT_LOCK:
-                        analysis.modify_project(project, r)
-                        project.add_analysis(r)
-        else:
-            if res is not None:
-                with PROJECT_LOCK:
-                    analysis.modify_project(project, res)
-                    project.add_analysis(res)
+    # The results are written to the HDF5 file in blocks
+    if project.hdf5_manager is not None:
+        batch = project.hdf5_manager.write_batch()
+    else:
+        batch = nullcontext()
+
+    with batch:
+        for clobj in class_objs:
+
+            if override is False:
+                tgts = []
+                for t in targets:
+                    ret = t.get_connected_analysis(analysis.__class__, as_clobj_dict=True)
+                    if clobj in ret:
+                        continue
+                    tgts.append(t)
+            else:
+                tgts = targets
+            args = analysis.prepare(project, tgts, fps, clobj)
+            if analysis.multiple_result:
+                if n_workers > 1 and len(args) > 1:
+                    results = process_parallel(analysis, args, n_workers)
+                else:
+                    results = ((i, analysis.process(arg, progress_dummy)) for i, arg in enumerate(args))
+
+                # Results arrive in the order of args and are stored as soon as they are available
+                for i, res in results:
+                    progress_callback(n / n_total)
+                    _store_result(project, analysis, res)
+                    n += 1
+            else:
+                res = analysis.process(args, progress_callback)
+                _store_result(project, analysis, res)
 
     progress_callback(1.0)
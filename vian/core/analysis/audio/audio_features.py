@@ -0,0 +1,97 @@
+"""
+Windowed audio features computed from the audio dataset of the HDF5Manager.
+
+The audio is read in chunks of AUDIO_CHUNK_SIZE samples, such that the samples of a movie
+never have to be loaded into memory at once.
+"""
+
+import numpy as np
+
+AUDIO_SAMPLE_RATE = 22050
+
+# The number of samples read from the audio dataset at once
+AUDIO_CHUNK_SIZE = AUDIO_SAMPLE_RATE * 60
+
+
+def iter_audio_chunks(audio, chunk_size=AUDIO_CHUNK_SIZE):
+    """
+    Yields (start, samples) for consecutive chunks of the audio.
+
+    :param audio: The audio dataset or an array
+    """
+    for start in range(0, audio.shape[0], chunk_size):
+        yield start, np.asarray(audio[start:start + chunk_size], dtype=np.float64)
+
+
+def window_sums(audio, window, transform=np.abs, chunk_size=AUDIO_CHUNK_SIZE, sign_progress=None):
+    """
+    Returns the sum of transform(samples) within each window [i * window, (i + 1) * window),
+    the last window holds the remaining samples and may be shorter.
+    """
+    chunk_size = max(1, chunk_size // window) * window
+    length = audio.shape[0]
+    sums = np.zeros(int(np.ceil(length / window)), dtype=np.float64)
+
+    for start, chunk in iter_audio_chunks(audio, chunk_size):
+        if sign_progress is not None:
+            sign_progress(start / length)
+        values = transform(chunk)
+        i = start // window
+        n_full = values.shape[0] // window
+        sums[i:i + n_full] = values[:n_full * window].reshape(n_full, window).sum(axis=1)
+        if values.shape[0] > n_full * window:
+            sums[i + n_full] = values[n_full * window:].sum()
+    return sums
+
+
+def centered_window_bounds(length, window, window_s):
+    """
+    Returns the sample ranges [start, stop) spanning window_s windows before and after each full window.
+
+    Ranges at the beginning of the audio span the first 2 * window_s windows,
+    ranges of the last window_s windows are shifted one window to the front.
+    Negative starts are wrapped like python slices.
+
+    :return: two int arrays of length length // window
+    """
+    n = length // window
+    i = np.arange(n, dtype=np.int64)
+    w0 = i - window_s
+    w1 = i + window_s
+
+    first = i < window_s
+    w0[first] = 0
+    w1[first] = 2 * window_s
+
+    last = i >= n - window_s
+    t = np.where(first, window_s - i, 1)
+    w0[last] = (i - window_s - t)[last]
+    w1[last] = (i + window_s - t)[last]
+
+    start = w0 * window
+    start[start < 0] += length
+    start = np.clip(start, 0, length)
+    stop = np.clip(w1 * window, 0, length)
+    return start, stop
+
+
+def volume_envelope(audio, window=AUDIO_SAMPLE_RATE, window_s=5, chunk_size=AUDIO_CHUNK_SIZE, sign_progress=None):
+    """
+    Returns the mean absolute amplitude within centered_window_bounds() of each full window.
+    """
+    length = audio.shape[0]
+    sums = window_sums(audio, window, np.abs, chunk_size, sign_progress)
+    cumulative = np.concatenate([[0.0], np.cumsum(sums)])
+    start, stop = centered_window_bounds(length, window, window_s)
+
+    def prefix(positions):
+        result = cumulative[np.minimum(np.ceil(positions / window).astype(np.int64), sums.shape[0])]
+        # Only wrapped starts lie within a window, their remainder is read from the audio
+        for k in np.where((positions % window != 0) & (positions != length))[0]:
+            p = positions[k]
+            result[k] = cumulative[p // window] + np.abs(np.asarray(audio[(p // window) * window:p], dtype=np.float64)).sum()
+        return result
+
+    count = stop - start
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, (prefix(stop) - prefix(start)) / count, np.nan)
@@ -15,6 +15,7 @@ from vian.core.visualization.palette_plot import *
 
 import librosa
 from vian.core.analysis.misc import preprocess_frame
+from vian.core.analysis.audio.audio_features import centered_window_bounds, AUDIO_CHUNK_SIZE
 
 """
 array Structure: 
@@ -23,6 +24,37 @@ array Structure:
 
 """
 
+# The frames of the onset envelope, in addition to n_fft / hop_length, by which neighbouring chunks overlap
+ONSET_OVERLAP_FRAMES = 2
+
+
+def onset_strength_envelope(audio, sr, hop_length=512, n_fft=2048, chunk_size=AUDIO_CHUNK_SIZE):
+    """
+    Computes the onset strength of the audio chunk by chunk, frame k corresponds to the sample k * hop_length.
+
+    Each chunk is extended by ONSET_OVERLAP_FRAMES frames of its neighbours, which are dropped afterwards,
+    such that the padding of the envelope and of the centered STFT frames only affects the beginning and
+    the end of the audio, as if it were computed at once.
+    """
+    chunk_size = max(1, chunk_size // hop_length) * hop_length
+    overlap = (ONSET_OVERLAP_FRAMES + int(np.ceil(n_fft / hop_length))) * hop_length
+    length = audio.shape[0]
+
+    envelopes = []
+    for start in range(0, length, chunk_size):
+        stop = min(start + chunk_size, length)
+        a = max(0, start - overlap)
+        b = min(length, stop + overlap)
+        chunk = np.asarray(audio[a:b], dtype=np.float32)
+        env = librosa.onset.onset_strength(y=chunk, sr=sr, hop_length=hop_length, n_fft=n_fft)
+
+        # The centered framing adds a frame for the end of the chunk, which is the first frame of the next one
+        first = (start - a) // hop_length
+        envelopes.append(env[first:first + int(np.ceil((stop - start) / hop_length))])
+    if len(envelopes) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(envelopes)
+
 
 @vian_analysis
 class AudioTempoAnalysis(IAnalysisJob):
@@ -61,28 +93,17 @@ class AudioTempoAnalysis(IAnalysisJob):
         if audio is None:
             return
 
-        print(audio.shape [0] / window)
-        res = np.zeros(int(audio.shape[0] / window), dtype=np.float16)
-        for i in range(int(audio.shape[0] / window)):
-            if i % 10 == 0:
-                sign_progress(i / int(audio.shape[0] / window))
-
-            w0 = i * window - (window_s * window)
-            w1 = i * window + (window_s * window)
-
-            if i < window_s:
-                t = window_s - i
-                w0 = i * window - ((window_s - t) * window)
-                w1 = i * window + ((window_s + t) * window)
+        hop_length = 512
+        onset_env = onset_strength_envelope(audio, sr=window, hop_length=hop_length)
 
-            if i >= int(audio.shape[0] / window) - window_s:
-                w0 = i * window - ((window_s + t) * window)
-                w1 = i * window + ((window_s - t) * window)
-
-            onset_env = librosa.onset.onset_strength(audio[w0:w1], sr=window)
-            tempo = librosa.beat.tempo(audio[w0:w1], onset_envelope=onset_env)
+        # The onset envelope is computed once, each window only estimates the tempo of its slice
+        start, stop = centered_window_bounds(audio.shape[0], window, window_s)
+        res = np.zeros(start.shape[0], dtype=np.float16)
+        for i, (w0, w1) in enumerate(zip((start // hop_length).tolist(), (stop // hop_length).tolist())):
+            if i % 10 == 0:
+                sign_progress(i / start.shape[0])
 
-            res[i] = tempo
+            res[i] = librosa.beat.tempo(onset_envelope=onset_env[w0:w1], sr=window, hop_length=hop_length)[0]
 
         result = IAnalysisJobAnalysis(
             name="Audio Tempo",
@@ -13,8 +13,8 @@ from vian.core.analysis.color.palette_extraction import *
 from vian.core.container.hdf5_manager import vian_analysis
 from vian.core.visualization.palette_plot import *
 
-import librosa
 from vian.core.analysis.misc import preprocess_frame
+from vian.core.analysis.audio.audio_features import volume_envelope
 
 """
 array Structure: 
@@ -61,26 +61,7 @@ class AudioVolumeAnalysis(IAnalysisJob):
         if audio is None:
             return
 
-        res = np.zeros(int(audio.shape[0] / window), dtype=np.float16)
-        for i in range(int(audio.shape[0] / window)):
-            if i % 10 == 0:
-                sign_progress(i / int(audio.shape[0] / window))
-
-            w0 = i * window - (window_s * window)
-            w1 = i * window + (window_s * window)
-
-            if i < window_s:
-                t = window_s - i
-                w0 = i * window - ((window_s - t) * window)
-                w1 = i * window + ((window_s + t) * window)
-
-            if i >= int(audio.shape[0] / window) - window_s:
-                w0 = i * window - ((window_s + t) * window)
-                w1 = i * window + ((window_s - t) * window)
-
-            volume = np.mean(np.abs(audio[w0:w1]))
-
-            res[i] = volume
+        res = volume_envelope(audio, window, window_s, sign_progress=sign_progress).astype(np.float16)
 
         result = IAnalysisJobAnalysis(
             name="Audio Volume",
@@ -5,7 +5,7 @@ June 2018
 
 """
 
-from vian.core.data.interfaces import IAnalysisJob, VisualizationTab, ParameterWidget
+from vian.core.data.interfaces import IAnalysisJob, VisualizationTab, ParameterWidget, FrameRequest
 from vian.core.container.project import SEGMENTATION, SEGMENT, SCREENSHOT, SCREENSHOT_GROUP, BaseProjectEntity, VIANProject
 from vian.core.container.analysis import IAnalysisJobAnalysis
 
@@ -13,7 +13,7 @@ from vian.core.analysis.color.palette_extraction import *
 from vian.core.container.hdf5_manager import vian_analysis
 from vian.core.visualization.palette_plot import *
 
-from vian.core.analysis.misc import preprocess_frame
+from vian.core.analysis.misc import preprocess_frame, FramePipeline
 
 """
 array Structure: 
@@ -74,62 +74,70 @@ class ColorFeatureAnalysis(IAnalysisJob):
 
     def process(self, argst, sign_progress):
         argst, sign_progress = super(ColorFeatureAnalysis, self).process(argst, sign_progress)
-        result = []
         # Signal the Progress
-        cap = None
-        counter = 0
-        for args in argst:
-            sign_progress(counter / len(argst))
-            counter += 1
+        sign_progress(0.0)
+
+        result = FramePipeline([(self, argst)]).run(sign_progress)[0]
+        sign_progress(1.0)
+        return result
 
+    def begin_frames(self, argst):
+        targets = []
+        frame_positions = set()
+        movie_path, margins = None, None
+        for args in argst:
             start = args['start']
             stop = args['end']
             movie_path = args['movie_path']
             margins = args['margins']
             semseg = args['semseg']
-            colors_lab = []
-            colors_bgr = []
-
-            if cap is None:
-                cap = cv2.VideoCapture(movie_path)
-            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
-            c = start
 
+            resolution = self.resolution
             if self.coverage is not None:
-                self.resolution = self.resolution_from_coverage(start, stop + 1)
+                resolution = self.resolution_from_coverage(start, stop + 1)
 
-            for i in range(start, stop  + 1, self.resolution):
-                sign_progress((c - start) / ((stop - start) + 1))
-                cap.set(cv2.CAP_PROP_POS_FRAMES, i)
-                ret, frame = cap.read()
-                if frame is None:
-                    break
-
-                # Get sub frame if there are any margins
+            bin_mask = None
+            if semseg is not None and self.target_class_obj is not None:
+                name, labels = self.target_class_obj.semantic_segmentation_labels
+                mask = semseg.get_adata()
+                bin_mask = labels_to_binary_mask(mask, labels)
                 if margins is not None:
-                    frame = frame[margins[1]:margins[3], margins[0]:margins[2]]
-
-                frame = preprocess_frame(frame, self.max_width)
-
-                bin_mask = None
-                if semseg is not None and self.target_class_obj is not None:
-                    name, labels = self.target_class_obj.semantic_segmentation_labels
-                    mask = semseg.get_adata()
-                    bin_mask = labels_to_binary_mask(mask, labels)
-                    if margins is not None:
-                        bin_mask = bin_mask[margins[1]:margins[3], margins[0]:margins[2]]
-                    bin_mask = preprocess_frame(bin_mask, self.max_width, mode=cv2.INTER_NEAREST)
-
-                if bin_mask is not None:
-                    indices = np.where(bin_mask > 0)
-                    colors_bgr.append(np.mean(frame[indices], axis=(0)))
-                    frame_lab = cv2.cvtColor(frame.astype(np.float32) / 255, cv2.COLOR_BGR2LAB)
-                    colors_lab.append(np.mean(frame_lab[indices], axis=(0)))
-                else:
-                    colors_bgr.append(np.mean(frame, axis = (0, 1)))
-                    frame_lab = cv2.cvtColor(frame.astype(np.float32) / 255, cv2.COLOR_BGR2LAB)
-                    colors_lab.append(np.mean(frame_lab, axis=(0, 1)))
-                c += 1
+                    bin_mask = bin_mask[margins[1]:margins[3], margins[0]:margins[2]]
+                bin_mask = preprocess_frame(bin_mask, self.max_width, mode=cv2.INTER_NEAREST)
+
+            positions = set(range(start, stop + 1, resolution))
+            frame_positions.update(positions)
+            targets.append(dict(target=args['target'],
+                                resolution=resolution,
+                                positions=positions,
+                                bin_mask=bin_mask,
+                                colors_lab=[],
+                                colors_bgr=[]))
+
+        return FrameRequest(movie_path, margins, sorted(frame_positions), targets)
+
+    def process_frame(self, state, frame_pos, frame):
+        frame = preprocess_frame(frame, self.max_width)
+        frame_lab = None
+        for t in state:
+            if frame_pos not in t['positions']:
+                continue
+            if frame_lab is None:
+                frame_lab = cv2.cvtColor(frame.astype(np.float32) / 255, cv2.COLOR_BGR2LAB)
+
+            if t['bin_mask'] is not None:
+                indices = np.where(t['bin_mask'] > 0)
+                t['colors_bgr'].append(np.mean(frame[indices], axis=(0)))
+                t['colors_lab'].append(np.mean(frame_lab[indices], axis=(0)))
+            else:
+                t['colors_bgr'].append(np.mean(frame, axis = (0, 1)))
+                t['colors_lab'].append(np.mean(frame_lab, axis=(0, 1)))
+
+    def end_frames(self, state):
+        result = []
+        for t in state:
+            colors_lab = t['colors_lab']
+            colors_bgr = t['colors_bgr']
 
             if len(colors_lab) > 1:
                 colors_bgr = np.mean(colors_bgr, axis = 0)
@@ -145,7 +153,6 @@ class ColorFeatureAnalysis(IAnalysisJob):
             saturation_l = lab_to_sat(lab=colors_lab, implementation="luebbe")
             saturation_p = lab_to_sat(lab=colors_lab, implementation="pythagoras")
 
-            sign_progress(1.0)
             result.append(
              IAnalysisJobAnalysis(
                 name="Color Average",
@@ -155,8 +162,8 @@ class ColorFeatureAnalysis(IAnalysisJob):
                                saturation_p = saturation_p
                                ),
                 analysis_job_class=self.__class__,
-                parameters=dict(resolution = self.resolution),
-                container=args['target']
+                parameters=dict(resolution = t['resolution']),
+                container=t['target']
             )
             )
         return result
@@ -13,10 +13,10 @@ from vian.core.gui.ewidgetbase import EGraphicsView
 from PyQt6.QtCore import *
 from PyQt6.QtWidgets import *
 from vian.core.visualization.basic_vis import HistogramVis
-from vian.core.data.interfaces import IAnalysisJob, ParameterWidget, VisualizationTab
+from vian.core.data.interfaces import IAnalysisJob, ParameterWidget, VisualizationTab, FrameRequest
 from vian.core.container.hdf5_manager import vian_analysis
 
-from vian.core.analysis.misc import preprocess_frame
+from vian.core.analysis.misc import preprocess_frame, FramePipeline
 @vian_analysis
 class ColorHistogramAnalysis(IAnalysisJob):
     """
@@ -54,62 +54,56 @@ class ColorHistogramAnalysis(IAnalysisJob):
         # Signal the Progress
         sign_progress(0.0)
 
+        result = FramePipeline([(self, args)]).run(sign_progress)[0]
+        sign_progress(1.0)
+        return result
+
+    def begin_frames(self, args):
         start = args['start']
         stop = args['end']
-        movie_path = args['movie_path']
-        margins = args['margins']
         semseg = args['semseg']
 
-        cap = cv2.VideoCapture(movie_path)
-        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
-        c = start
-        final_hist = np.zeros(shape=(16,16,16), dtype = np.float32)
-        shape = (1,1)
-
         bin_mask = None
         if semseg is not None:
             name, labels = self.target_class_obj.semantic_segmentation_labels
             mask = semseg.get_adata()
             bin_mask = labels_to_binary_mask(mask, labels)
-
-        for i in range(start, stop  + 1, self.resolution):
-            sign_progress((c - start) / ((stop - start) + 1))
-
-            cap.set(cv2.CAP_PROP_POS_FRAMES, i)
-            ret, frame = cap.read()
-
-            if frame is None:
-                break
-
-            # Get sub frame if there are any margins
-            if margins is not None:
-                frame = frame[margins[1]:margins[3], margins[0]:margins[2]]
-
-            frame = preprocess_frame(frame, self.max_width)
-            if c == start:
-                shape = frame.shape
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
-            if bin_mask is not None:
-                bin_mask = preprocess_frame(bin_mask, self.max_width, mode=cv2.INTER_NEAREST)
-                data = frame[np.where(bin_mask==True)]
-            else:
-                data = np.resize(frame, (frame.shape[0] * frame.shape[1], 3))
-
-            final_hist += cv2.calcHist([data[:, 0], data[:, 1], data[:, 2]], [0, 1, 2], None,
-                                [16, 16, 16],
-                                [0, 255, 0, 255, 1, 255])
-            c += 1
-
-        final_hist /= (np.clip(stop - start, 1, None))
+            bin_mask = preprocess_frame(bin_mask, self.max_width, mode=cv2.INTER_NEAREST)
+
+        state = dict(target=args['target'],
+                     start=start,
+                     stop=stop,
+                     bin_mask=bin_mask,
+                     shape=None,
+                     final_hist=np.zeros(shape=(16,16,16), dtype = np.float32))
+        return FrameRequest(args['movie_path'], args['margins'], range(start, stop + 1, self.resolution), state)
+
+    def process_frame(self, state, frame_pos, frame):
+        frame = preprocess_frame(frame, self.max_width)
+        if state['shape'] is None:
+            state['shape'] = frame.shape
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
+        if state['bin_mask'] is not None:
+            data = frame[np.where(state['bin_mask']==True)]
+        else:
+            data = np.resize(frame, (frame.shape[0] * frame.shape[1], 3))
+
+        state['final_hist'] += cv2.calcHist([data[:, 0], data[:, 1], data[:, 2]], [0, 1, 2], None,
+                                            [16, 16, 16],
+                                            [0, 255, 0, 255, 1, 255])
+
+    def end_frames(self, state):
+        shape = state['shape'] if state['shape'] is not None else (1, 1)
+        final_hist = state['final_hist']
+        final_hist /= (np.clip(state['stop'] - state['start'], 1, None))
         final_hist /= (shape[0] * shape[1])
 
-        sign_progress(1.0)
         return IAnalysisJobAnalysis(
             name="Color-Histogram",
             results = final_hist,
             analysis_job_class=self.__class__,
             parameters=dict(resolution=self.resolution),
-            container=args['target']
+            container=state['target']
         )
 
     def modify_project(self, project: VIANProject, result: IAnalysisJobAnalysis, main_window=None):
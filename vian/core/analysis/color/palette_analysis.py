@@ -11,10 +11,10 @@ import cv2
 from vian.core.container.project import *
 from vian.core.analysis.color.palette_extraction import *
 from vian.core.visualization.palette_plot import *
-from vian.core.data.interfaces import IAnalysisJob, ParameterWidget, VisualizationTab
+from vian.core.data.interfaces import IAnalysisJob, ParameterWidget, VisualizationTab, FrameRequest
 from vian.core.container.hdf5_manager import vian_analysis
 
-from vian.core.analysis.misc import preprocess_frame
+from vian.core.analysis.misc import preprocess_frame, FramePipeline
 
 @vian_analysis
 class ColorPaletteAnalysis(IAnalysisJob):
@@ -56,10 +56,13 @@ class ColorPaletteAnalysis(IAnalysisJob):
         # Signal the Progress
         sign_progress(0.0)
 
+        result = FramePipeline([(self, args)]).run(sign_progress)[0]
+        sign_progress(1.0)
+        return result
+
+    def begin_frames(self, args):
         start = args['start']
         stop = args['end']
-        movie_path = args['movie_path']
-        margins = args['margins']
         semseg = args['semseg']
         bin_mask = None
         if semseg is not None:
@@ -68,63 +71,50 @@ class ColorPaletteAnalysis(IAnalysisJob):
             bin_mask = labels_to_binary_mask(mask, labels)
             bin_mask = preprocess_frame(bin_mask, self.max_width, mode=cv2.INTER_NEAREST)
 
-        palettes = []
-
-        cap = cv2.VideoCapture(movie_path)
-        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
-        c = start
-
-        model = None
+        resolution = self.resolution
         if self.coverage is not None:
-            self.resolution = self.resolution_from_coverage(start, stop + 1)
-
-        for i in range(start, stop + 1, self.resolution):
-            sign_progress((c - start) / ((stop - start) + 1))
-
-            cap.set(cv2.CAP_PROP_POS_FRAMES, i )
-            ret, frame = cap.read()
-
-            if frame is None:
-                break
-            # Get sub frame if there are any margins
-            if margins is not None:
-                frame = frame[margins[1]:margins[3], margins[0]:margins[2]]
-            frame = preprocess_frame(frame, self.max_width)
-
-            if model is None:
-                if self.seeds_input_width < frame.shape[0]:
-                    rx = self.seeds_input_width / frame.shape[0]
-                    frame = cv2.resize(frame, None, None, rx, rx, cv2.INTER_CUBIC)
-                model = PaletteExtractorModel(frame, n_pixels=self.n_super_pixel, num_levels=8)
-
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
-
-            try:
-                pal = color_palette(frame, mask=bin_mask,
-                                    mask_index=255,
-                                    n_pixels=self.n_super_pixel,
-                                    seeds_input_width = self.seeds_input_width,
-                                    seeds_model=model)
-            except Exception as e:
-                log_error(e)
-                pal = None
-            if pal is not None:
-                palettes.append(pal)
-            c += 1
-
+            resolution = self.resolution_from_coverage(start, stop + 1)
+
+        state = dict(target=args['target'], resolution=resolution, bin_mask=bin_mask, model=None, palettes=[])
+        return FrameRequest(args['movie_path'], args['margins'], range(start, stop + 1, resolution), state)
+
+    def process_frame(self, state, frame_pos, frame):
+        frame = preprocess_frame(frame, self.max_width)
+
+        if state['model'] is None:
+            if self.seeds_input_width < frame.shape[0]:
+                rx = self.seeds_input_width / frame.shape[0]
+                frame = cv2.resize(frame, None, None, rx, rx, cv2.INTER_CUBIC)
+            state['model'] = PaletteExtractorModel(frame, n_pixels=self.n_super_pixel, num_levels=8)
+
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
+
+        try:
+            pal = color_palette(frame, mask=state['bin_mask'],
+                                mask_index=255,
+                                n_pixels=self.n_super_pixel,
+                                seeds_input_width = self.seeds_input_width,
+                                seeds_model=state['model'])
+        except Exception as e:
+            log_error(e)
+            pal = None
+        if pal is not None:
+            state['palettes'].append(pal)
+
+    def end_frames(self, state):
+        palettes = state['palettes']
         if len(palettes) > 0:
             if len(palettes) > 1:
                 result = combine_palettes(palettes)
             else:
                 result = palettes[0]
 
-            sign_progress(1.0)
             return IAnalysisJobAnalysis(
                 name="Color-Palette",
                 results = dict(tree=result.tree, dist = result.merge_dists),
                 analysis_job_class=self.__class__,
-                parameters=dict(resolution=self.resolution),
-                container=args['target'],
+                parameters=dict(resolution=state['resolution']),
+                container=state['target'],
             )
         return None
 
@@ -27,30 +27,23 @@ class PaletteExtractorModel:
         return self.model.getLabels()
 
     def labels_to_avg_color_mask(self, lab, labels):
-        indices = np.unique(labels)
-        for idx in indices:
-            pixels = np.where(labels == idx)
-            lab[pixels] = np.mean(lab[pixels], axis = 0)
+        counts, means = label_means(lab, labels)
+        lab[:] = means[labels]
         return lab
 
     def labels_to_palette(self, lab, labels):
-        indices = np.unique(labels)
-        bins = []
-        for idx in indices:
-            pixels = np.where(labels == idx)
-            avg_col = np.mean(lab[pixels], axis = 0)
-            n_pixels = pixels[0].shape[0]
-            bins.append([avg_col, n_pixels])
-
-        bins = np.array(sorted(bins, key=lambda x:x[1], reverse=True))
+        counts, means = label_means(lab, labels)
+        indices = np.nonzero(counts)[0]
+        order = np.argsort(-counts[indices], kind="stable")
+        colors, n_pixels = means[indices[order]], counts[indices[order]]
 
         n_palette = 10
         preview = np.zeros(shape=(100,1500,3))
-        total = np.sum(bins[0:n_palette, 1])
+        total = np.sum(n_pixels[0:n_palette])
         last  = 0
         for b in range(n_palette):
-            preview[:, last : last + (int(bins[b][1] * 1500 / total))] = bins[b, 0]
-            last += int(bins[b][1] * 1500 / total)
+            preview[:, last : last + (int(n_pixels[b] * 1500 / total))] = colors[b]
+            last += int(n_pixels[b] * 1500 / total)
 
         return preview.astype(np.uint8)
 
@@ -78,64 +71,211 @@ class PaletteExtractorModel:
 
 
 
-def to_cluster_tree(Z, labels:List, colors, n_merge_steps = 1000, n_merge_per_lvl = 10):
-    all_lbl = labels.copy()
-    all_col = colors.copy()
-    all_n = [1] * len(all_col)
-
-    # print("Recreating Tree")
-    for i in range(Z.shape[0]):
-        a = int(Z[i][0])
-        b = int(Z[i][1])
-        all_lbl.append(len(all_lbl))
-        all_col.append(np.divide((all_col[a] * all_n[a]) + (all_col[b] * all_n[b]), all_n[a] + all_n[b]))
-        all_n.append(all_n[a] + all_n[b])
-
-    result_lbl = [[len(all_lbl) - 1]]
-    current_nodes = [len(all_lbl) - 1]
-    i = 0
-
-    merge_dists = []
-    while(len(current_nodes) <= n_merge_steps and i < len(all_lbl)):
-        try:
-            curr_lbl = len(all_lbl) - 1 - i
-            entry = Z[Z.shape[0] - 1 - i]
-            a = int(entry[0])
-            b = int(entry[1])
-            idx = current_nodes.index(curr_lbl)
-            current_nodes.remove(curr_lbl)
-            current_nodes.insert(idx, a)
-            current_nodes.insert(idx + 1, b)
-            result_lbl.append(current_nodes.copy())
-            merge_dists.append(entry[2])
-            i += 1
-        except Exception as e:
-            print(e)
-            break
-
-    cols = np.zeros(shape=(0, 3), dtype=np.float32)
-    ns = np.zeros(shape=(0), dtype=np.uint16)
-    layers = np.zeros(shape=(0), dtype=np.uint16)
-
-    all_col = np.array(all_col, dtype=np.float32)
-    all_n = np.array(all_n, dtype=np.uint16)
-
-    i = 0
-    for r in result_lbl:
-        if i > 10 and i % n_merge_per_lvl != 0:
-            i += 1
-            continue
-        cols = np.concatenate((cols, all_col[r]))
-        ns = np.concatenate((ns, all_n[r]))
-        layers = np.concatenate((layers, np.array([i] * all_col[r].shape[0])))
-        i += 1
+def label_means(img, labels):
+    """
+    Computes the number of pixels and the mean color of each label in a single pass.
+
+    :param img: The image of shape (height, width, channels)
+    :param labels: An integer label image of shape (height, width)
+    :return: counts of shape (n_labels, ) and means of shape (n_labels, channels), indexed by label,
+    labels without pixels have a mean of zero.
+    """
+    flat = labels.ravel().astype(np.intp)
+    pixels = img.reshape(-1, img.shape[-1])
+    counts = np.bincount(flat)
+    sums = np.stack([np.bincount(flat, weights=pixels[:, c], minlength=counts.shape[0])
+                     for c in range(pixels.shape[1])], axis=1)
+    means = (sums / np.maximum(counts, 1)[:, None]).astype(img.dtype)
+    return counts, means
+
+
+def weighted_ward_linkage(points, weights):
+    """
+    Ward linkage of weighted points, equivalent to fastcluster.linkage(X, 'ward')
+    where X contains each point repeated by its weight, without materializing the repetitions.
+    The distance of two clusters a, b is sqrt(2 * n_a * n_b / (n_a + n_b)) * ||c_a - c_b||,
+    with n the summed weights and c the weighted centroids.
+
+    :param points: The points of shape (n, d)
+    :param weights: The positive weight of each point of shape (n, )
+    :return: A linkage matrix Z of shape (n - 1, 4) in scipy format, Z[:, 3] holds the summed weights
+    """
+    n = points.shape[0]
+    centroids = np.array(points, dtype=np.float64)
+    sizes = np.array(weights, dtype=np.float64)
+    active = np.ones(n, dtype=bool)
+
+    def distances(i):
+        d = np.sqrt(2 * sizes[i] * sizes / (sizes[i] + sizes)) * np.linalg.norm(centroids - centroids[i], axis=1)
+        d[~active] = np.inf
+        d[i] = np.inf
+        return d
+
+    # Nearest neighbor chain, merging reciprocal nearest neighbors
+    merges = []
+    chain = []
+    for _ in range(n - 1):
+        while True:
+            if len(chain) == 0:
+                chain.append(int(np.argmax(active)))
+            i = chain[-1]
+            d = distances(i)
+            j = int(np.argmin(d))
+            if len(chain) > 1 and d[chain[-2]] <= d[j]:
+                j = chain[-2]
+            if len(chain) > 1 and j == chain[-2]:
+                break
+            chain.append(j)
+        chain = chain[:-2]
+
+        merges.append((i, j, d[j]))
+        size = sizes[i] + sizes[j]
+        centroids[i] = (centroids[i] * sizes[i] + centroids[j] * sizes[j]) / size
+        sizes[i] = size
+        active[j] = False
+        sizes[j] = 0
+
+    # Sort by distance and relabel the clusters in the order they are created
+    Z = np.zeros(shape=(n - 1, 4), dtype=np.float64)
+    node = np.arange(n)
+    node_size = np.zeros(2 * n - 1, dtype=np.float64)
+    node_size[:n] = weights
+    parent = np.arange(n)
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for k, m in enumerate(sorted(merges, key=lambda x: x[2])):
+        a, b = find(m[0]), find(m[1])
+        na, nb = node[a], node[b]
+        Z[k] = [min(na, nb), max(na, nb), m[2], node_size[na] + node_size[nb]]
+        node_size[n + k] = Z[k, 3]
+        parent[b] = a
+        node[a] = n + k
+    return Z
+
+
+def _merge_nodes(Z, colors, counts):
+    """
+    Computes the color and number of pixels of all nodes in the linkage tree, leaves first.
+    Nodes are computed level by level, all nodes of which both children are known at once.
+    """
+    colors = np.asarray(colors)
+    n_leaves = colors.shape[0]
+    n_nodes = n_leaves + Z.shape[0]
+
+    all_col = np.zeros(shape=(n_nodes, ) + colors.shape[1:], dtype=colors.dtype)
+    all_col[:n_leaves] = colors
+    all_n = np.zeros(shape=n_nodes, dtype=np.int64)
+    all_n[:n_leaves] = counts
+
+    a = Z[:, 0].astype(np.intp)
+    b = Z[:, 1].astype(np.intp)
+    done = np.zeros(shape=n_nodes, dtype=bool)
+    done[:n_leaves] = True
+
+    pending = np.arange(Z.shape[0])
+    while pending.shape[0] > 0:
+        ready = done[a[pending]] & done[b[pending]]
+        if not np.any(ready):
+            raise ValueError("Invalid linkage matrix")
+        rows = pending[ready]
+        na, nb = all_n[a[rows]], all_n[b[rows]]
+        wa = na.astype(all_col.dtype)[:, None]
+        wb = nb.astype(all_col.dtype)[:, None]
+        all_col[n_leaves + rows] = np.divide((all_col[a[rows]] * wa) + (all_col[b[rows]] * wb),
+                                             (na + nb).astype(all_col.dtype)[:, None])
+        all_n[n_leaves + rows] = na + nb
+        done[n_leaves + rows] = True
+        pending = pending[~ready]
+    return all_col, all_n
+
+
+def to_cluster_tree(Z, labels:List, colors, n_merge_steps = 1000, n_merge_per_lvl = 10, counts = None):
+    """
+    Splits the linkage tree top down, merge by merge, and returns the clusters of each layer.
+    All layers up to 10 and every n_merge_per_lvl-th layer are returned.
+
+    :param Z: The linkage matrix
+    :param labels: The label of each leaf
+    :param colors: The LAB color of each leaf
+    :param n_merge_steps: The maximal number of clusters in the deepest layer
+    :param n_merge_per_lvl: The step between the returned layers
+    :param counts: The number of pixels of each leaf, by default 1
+    :return: [layers, cols, ns] and the merge distances
+    """
+    n_leaves = len(colors)
+    n_merges = Z.shape[0]
+    n_nodes = n_leaves + n_merges
+    if counts is None:
+        counts = [1] * n_leaves
+    all_col, all_n = _merge_nodes(Z, colors, counts)
+
+    # Layer k contains the nodes whose parent is one of the k last merges but which are not one of them,
+    # in the order of a depth first traversal.
+    n_splits = max(min(n_merge_steps, n_merges), 0)
+    first_split = n_nodes - n_splits
+    nodes, enter = [], []
+    stack = [(n_nodes - 1, 0)]
+    while len(stack) > 0:
+        node, layer = stack.pop()
+        nodes.append(node)
+        enter.append(layer)
+        if node >= first_split:
+            row = node - n_leaves
+            stack.append((int(Z[row][1]), n_nodes - node))
+            stack.append((int(Z[row][0]), n_nodes - node))
+    nodes = np.array(nodes, dtype=np.intp)
+    enter = np.array(enter)
+    leave = np.where(nodes >= first_split, n_nodes - nodes, n_splits + 1)
+
+    merge_dists = list(Z[n_merges - 1 - np.arange(n_splits), 2])
+    layer_nodes = []
+
+    # Once all merges are split, the remaining steps wrap around Z, this is kept for compatibility
+    if n_splits == n_merges:
+        current_nodes = nodes[leave > n_splits].tolist()
+        i = n_splits
+        while(len(current_nodes) <= n_merge_steps and i < n_nodes):
+            try:
+                curr_lbl = n_nodes - 1 - i
+                entry = Z[n_merges - 1 - i]
+                idx = current_nodes.index(curr_lbl)
+                current_nodes.remove(curr_lbl)
+                current_nodes.insert(idx, int(entry[0]))
+                current_nodes.insert(idx + 1, int(entry[1]))
+                layer_nodes.append(current_nodes.copy())
+                merge_dists.append(entry[2])
+                i += 1
+            except Exception as e:
+                print(e)
+                break
+
+    layer_idx = np.arange(n_splits + 1 + len(layer_nodes))
+    layer_idx = layer_idx[(layer_idx <= 10) | (layer_idx % n_merge_per_lvl == 0)]
+    regular = layer_idx[layer_idx <= n_splits]
+    member = (enter[None, :] <= regular[:, None]) & (regular[:, None] < leave[None, :])
+    li, ni = np.nonzero(member)
+    layers = [regular[li]]
+    result_nodes = [nodes[ni]]
+    for k in layer_idx[layer_idx > n_splits]:
+        r = layer_nodes[k - n_splits - 1]
+        layers.append(np.array([k] * len(r)))
+        result_nodes.append(np.array(r, dtype=np.intp))
+    layers = np.concatenate(layers).astype(np.int64)
+    result_nodes = np.concatenate(result_nodes)
+
+    cols = all_col.astype(np.float32)[result_nodes]
+    ns = all_n.astype(np.uint16)[result_nodes]
 
     cols = np.round(cv2.cvtColor(np.array([cols, cols], dtype=np.float32), cv2.COLOR_LAB2BGR)[0] * 255).astype(np.uint8)
     result = [layers, cols, ns]
     return result, merge_dists
 
 
-
 def color_palette(frame, mask = None, mask_index = None, n_merge_steps = 100, image_size = 400.0, seeds_model = None,
                   n_pixels = 200, out_path = "", n_merge_per_lvl = 10, plot = False, mask_inverse = False, normalization_lower_bound = 100.0,
                   seeds_input_width = 600):
@@ -168,7 +308,6 @@ def color_palette(frame, mask = None, mask_index = None, n_merge_steps = 100, im
     else:
         bins = np.unique(labels)
 
-    data = []
     # region SEEDS
     hist = np.histogram(labels, bins = bins)
 
@@ -176,29 +315,23 @@ def color_palette(frame, mask = None, mask_index = None, n_merge_steps = 100, im
     normalization_f = np.amin(hist[0])
     if normalization_f < normalization_lower_bound:
         normalization_f = normalization_lower_bound
-    labels_list = []
-    colors_list = []
 
-    all_cols = []
-    all_labels = []
-
-    # print("Normalization Factor: ", normalization_f)
-    for i, bin in enumerate(hist[0]):
-        if bin < normalization_f:
-            continue
-        lbl = hist[1][i]
-        avg_color = np.mean(frame_bgr[np.where(labels == lbl)], axis=0)
-        labels_list.append(lbl)
-        colors_list.append(avg_color)
-
-        data.extend([avg_color] * int(np.round(bin / normalization_f))*2)
-        all_cols.extend([avg_color] * int(np.round(bin / normalization_f)) * 2)
-        all_labels.extend([lbl] * int(np.round(bin / normalization_f)) * 2)
-
-    data = np.array(data)
-    Z = linkage(data, 'ward')
-
-    tree, merge_dists = to_cluster_tree(Z, all_labels, all_cols, n_merge_steps, n_merge_per_lvl)
+    keep = hist[0] >= normalization_f
+    labels_list = hist[1][:-1][keep]
+    colors_list = label_means(frame_bgr, labels)[1][labels_list.astype(np.intp)]
+    n_repeat = np.round(hist[0][keep] / normalization_f).astype(np.int64) * 2
+
+    if labels_list.shape[0] > n_merge_steps:
+        # The merges visited by to_cluster_tree are all between superpixels,
+        # hence each superpixel can be clustered as a single weighted point
+        Z = weighted_ward_linkage(colors_list, n_repeat)
+        tree, merge_dists = to_cluster_tree(Z, labels_list.tolist(), list(colors_list),
+                                            n_merge_steps, n_merge_per_lvl, counts=n_repeat.tolist())
+    else:
+        data = np.repeat(colors_list, n_repeat, axis=0)
+        Z = linkage(data, 'ward')
+        tree, merge_dists = to_cluster_tree(Z, np.repeat(labels_list, n_repeat).tolist(), list(data),
+                                            n_merge_steps, n_merge_per_lvl)
     return PaletteAsset(tree, merge_dists)
 
 
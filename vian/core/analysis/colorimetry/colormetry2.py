@@ -1,47 +1,147 @@
 from vian.core.container.project import VIANProject
 from vian.core.analysis.colorimetry.computation import calculate_histogram
 from vian.core.data.computation import frame2ms, ms_to_frames, lab_to_sat
-from vian.core.analysis.spacial_frequency import get_spacial_frequency_heatmap
+from vian.core.analysis.spacial_frequency import get_spacial_frequency_stats
 from vian.core.analysis.color.palette_extraction import *
 import cv2
 import numpy as np
 from collections import namedtuple
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from PyQt6.QtCore import pyqtSlot, QObject
 
-from vian.core.analysis.misc import preprocess_frame
+from vian.core.analysis.misc import preprocess_frame, FrameReader
 
 YieldedResult = namedtuple("YieldedResult", ["frame_pos", "time_ms", "hist", "avg_color", "palette"])
 
+COLORIMETRY_CHUNK_SIZE = 50
+COLORIMETRY_PALETTE_LENGTH = 1000
+PALETTE_INPUT_WIDTH = 300
+
+
+def colorimetry_chunks(done, chunk_size=COLORIMETRY_CHUNK_SIZE):
+    """
+    Splits the colorimetry entries which are not done yet into ranges of consecutive entries.
+
+    :param done: A boolean array, True for each entry which is already computed
+    :param chunk_size: The maximal number of entries of a chunk
+    :return: A list of (start, stop) tuples
+    """
+    pending = np.nonzero(np.logical_not(done))[0]
+    chunks = []
+    for run in np.split(pending, np.nonzero(np.diff(pending) != 1)[0] + 1):
+        for i in range(0, run.shape[0], chunk_size):
+            part = run[i:i + chunk_size]
+            chunks.append((int(part[0]), int(part[-1]) + 1))
+    return chunks
+
+
+def process_colorimetry_chunk(movie_path, margins, max_width, resolution, fps, start, stop, is_aborted=None):
+    """
+    Computes the colorimetry entries [start, stop), entry i corresponds to frame i * resolution.
+    Reading stops at the first frame that can not be read.
+
+    :return: A dict with the index of the first entry as idx and an array for each colorimetry dataset
+    """
+    reader = FrameReader(movie_path, margins=margins, max_width=max_width)
+
+    width = int(reader.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(reader.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    model = None
+    entries = []
+    for frame_pos, frame in reader.frames(start * resolution, stop * resolution, resolution):
+        if is_aborted is not None and is_aborted():
+            break
+
+        # Colorspace Conversion
+        frame_lab = cv2.cvtColor(frame.astype(np.uint8), cv2.COLOR_BGR2Lab)
+        if model is None:
+            if PALETTE_INPUT_WIDTH < frame.shape[0]:
+                rx = PALETTE_INPUT_WIDTH / frame.shape[0]
+                frame_lab_input = cv2.resize(frame_lab, None, None, rx, rx, cv2.INTER_CUBIC)
+            else:
+                frame_lab_input = frame
+            model = PaletteExtractorModel(frame_lab_input, n_pixels=400, num_levels=8)
+
+        # Histogram
+        hist = np.divide(calculate_histogram(frame_lab, 16), (width * height))
+        palette = color_palette(frame_lab, n_merge_steps=200, n_merge_per_lvl=20, image_size=150.0, n_pixels=400,
+                                seeds_input_width=PALETTE_INPUT_WIDTH, seeds_model=model)
+
+        # Color Features
+        frame_lab = cv2.cvtColor(frame.astype(np.float32) / 255, cv2.COLOR_BGR2Lab)
+        color_bgr = np.mean(frame, axis = (0, 1))
+        color_lab = np.mean(frame_lab, axis = (0, 1))
+
+        feature_mat = np.zeros(shape=8)
+        feature_mat[0:3] = color_lab
+        feature_mat[3:6] = color_bgr
+        feature_mat[6] = lab_to_sat(lab=color_lab, implementation="luebbe")[0]
+        feature_mat[7] = lab_to_sat(lab=color_lab, implementation="pythagoras")[0]
+
+        # Spatial
+        rx = 250 / frame.shape[0]
+        frame = cv2.resize(frame, None, None, rx, rx, cv2.INTER_CUBIC)
+        spatial = get_spacial_frequency_stats(frame)
+
+        palette_mat = np.zeros(shape=(COLORIMETRY_PALETTE_LENGTH, 6))
+        count = COLORIMETRY_PALETTE_LENGTH
+        if len(palette.tree[0]) < COLORIMETRY_PALETTE_LENGTH:
+            count = len(palette.tree[0])
+        palette_mat[:len(palette.merge_dists), 0] = palette.merge_dists
+        palette_mat[:count, 1] = palette.tree[0][:count]
+        palette_mat[:count, 2:5] = palette.tree[1][:count]
+        palette_mat[:count, 5] = palette.tree[2][:count]
+
+        entries.append(dict(frame_pos=frame_pos,
+                            time_ms=frame2ms(frame_pos, fps),
+                            hist=hist,
+                            palette=palette_mat,
+                            features=feature_mat,
+                            spatial_edge = spatial["edge-mean"],
+                            spatial_color=spatial["color-var"],
+                            spatial_hue = spatial["hue-var"],
+                            spatial_luminance = spatial["luminance-var"]))
+    reader.release()
+
+    block = dict(idx=start)
+    for k in ["frame_pos", "time_ms", "hist", "palette", "features",
+              "spatial_edge", "spatial_color", "spatial_hue", "spatial_luminance"]:
+        block[k] = np.array([e[k] for e in entries])
+    return block
+
+
 class ColormetryJob2(QObject):
-    def __init__(self, resolution, main_window, max_width=1920):
+    def __init__(self, resolution, main_window, max_width=1920, n_workers=1):
         super(ColormetryJob2, self).__init__()
         self.resolution = resolution
         self.colormetry_analysis = None
         self.main_window = main_window
         self.duration =  None
-        self.profile = False
         self.aborted = False
         self.max_width = max_width
+        self.n_workers = n_workers
 
     def prepare(self, project:VIANProject):
         if project.colormetry_analysis is None:
             self.colormetry_analysis = project.create_colormetry(resolution=self.resolution)
             self.colormetry_analysis.clear()
-            start = 0
         else:
             self.colormetry_analysis = project.colormetry_analysis
             self.resolution = self.colormetry_analysis.resolution
-            start = self.colormetry_analysis.current_idx
-            if start == 0:
+            if self.colormetry_analysis.current_idx == 0:
                 self.colormetry_analysis = project.create_colormetry(resolution=self.resolution)
                 self.colormetry_analysis.clear()
 
         self.duration = project.movie_descriptor.duration
-        frame_duration = ms_to_frames(self.duration, project.movie_descriptor.fps)
+
+        # Only the entries which have not been computed yet are processed
+        done = project.hdf5_manager.get_colorimetry_done(self.colormetry_analysis.end_idx)
         return [
             project.movie_descriptor.get_movie_path(),
-            start,
-            frame_duration,
+            colorimetry_chunks(done),
+            done.shape[0],
             self.resolution,
             project.movie_descriptor.fps,
             project.movie_descriptor.get_letterbox_rect(as_coords=True)
@@ -49,127 +149,45 @@ class ColormetryJob2(QObject):
 
     def run_concurrent(self, args, callback):
         movie_path = args[0]
-        start = args[1]
-        end = args[2]
+        chunks = args[1]
+        n_entries = args[2]
         resolution = args[3]
         fps = args[4]
         margins = args[5]
 
-        start *= resolution
-        length = np.clip(int(end - start), 1, None)
-
-        video_capture = cv2.VideoCapture(movie_path)
-        video_capture.set(cv2.CAP_PROP_POS_FRAMES, start)
-
-        width = int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-        progress_counter = 0
-        hist_counter = 0
-        model = None
-
-        for i in range(length):
-            if i % resolution == 0:
-                video_capture.set(cv2.CAP_PROP_POS_FRAMES, i + start)
-                ret, frame = video_capture.read()
-            else:
-                continue
-
-            if frame is None:
-                break
-
-            # Get sub frame if there are any margins
-            if margins is not None:
-                frame = frame[margins[1]:margins[3], margins[0]:margins[2]]
-                # cv2.imshow("", frame)
-                # cv2.waitKey(5)
-
-            frame = preprocess_frame(frame, self.max_width)
-
-            t = time.time()
-            t_total = time.time()
-
-            # Colorspace Conversion
-            frame_lab = cv2.cvtColor(frame.astype(np.uint8), cv2.COLOR_BGR2Lab)
-            palette_input_width = 300
-            if model is None:
-                if palette_input_width < frame.shape[0]:
-                    rx = palette_input_width / frame.shape[0]
-                    frame_lab_input = cv2.resize(frame_lab, None, None, rx, rx, cv2.INTER_CUBIC)
-                else:
-                    frame_lab_input = frame
-                model = PaletteExtractorModel(frame_lab_input, n_pixels=400, num_levels=8)
-            t_read = time.time() - t
-            t = time.time()
-            # Histogram
-            hist = np.divide(calculate_histogram(frame_lab, 16), (width * height))
-            t_hist = time.time() - t
-            t = time.time()
-            # hist = None
-            palette = color_palette(frame_lab, n_merge_steps=200, n_merge_per_lvl=20, image_size=150.0, n_pixels=400,
-                                    seeds_input_width=palette_input_width, seeds_model=model)
-            t_palette = time.time() - t
-            t = time.time()
-            # palette = None
-
-            # Color Features
-            frame_lab = cv2.cvtColor(frame.astype(np.float32) / 255, cv2.COLOR_BGR2Lab)
-            color_bgr = np.mean(frame, axis = (0, 1))
-            color_lab = np.mean(frame_lab, axis = (0, 1))
-
-            feature_mat = np.zeros(shape=8)
-            feature_mat[0:3] = color_lab
-            feature_mat[3:6] = color_bgr
-            feature_mat[6] = lab_to_sat(lab=color_lab, implementation="luebbe")
-            feature_mat[7] = lab_to_sat(lab=color_lab, implementation="pythagoras")
-
-            t_features = time.time() - t
-            t = time.time()
-            # Spatial
-            rx = 250 / frame.shape[0]
-            frame = cv2.resize(frame, None, None, rx, rx, cv2.INTER_CUBIC)
-            eout, enorm, edenorm = get_spacial_frequency_heatmap(frame, method="edge-mean", normalize=False)
-            cout, cnorm, cdenorm = get_spacial_frequency_heatmap(frame, method="color-var", normalize=False)
-            hout, hnorm, hdenorm = get_spacial_frequency_heatmap(frame, method="hue-var", normalize=False)
-            lout, lnorm, ldenorm = get_spacial_frequency_heatmap(frame, method="luminance-var", normalize=False)
-
-            t_spatial = time.time() - t
-            t = time.time()
+        params = (movie_path, margins, self.max_width, resolution, fps)
+        for (start, stop), block in zip(chunks, self._process_chunks(params, chunks)):
             if self.aborted:
                 return
+            n = len(block['time_ms'])
+            callback.emit([block, (start + n) / n_entries])
+
+            # The movie could not be read any further
+            if n < stop - start:
+                return
 
-            max_p_length = 1000
-            palette_mat = np.zeros(shape=(max_p_length, 6))
-            count = max_p_length
-            if len(palette.tree[0]) < max_p_length:
-                count = len(palette.tree[0])
-            palette_mat[:len(palette.merge_dists), 0] = palette.merge_dists
-            palette_mat[:count, 1] = palette.tree[0][:count]
-            palette_mat[:count, 2:5] = palette.tree[1][:count]
-            palette_mat[:count, 5] = palette.tree[2][:count]
-
-            yielded_result = dict(frame_pos=i + start,
-                                  time_ms=frame2ms(i + start, fps),
-                                  hist=hist,
-                                  palette=palette_mat,
-                                  features=feature_mat,
-                                  spatial_edge = np.array([np.amax(edenorm), np.mean(edenorm)],dtype=np.float32),
-                                  spatial_color=np.array([np.amax(cdenorm), np.mean(cdenorm)], dtype=np.float32),
-                                  spatial_hue = np.array([np.amax(hdenorm), np.mean(hdenorm)], dtype=np.float32),
-                                  spatial_luminance = np.array([np.amax(ldenorm), np.mean(ldenorm)], dtype=np.float32))
-            callback.emit([yielded_result, (i + start) / end])
-
-            t_store = time.time() -t
-            if self.profile:
-                print("Total", round(time.time() - t_total, 4),
-                      "Read", round(t_read, 4),
-                      "Features", round(t_features, 4),
-                      "Histogram:", round(t_hist, 4),
-                      "Palette" ,round(t_palette, 4),
-                      "Spatial", round(t_spatial, 4),
-                      "Store", round(t_store, 4))
-            hist_counter += 1
-            progress_counter += 1
+    def _process_chunks(self, params, chunks):
+        """
+        Yields the colorimetry blocks of the given chunks in order,
+        with more than one worker, the chunks are processed on a process pool.
+        """
+        if self.n_workers <= 1:
+            for start, stop in chunks:
+                yield process_colorimetry_chunk(*params, start, stop, is_aborted=lambda: self.aborted)
+            return
+
+        # Forking a process with running Qt and HDF5 threads is not safe, hence the workers are spawned
+        executor = ProcessPoolExecutor(max_workers=self.n_workers, mp_context=multiprocessing.get_context("spawn"))
+        futures = [executor.submit(process_colorimetry_chunk, *params, start, stop) for start, stop in chunks]
+        try:
+            for f in futures:
+                if self.aborted:
+                    return
+                yield f.result()
+        finally:
+            for f in futures:
+                f.cancel()
+            executor.shutdown(wait=True)
 
     @pyqtSlot(object)
     def colormetry_callback(self, yielded_result):
@@ -16,10 +16,65 @@ from vian.core.visualization.palette_plot import *
 
 import pandas as pd
 from matplotlib import cm
+from vian.core.analysis.eyetracking.parser import parse_fixations, expand_fixations
 
 colormap = cm.get_cmap("viridis")
 
 
+class FixationStore:
+    """
+    The sampled fixations as columns sorted by frame position, such that the fixations
+    within a time window are found by binary search.
+
+    :var frame_pos: The sorted frame positions
+    :var points: The fixation (x, y) of each frame position
+    """
+    def __init__(self, frame_pos, points):
+        order = np.argsort(frame_pos, kind="stable")
+        self.frame_pos = np.asarray(frame_pos, dtype=np.float64)[order]
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)[order]
+
+    @staticmethod
+    def from_dataframe(df):
+        if len(df.index) == 0:
+            return FixationStore(np.zeros(0), np.zeros((0, 2)))
+        return FixationStore(df['FramePos'].to_numpy(),
+                             np.stack([df['FixationX'].to_numpy(), df['FixationY'].to_numpy()], axis=1))
+
+    def _window_bounds(self, pos, half_width):
+        # The window is open on both sides
+        return (np.searchsorted(self.frame_pos, pos - half_width, side="right"),
+                np.searchsorted(self.frame_pos, pos + half_width, side="left"))
+
+    def window(self, pos, half_width):
+        """
+        Returns the fixations with pos - half_width < frame_pos < pos + half_width.
+        """
+        start, stop = self._window_bounds(pos, half_width)
+        return self.points[start:stop]
+
+    def window_variance(self, positions, half_width):
+        """
+        Returns the variance of the fixation magnitudes (the distance from the screen origin)
+        within the window around each of the positions, 0 for empty windows.
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        start, stop = self._window_bounds(positions, half_width)
+
+        # The variance is shift invariant, centering the magnitudes keeps the prefix sums small
+        mag = np.linalg.norm(self.points, axis=1)
+        if mag.shape[0] > 0:
+            mag -= mag.mean()
+        s1 = np.concatenate([[0.0], np.cumsum(mag)])
+        s2 = np.concatenate([[0.0], np.cumsum(mag ** 2)])
+
+        n = stop - start
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (s1[stop] - s1[start]) / n
+            var = (s2[stop] - s2[start]) / n - mean ** 2
+        return np.where(n > 0, np.maximum(var, 0.0), 0.0)
+
+
 @vian_analysis
 class EyetrackingAnalysis(IAnalysisJob):
     def __init__(self, resolution=30):
@@ -56,42 +111,26 @@ class EyetrackingAnalysis(IAnalysisJob):
         file_path = argst['file_path']
         fps = argst['fps']
         stimulus_to_import = argst['stimulus']
-        fixations = pd.read_csv(file_path,  delimiter="\t")
-
-        q = []
-        for index, r in fixations.iterrows():
-            try:
-                stimulus = os.path.splitext(r['Stimulus'])[0].replace("bw_", "")
-                if stimulus != stimulus_to_import:
-                    continue
-
-                x = int(round(float(r['Fixation Position X [px]'])))
-                y = int(round(float(r['Fixation Position Y [px]'])))
-                t0 = int(round(float(r['Event Start Trial Time [ms]'])))
-                t1 = int(round(float(r['Event End Trial Time [ms]'])))
-            except Exception as e:
-                print (e)
-                continue
-
-            n = ms_to_frames(t1 - t0, fps)
-            if fps != 0:
-                n = int(np.floor(n / fps))
-                f_step = fps
-            else:
-                f_step = 1
-
-            f0 = ms_to_frames(t0, fps)
-            # print(n)
+        fixations = parse_fixations(pd.read_csv(file_path,  delimiter="\t"))
+        fixations = fixations[fixations['Stimulus'] == stimulus_to_import]
+
+        t0 = fixations['T0'].to_numpy()
+        n = np.round((fixations['T1'].to_numpy() - t0) / 1000 * fps).astype(np.int64)
+        if fps != 0:
+            n = np.floor(n / fps).astype(np.int64)
+            f_step = fps
+        else:
+            f_step = 1
 
-            for i in range(n):
-                q.append(dict(
-                    Stimulus = stimulus,
-                    FixationX = x,
-                    FixationY = y,
-                    FramePos = f0 + (i * f_step)
-                ))
+        f0 = np.round(t0 / 1000 * fps).astype(np.int64)
+        rows, frame_pos = expand_fixations(f0, n, np.full(n.shape, f_step))
 
-        fixations_sampled = pd.DataFrame(q)
+        fixations_sampled = pd.DataFrame(dict(
+            Stimulus=stimulus_to_import,
+            FixationX=fixations['X'].to_numpy()[rows],
+            FixationY=fixations['Y'].to_numpy()[rows],
+            FramePos=frame_pos
+        ))
 
         return FileAnalysis(
             name="Eyetracking Dataset",
@@ -123,31 +162,12 @@ class EyetrackingAnalysis(IAnalysisJob):
         fps = project.movie_descriptor.fps
         ms_to_idx = 1000 / (fps / self.resolution)
 
-        time_np = np.zeros(len(df.index))
-        fixations_np = np.zeros((len(df.index), 2))
-
-        for i, row in df.iterrows():
-            fixations_np[i] = [row.FixationX, row.FixationY]
-            time_np[i] = row.FramePos
-
-        time_np = np.array(time_np)
-        fixations_np = np.array(fixations_np)
-
-        result = []
-        for pos in range(int(np.floor(ms_to_frames(project.movie_descriptor.duration, fps) / self.resolution))):
-            pos = pos * self.resolution
+        store = FixationStore.from_dataframe(df)
+        n = int(np.floor(ms_to_frames(project.movie_descriptor.duration, fps) / self.resolution))
+        result = store.window_variance(np.arange(n) * self.resolution, fps / 2)
 
-            # Get all values which are within the time window
-            indices = np.where(np.logical_and(pos - (fps / 2) < time_np, time_np < pos + (fps / 2)))
-            points = fixations_np[indices]
-
-            # Compute the vector magnitude (from the screen root)
-            mag = np.linalg.norm(points, axis = 1)
-            # Compute the variance in vector magnitude
-            result.append(float(np.var(mag)))
-
-        result = np.array(result)
-        result -= np.amin(result)
+        if result.shape[0] > 0:
+            result -= np.amin(result)
 
         return [
             TimelineDataset("Eyetracking Variance",
@@ -186,17 +206,8 @@ class RawPointsSpatialDataset(SpatialOverlayDataset):
                                                       analysis,
                                                       vis_type=SpatialOverlayDataset.VIS_TYPE_HEATMAP)
         self.fixations_sampled = fixations_sampled
-        self.time_np = np.zeros(len(self.fixations_sampled.index))
-        self.fixations_np = np.zeros((len(self.fixations_sampled.index), 2))
-
-        for i, row in self.fixations_sampled.iterrows():
-            self.fixations_np[i] = [row.FixationX, row.FixationY]
-            self.time_np[i] = row.FramePos
+        self.store = FixationStore.from_dataframe(self.fixations_sampled)
 
-        self.time_np = np.array(self.time_np)
-        self.fixations_np = np.array(self.fixations_np)
-
-        print(self.fixations_np.shape, (self.time_np.nbytes + self.fixations_np.nbytes) / 1000000, "Megabytes")
         self.fps = fps
         cap = cv2.VideoCapture(self.project.movie_descriptor.movie_path)
         self.width =  cap.get(cv2.CAP_PROP_FRAME_WIDTH)
@@ -208,10 +219,7 @@ class RawPointsSpatialDataset(SpatialOverlayDataset):
         else:
             pos = frame
         if self.fixations_sampled is not None:
-            indices = np.where(np.logical_and(pos - (self.fps / 2) < self.time_np, self.time_np <  pos + (self.fps/2)))
-            points = self.fixations_np[indices]
-
-            return np.unique(points, axis=0)
+            return np.unique(self.store.window(pos, self.fps / 2), axis=0)
         else:
             return None
 
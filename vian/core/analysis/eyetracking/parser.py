@@ -8,6 +8,61 @@ import cv2
 from vian.core.data.computation import ms_to_frames
 
 
+def parse_fixations(fixations):
+    """
+    Parses the columns of a fixation export into numeric arrays, rows which can not be parsed are dropped.
+
+    :param fixations: The DataFrame as read from the export
+    :return: A DataFrame with the columns Stimulus (without extension and "bw_" prefix), Variant (True for "bw_"), X, Y, T0, T1
+    """
+    def stimulus_name(s):
+        try:
+            return os.path.splitext(s)[0].replace("bw_", "")
+        except Exception:
+            return None
+
+    def is_bw(s):
+        try:
+            return "bw_" in s
+        except Exception:
+            return None
+
+    # Stimulus names repeat for all fixations, hence they are only parsed once per unique name
+    raw = fixations['Stimulus']
+    uniques = pd.unique(raw)
+    names = dict(zip(uniques, [stimulus_name(s) for s in uniques]))
+    variants = dict(zip(uniques, [is_bw(s) for s in uniques]))
+
+    parsed = pd.DataFrame(dict(
+        Stimulus=raw.map(names),
+        Variant=raw.map(variants),
+        X=pd.to_numeric(fixations['Fixation Position X [px]'], errors="coerce"),
+        Y=pd.to_numeric(fixations['Fixation Position Y [px]'], errors="coerce"),
+        T0=pd.to_numeric(fixations['Event Start Trial Time [ms]'], errors="coerce"),
+        T1=pd.to_numeric(fixations['Event End Trial Time [ms]'], errors="coerce"),
+    ))
+    n = len(parsed.index)
+    parsed = parsed.dropna()
+    if len(parsed.index) < n:
+        print("Skipped {n} fixations which could not be parsed.".format(n=n - len(parsed.index)))
+
+    for c in ["X", "Y", "T0", "T1"]:
+        parsed[c] = np.round(parsed[c].to_numpy(dtype=np.float64)).astype(np.int64)
+    return parsed
+
+
+def expand_fixations(f0, n, f_step):
+    """
+    Expands each fixation i to the frames f0[i] + k * f_step[i] for k in range(n[i]).
+
+    :return: The index of the fixation for each frame and the frame positions
+    """
+    n = np.maximum(n, 0)
+    rows = np.repeat(np.arange(n.shape[0]), n)
+    k = np.arange(rows.shape[0]) - np.repeat(np.cumsum(n) - n, n)
+    return rows, f0[rows] + k * f_step[rows]
+
+
 class XEyeTrackingHandler():
     def __init__(self, reference_frame = (1680, 1050), **kwargs):
         super(XEyeTrackingHandler, self).__init__()
@@ -67,54 +122,42 @@ Exception   Q        :param sample_fps: the sampling frequency, if higher than t
 
         result = dict()
 
-        for index, r in self.fixations.iterrows():
-            try:
-                is_bw = "bw_" in r.Stimulus
-                stimulus = os.path.splitext(r['Stimulus'])[0].replace("bw_", "")
-                x = int(round(float(r['Fixation Position X [px]'])))
-                y = int(round(float(r['Fixation Position Y [px]'])))
-                t0 = int(round(float(r['Event Start Trial Time [ms]'])))
-                t1 = int(round(float(r['Event End Trial Time [ms]'])))
-            except Exception as e:
-                print (e)
-                continue
-
+        parsed = parse_fixations(self.fixations)
+        for stimulus, grp in parsed.groupby("Stimulus", sort=False):
             if stimulus not in self.movie_meta:
                 print("Stimulus {f} not in passed movie files.".format(f=stimulus))
                 continue
 
             width = self.movie_meta[stimulus]['width']
             height = self.movie_meta[stimulus]['height']
+            fps = self.movie_meta[stimulus]['fps']
 
             fw = width / self.reference_frame[0]
             fh = height / self.reference_frame[1]
 
-            if stimulus not in result:
-                result[stimulus] = []
-
-            n = ms_to_frames(t1 - t0, self.movie_meta[stimulus]['fps'])
+            t0 = grp['T0'].to_numpy()
+            n = np.round((grp['T1'].to_numpy() - t0) / 1000 * fps).astype(np.int64)
             if sample_fps != 0:
-                n = int(np.floor(n / sample_fps))
+                n = np.floor(n / sample_fps).astype(np.int64)
                 f_step = sample_fps
             else:
                 f_step = 1
 
-            f0 = ms_to_frames(t0, self.movie_meta[stimulus]['fps'])
-            # print(n)
+            f0 = np.round(t0 / 1000 * fps).astype(np.int64)
+            rows, frame_pos = expand_fixations(f0, n, np.full(n.shape, f_step))
 
-            for i in range(n):
-                result[stimulus].append(dict(
-                    Stimulus = stimulus,
-                    Variant = is_bw,
-                    FixationX=int(x * fw),
-                    FixationY=int(y * fh),
-                    FramePos = f0 + (i * f_step)
-                ))
+            result[stimulus] = pd.DataFrame(dict(
+                Stimulus=stimulus,
+                Variant=grp['Variant'].to_numpy()[rows],
+                FixationX=np.trunc(grp['X'].to_numpy() * fw).astype(np.int64)[rows],
+                FixationY=np.trunc(grp['Y'].to_numpy() * fh).astype(np.int64)[rows],
+                FramePos=frame_pos
+            ))
 
         final = dict()
         for k, v in result.items():
             final[k] = dict(
-                df = pd.DataFrame(v),
+                df = v,
                 stimulus = self.movie_meta[k]
             )
         return final
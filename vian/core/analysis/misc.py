@@ -3,9 +3,223 @@ import os
 import numpy as np
 
 from vian.core.data.computation import resize_with_aspect
+from vian.core.data.log import log_error
 
 
 def preprocess_frame(frame, max_width=1920, mode=cv2.INTER_CUBIC):
     if frame.shape[1] > max_width:
         frame = resize_with_aspect(frame, width=max_width, mode=mode)
     return frame
+
+
+MAX_GRAB_DISTANCE = 250
+
+
+class FrameReader:
+    """
+    Reads sampled frames from a movie file while avoiding a seek for each of them.
+
+    Setting CAP_PROP_POS_FRAMES makes OpenCV decode from the previous keyframe, which is
+    considerably more expensive than grabbing the few frames in between for the usual
+    sampling strides. The reader keeps track of the current position of the capture and
+    only seeks if the requested frame is behind it or more than max_grab frames ahead.
+
+    Letterbox margins are cropped and the frame is downscaled to max_width before it is returned.
+
+    *Example*:
+
+        reader = FrameReader(movie_path, margins=margins, max_width=self.max_width)
+        for frame_pos, frame in reader.frames(start, stop + 1, self.resolution):
+            ...
+        reader.release()
+
+    :param movie_path: The path to the movie file
+    :param margins: The letterbox rect as returned by MovieDescriptor.get_letterbox_rect(as_coords=True) or None
+    :param max_width: The maximal width of a returned frame, None to keep the source resolution
+    :param mode: The interpolation used for downscaling
+    :param max_grab: The maximal number of frames to grab forward before seeking instead
+    """
+    def __init__(self, movie_path, margins=None, max_width=1920, mode=cv2.INTER_CUBIC, max_grab=MAX_GRAB_DISTANCE):
+        self.movie_path = movie_path
+        self.margins = margins
+        self.max_width = max_width
+        self.mode = mode
+        self.max_grab = max_grab
+
+        self.cap = cv2.VideoCapture(movie_path)
+
+        # The index of the frame the next cap.read() returns, None if unknown
+        self.position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def _move_to(self, frame_pos):
+        if self.position is None \
+                or frame_pos < self.position \
+                or frame_pos - self.position > self.max_grab:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_pos)
+            self.position = frame_pos
+            return True
+
+        while self.position < frame_pos:
+            if not self.cap.grab():
+                self.position = None
+                return False
+            self.position += 1
+        return True
+
+    def read_raw(self, frame_pos):
+        """
+        Returns the unprocessed frame at frame_pos or None if it could not be read.
+        """
+        if not self._move_to(frame_pos):
+            return None
+
+        ret, frame = self.cap.read()
+        if not ret or frame is None:
+            self.position = None
+            return None
+        self.position += 1
+        return frame
+
+    def preprocess(self, frame):
+        """
+        Crops the letterbox margins and downscales the frame to max_width.
+        """
+        if self.margins is not None:
+            frame = frame[self.margins[1]:self.margins[3], self.margins[0]:self.margins[2]]
+        if self.max_width is not None:
+            frame = preprocess_frame(frame, self.max_width, mode=self.mode)
+        return frame
+
+    def read(self, frame_pos):
+        """
+        Returns the preprocessed frame at frame_pos or None if it could not be read.
+        """
+        frame = self.read_raw(frame_pos)
+        if frame is None:
+            return None
+        return self.preprocess(frame)
+
+    def frames(self, start, stop, resolution=1):
+        """
+        Yields (frame_pos, frame) for every frame in range(start, stop, resolution).
+        The iteration ends at the first frame which can not be read.
+        """
+        for frame_pos in range(int(start), int(stop), max(int(resolution), 1)):
+            frame = self.read(frame_pos)
+            if frame is None:
+                break
+            yield frame_pos, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class FramePipeline:
+    """
+    Runs several IAnalysisJobs which support the per-frame hook on a single pass through the movie.
+
+    Every frame requested by any of the tasks is decoded once and handed to all tasks requesting it,
+    which is considerably cheaper than running each analysis on its own, since decoding is the
+    dominant cost of most analyses.
+
+    *Example*:
+
+        pipeline = FramePipeline()
+        pipeline.add(ColorPaletteAnalysis(), palette_args)
+        pipeline.add(ColorHistogramAnalysis(), histogram_args)
+        palette_result, histogram_result = pipeline.run(sign_progress)
+    """
+    def __init__(self, tasks=None):
+        self.tasks = []
+        self.aborted = False
+        if tasks is not None:
+            for analysis, args in tasks:
+                self.add(analysis, args)
+
+    def add(self, analysis, args):
+        """
+        Adds a task to the pipeline.
+
+        :param analysis: An IAnalysisJob for which supports_frame_hook() is True
+        :param args: The arguments as they would be handed to analysis.process()
+        """
+        self.tasks.append((analysis, args))
+
+    def abort(self):
+        self.aborted = True
+
+    def run(self, sign_progress=None):
+        """
+        Processes all tasks.
+
+        :param sign_progress: a function to signal the current Progress. usage: sign_progress(float E[0.0,..1.0])
+        :return: A list with the result of each task, in the order the tasks have been added.
+        A task which failed or has been aborted yields None.
+        """
+        results = [None] * len(self.tasks)
+        requests = [None] * len(self.tasks)
+        for i, (analysis, args) in enumerate(self.tasks):
+            try:
+                requests[i] = analysis.begin_frames(args)
+            except Exception as e:
+                log_error("FramePipeline: begin_frames failed for", analysis.__class__.__name__, e)
+
+        # Tasks on the same movie with the same margins share their frames
+        groups = dict()
+        for i, r in enumerate(requests):
+            if r is None:
+                continue
+            margins = None if r.margins is None else tuple(r.margins)
+            key = (r.movie_path, margins)
+            if key not in groups:
+                groups[key] = dict()
+            for frame_pos in r.frame_positions:
+                frame_pos = int(frame_pos)
+                if frame_pos not in groups[key]:
+                    groups[key][frame_pos] = []
+                groups[key][frame_pos].append(i)
+
+        n, n_total = 0, max(sum([len(g) for g in groups.values()]), 1)
+        for (movie_path, margins), wanted in groups.items():
+            if len(wanted) == 0:
+                continue
+            reader = FrameReader(movie_path, margins=margins, max_width=None)
+            for frame_pos in sorted(wanted.keys()):
+                if self.aborted:
+                    break
+                frame = reader.read(frame_pos)
+                if frame is None:
+                    break
+                for i in wanted[frame_pos]:
+                    if requests[i] is None:
+                        continue
+                    try:
+                        self.tasks[i][0].process_frame(requests[i].state, frame_pos, frame)
+                    except Exception as e:
+                        log_error("FramePipeline: process_frame failed for", self.tasks[i][0].__class__.__name__, e)
+                        requests[i] = None
+                n += 1
+                if sign_progress is not None:
+                    sign_progress(n / n_total)
+            reader.release()
+
+        if self.aborted:
+            return results
+
+        for i, (analysis, args) in enumerate(self.tasks):
+            if requests[i] is None:
+                continue
+            try:
+                results[i] = analysis.end_frames(requests[i].state)
+            except Exception as e:
+                log_error("FramePipeline: end_frames failed for", analysis.__class__.__name__, e)
+        return results
@@ -5,9 +5,12 @@ University of Zurich
 June 2018
 
 """
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 
-from vian.core.data.interfaces import IAnalysisJob, VisualizationTab, ParameterWidget, DataSerialization, TimelineDataset
+from vian.core.data.interfaces import IAnalysisJob, VisualizationTab, ParameterWidget, DataSerialization, TimelineDataset, FrameRequest
 from vian.core.container.project import MOVIE_DESCRIPTOR, BaseProjectEntity, VIANProject, SEGMENT
 from vian.core.container.analysis import IAnalysisJobAnalysis
 
@@ -15,8 +18,7 @@ from vian.core.analysis.color.palette_extraction import *
 from vian.core.container.hdf5_manager import vian_analysis
 from vian.core.visualization.palette_plot import *
 
-import librosa
-from vian.core.analysis.misc import preprocess_frame
+from vian.core.analysis.misc import FramePipeline, FrameReader
 
 """
 array Structure: 
@@ -25,10 +27,86 @@ array Structure:
 
 """
 
+FLOW_DENSE = "dense"
+FLOW_SPARSE = "sparse"
+
+# The width of the grayscale frames the flow is computed on
+FLOW_WIDTH = 320
+
+# The number of pyramid levels of the flow computation
+FLOW_LEVELS = 3
+
+# The distance in pixels of the points tracked by the sparse flow
+FLOW_GRID_STEP = 8
+
+# The standard deviation of the blur applied to the gradient energy the dense flow is weighted by
+FLOW_TEXTURE_SIGMA = 3
+
+
+def flow_frame(frame, width=FLOW_WIDTH):
+    """
+    Converts a BGR frame to the downscaled grayscale frame the flow is computed on.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if gray.shape[1] > width:
+        gray = cv2.resize(gray, (width, max(1, int(round(gray.shape[0] * width / gray.shape[1])))),
+                          interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def flow_magnitude(prvs, frame, mode=FLOW_DENSE, levels=FLOW_LEVELS, grid_step=FLOW_GRID_STEP):
+    """
+    Returns the mean flow magnitude between two grayscale frames in pixels of the frames.
+    The dense flow is averaged weighted by the texture of the frame, where it can be measured.
+
+    :param mode: FLOW_DENSE for Farneback flow of all pixels, FLOW_SPARSE for Lucas-Kanade flow of a grid of points
+    """
+    if mode == FLOW_SPARSE:
+        ys, xs = np.mgrid[grid_step // 2:prvs.shape[0]:grid_step, grid_step // 2:prvs.shape[1]:grid_step]
+        points = np.stack([xs.ravel(), ys.ravel()], axis=1).astype(np.float32).reshape(-1, 1, 2)
+        if points.shape[0] == 0:
+            return 0.0
+        tracked, status, err = cv2.calcOpticalFlowPyrLK(prvs, frame, points, None, winSize=(15, 15), maxLevel=levels)
+        found = status.ravel() == 1
+        if not np.any(found):
+            return 0.0
+        return float(np.mean(np.linalg.norm((tracked - points).reshape(-1, 2)[found], axis=1)))
+
+    flow = cv2.calcOpticalFlowFarneback(prvs, frame, None, 0.5, levels, 15, 3, 5, 1.2, 0)
+    mag, ang = cv2.cartToPolar(flow[..., 0], flow[..., 1])
+
+    # The flow of untextured regions (e.g. the sky) is close to zero whatever the motion is,
+    # hence the magnitudes are weighted by the local gradient energy of the previous frame
+    gx = cv2.Sobel(prvs, cv2.CV_32F, 1, 0)
+    gy = cv2.Sobel(prvs, cv2.CV_32F, 0, 1)
+    texture = cv2.GaussianBlur(gx * gx + gy * gy, (0, 0), FLOW_TEXTURE_SIGMA)
+    total = float(np.sum(texture))
+    if total == 0:
+        return 0.0
+    return float(np.sum(mag * texture) / total)
+
+
+def _process_flow_part(analysis_params, movie_path, margins, start, stop):
+    """
+    Computes the magnitudes of the samples in [start, stop) in a worker process.
+    """
+    analysis = OpticalFlowAnalysis(**analysis_params)
+    analysis.movie_path = movie_path
+    analysis.margins = margins
+
+    request = analysis.begin_frames(dict(start=start, end=stop))
+    with FrameReader(movie_path, margins=margins, max_width=None) as reader:
+        for frame_pos in request.frame_positions:
+            frame = reader.read(frame_pos)
+            if frame is None:
+                break
+            analysis.process_frame(request.state, frame_pos, frame)
+    return start, request.state['magnitudes']
+
 
 @vian_analysis
 class OpticalFlowAnalysis(IAnalysisJob):
-    def __init__(self, resolution=30):
+    def __init__(self, resolution=30, mode=FLOW_DENSE, flow_width=FLOW_WIDTH, levels=FLOW_LEVELS, n_workers=1):
         super(OpticalFlowAnalysis, self).__init__("Optical Flow", [MOVIE_DESCRIPTOR],
                                                  menu = IAnalysisJob.M_MOVEMENT,
                                                  dataset_name="OpticalFlow",
@@ -39,6 +117,10 @@ class OpticalFlowAnalysis(IAnalysisJob):
                                                  multiple_result=False,
                                                  data_serialization=DataSerialization.HDF5_SINGLE)
         self.resolution = resolution
+        self.mode = mode
+        self.flow_width = flow_width
+        self.levels = levels
+        self.n_workers = n_workers
 
     def prepare(self, project: VIANProject, targets: List[BaseProjectEntity], fps, class_objs=None):
         """
@@ -52,51 +134,86 @@ class OpticalFlowAnalysis(IAnalysisJob):
         self.margins = project.movie_descriptor.get_letterbox_rect(as_coords=True)
         return args
 
+    def supports_parallel_processing(self):
+        return True
+
     def process(self, argst, sign_progress):
         args, sign_progress = super(OpticalFlowAnalysis, self).process(argst, sign_progress)
-        print(argst)
         # Signal the Progress
         sign_progress(0.0)
 
-        movie_path = self.movie_path
-        margins = self.margins
+        if self.n_workers > 1:
+            result = self.process_parallel(sign_progress)
+        else:
+            result = FramePipeline([(self, args)]).run(sign_progress)[0]
+        sign_progress(1.0)
+        return result
 
-        cap = cv2.VideoCapture(movie_path)
+    def process_parallel(self, sign_progress):
+        """
+        Computes the flow of contiguous parts of the movie on a pool of worker processes,
+        since each sample only depends on its own pair of frames.
+        """
+        length = self._movie_length()
+        n_samples = int(np.ceil(length / self.resolution))
+        bounds = np.linspace(0, n_samples, self.n_workers + 1).astype(int) * self.resolution
+        params = dict(resolution=self.resolution, mode=self.mode, flow_width=self.flow_width, levels=self.levels)
+
+        state = self._new_state(length)
+        # Forking a process with running Qt and HDF5 threads is not safe, hence the workers are spawned
+        with ProcessPoolExecutor(max_workers=self.n_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(_process_flow_part, params, self.movie_path, self.margins, int(start), int(stop))
+                       for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+            for i, f in enumerate(futures):
+                start, magnitudes = f.result()
+                idx = start // self.resolution
+                state['magnitudes'][idx:idx + magnitudes.shape[0]] = magnitudes
+                sign_progress((i + 1) / len(futures))
+        return self.end_frames(state)
+
+    def _movie_length(self):
+        cap = cv2.VideoCapture(self.movie_path)
         length = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        cap.release()
+        return int(length)
 
-        start = 0
-        stop = int(length)
-        prvs = None
-
-        magnitudes = np.zeros(shape=int(np.ceil(stop / self.resolution)))
-        idx = 0
-        for i in range(start, stop, self.resolution):
-            sign_progress((i - start) / ((stop - start) + 1))
-
-            cap.set(cv2.CAP_PROP_POS_FRAMES, i)
-            ret, frame = cap.read()
+    def _new_state(self, stop, start=0):
+        return dict(prvs=None, prvs_pos=-1, scale=1.0, start=start,
+                    magnitudes=np.zeros(shape=int(np.ceil((stop - start) / self.resolution))))
 
-            if frame is None:
-                break
-
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-            if margins is not None:
-                frame = frame[margins[1]:margins[3], margins[0]:margins[2]]
+    def begin_frames(self, args):
+        """
+        Each sample compares the frame at its position to the one directly following it,
+        both are read sequentially.
+        """
+        start = 0
+        stop = self._movie_length()
+        if isinstance(args, dict) and "start" in args:
+            start, stop = args['start'], args['end']
 
-            preprocess_frame(frame, self.max_width)
+        # The pair of the last sample may lie behind the end of the movie, which ends the reading
+        frame_positions = set()
+        for frame_pos in range(start, stop, self.resolution):
+            frame_positions.update([frame_pos, frame_pos + 1])
+        frame_positions = sorted(frame_positions)
 
-            if prvs is None:
-                prvs = frame
+        return FrameRequest(self.movie_path, self.margins, frame_positions, self._new_state(stop, start))
 
-            flow = cv2.calcOpticalFlowFarneback(prvs, frame, None, 0.5, 3, 15, 3, 5, 1.2, 0)
-            mag, ang = cv2.cartToPolar(flow[..., 0], flow[..., 1])
+    def process_frame(self, state, frame_pos, frame):
+        gray = flow_frame(frame, self.flow_width)
 
-            magnitudes[idx] = np.mean(mag)
-            idx += 1
+        if state['prvs'] is not None and state['prvs_pos'] == frame_pos - 1:
+            # The flow is measured in pixels of the (cropped) source frame
+            magnitude = flow_magnitude(state['prvs'], gray, self.mode, self.levels) * state['scale']
+            state['magnitudes'][(state['prvs_pos'] - state['start']) // self.resolution] = magnitude
 
-            prvs = frame
+        if (frame_pos - state['start']) % self.resolution == 0:
+            state['prvs'] = gray
+            state['prvs_pos'] = frame_pos
+            state['scale'] = frame.shape[1] / gray.shape[1]
 
+    def end_frames(self, state):
+        magnitudes = state['magnitudes']
         magnitudes[magnitudes == np.inf] = 0
         magnitudes = np.nan_to_num(magnitudes)
 
@@ -104,7 +221,7 @@ class OpticalFlowAnalysis(IAnalysisJob):
             name="Optical Flow",
             results=magnitudes,
             analysis_job_class=self.__class__,
-            parameters=dict(resolution=self.resolution),
+            parameters=dict(resolution=self.resolution, mode=self.mode, flow_width=self.flow_width),
             container=None
         )
 
@@ -182,3 +299,18 @@ class OpticalFlowAnalysis(IAnalysisJob):
         return db_data
 
 
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    # Compares the runtime and the mean magnitude of the flow modes on a movie
+    for mode, flow_width in [(FLOW_DENSE, FLOW_WIDTH), (FLOW_SPARSE, FLOW_WIDTH), (FLOW_DENSE, 640), (FLOW_SPARSE, 640)]:
+        job = OpticalFlowAnalysis(mode=mode, flow_width=flow_width)
+        job.movie_path = sys.argv[1]
+        job.margins = None
+        t = time.time()
+        res = job.process([], None)
+        print("{m} {w}px: {t:.2f}s, mean magnitude {v:.2f}".format(m=mode, w=flow_width, t=time.time() - t,
+                                                                  v=float(np.mean(res.data))))
@@ -11,6 +11,7 @@ from vian.core.container.project import *
 from vian.core.gui.ewidgetbase import EGraphicsView  # , GraphicsViewDockWidget
 from vian.core.data.interfaces import IAnalysisJob, ParameterWidget, VisualizationTab
 from vian.core.container.hdf5_manager import vian_analysis
+from vian.core.analysis.misc import FrameReader
 
 
 @vian_analysis
@@ -64,20 +65,18 @@ class MovieMosaicAnalysis(IAnalysisJob):
 
     def mosaic_color_patches(self, start, end, path, resolution, per_row, sign_progress):
 
-        capture = cv2.VideoCapture(path)
-        capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+        reader = FrameReader(path, max_width=None)
         # end = capture.get(cv2.CAP_PROP_FRAME_COUNT)
         n_width = 50
         n_height = 50
         length = int((end - start) / resolution)
 
         images = np.zeros(shape=(length, n_width, n_height, 3), dtype=np.uint8)
-        for i in range(length):
+        for i, (frame_pos, frame) in enumerate(reader.frames(start, start + length * resolution, resolution)):
             sign_progress(i / length)
-            capture.set(cv2.CAP_PROP_POS_FRAMES, float(i * resolution))
-            ret, frame = capture.read()
             col = np.mean(frame.astype(np.float32), axis=(0, 1)).astype(np.uint8)
             images[i, :, :] = col
+        reader.release()
 
         columns = int(np.ceil(length / per_row))
         final = np.zeros(shape=(columns * n_height, per_row * n_width, 3), dtype=np.uint8)
@@ -98,23 +97,20 @@ class MovieMosaicAnalysis(IAnalysisJob):
         return result
 
     def mosaic_frame_patches(self, start, end, path, resolution, per_row, sign_progress):
-        capture = cv2.VideoCapture(path)
-        capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+        reader = FrameReader(path, max_width=None)
 
-        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        width = int(reader.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(reader.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
         n_width = 100
         n_height = int((100 / width) * height)
         length = int((end - start) / resolution)
 
         images = np.zeros(shape=(length, n_height, n_width, 3), dtype=np.uint8)
-        for i in range(length):
+        for i, (frame_pos, frame) in enumerate(reader.frames(start, start + length * resolution, resolution)):
             sign_progress(i / length)
-            capture.set(cv2.CAP_PROP_POS_FRAMES, i * resolution)
-            ret, frame = capture.read()
-
             images[i] = cv2.resize(frame, (n_width, n_height), interpolation=cv2.INTER_CUBIC)
+        reader.release()
 
         columns = int(np.ceil(length / per_row))
         final = np.zeros(shape=(columns * n_height, per_row * n_width, 3), dtype=np.uint8)
@@ -17,11 +17,72 @@ from vian.core.data.computation import floatify_img, frame2ms
 
 import cv2
 from vian.core.analysis.colorimetry.computation import calculate_histogram
+from vian.core.analysis.misc import FrameReader
 from sklearn.cluster import AgglomerativeClustering
+from heapq import heappush, heappushpop
+import scipy.sparse
 
 MAX_CLUSTER = 500
 MAX_DEPTH = 500
 
+
+def chain_connectivity(n):
+    """
+    Creates a sparse connectivity matrix in which each sample is connected to its temporal neighbours.
+
+    :param n: The number of samples
+    :return: A scipy.sparse.csr_matrix of shape (n, n)
+    """
+    rows = np.arange(1, n - 1)
+    i = np.concatenate((rows, rows, rows))
+    j = np.concatenate((rows - 1, rows, rows + 1))
+    return scipy.sparse.coo_matrix((np.ones(i.shape[0], dtype=np.uint8), (i, j)), shape=(n, n)).tocsr()
+
+
+def adjacent_clusterings(X, cluster_sizes):
+    """
+    Clusters temporally ordered samples with ward linkage, such that each cluster is a range of adjacent samples.
+    The merge tree is fitted once and cut for each of the requested number of clusters,
+    the labels are the same as fitting an AgglomerativeClustering for each number of clusters.
+
+    :param X: The feature vectors of shape (n_samples, n_features), in temporal order
+    :param cluster_sizes: The numbers of clusters, numbers not smaller than n_samples are skipped
+    :return: A list of label arrays, one for each computed number of clusters
+    """
+    X = np.asarray(X)
+    n = X.shape[0]
+    cluster_sizes = [k for k in cluster_sizes if n > k]
+    if len(cluster_sizes) == 0:
+        return []
+
+    model = AgglomerativeClustering(linkage="ward",
+                                    connectivity=chain_connectivity(n),
+                                    n_clusters=1, compute_full_tree=True)
+    model.fit(X)
+    children = model.children_.tolist()
+
+    # Since only neighbours are merged, each node covers a range of samples
+    lo = list(range(n)) + [0] * len(children)
+    hi = list(range(n)) + [0] * len(children)
+    for i, (a, b) in enumerate(children):
+        lo[n + i] = min(lo[a], lo[b])
+        hi[n + i] = max(hi[a], hi[b])
+
+    # Splits the tree top down in the same order as sklearn's cut, one additional cluster per step
+    result = dict()
+    nodes = [-(max(children[-1]) + 1)]
+    for k in range(1, max(cluster_sizes) + 1):
+        if k > 1:
+            these_children = children[-nodes[0] - n]
+            heappush(nodes, -these_children[0])
+            heappushpop(nodes, -these_children[1])
+        if k in cluster_sizes:
+            labels = np.zeros(n, dtype=np.intp)
+            for i, node in enumerate(nodes):
+                labels[lo[-node]:hi[-node] + 1] = i
+            result[k] = labels
+    return [result[k] for k in cluster_sizes]
+
 @vian_analysis
 class ShotSegmentationAnalysis(IAnalysisJob):
     """
@@ -71,7 +132,7 @@ class ShotSegmentationAnalysis(IAnalysisJob):
         # Signal the Progress
         sign_progress(0.0)
 
-        video_capture = cv2.VideoCapture(args['movie_path'])
+        video_capture = FrameReader(args['movie_path'], max_width=None)
 
         duration = video_capture.get(cv2.CAP_PROP_FRAME_COUNT)
         resize_f = 192.0 / video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)
@@ -89,9 +150,7 @@ class ShotSegmentationAnalysis(IAnalysisJob):
                 return None
 
             idx = int(i * self.resolution)
-            video_capture.set(cv2.CAP_PROP_POS_FRAMES, idx)
-
-            ret, frame = video_capture.read()
+            frame = video_capture.read(idx)
             if frame is None:
                 continue
 
@@ -105,23 +164,14 @@ class ShotSegmentationAnalysis(IAnalysisJob):
             frame_pos[i] = idx
             sign_progress(round(i / n, 4))
 
-        connectivity = np.zeros(shape=(n, n), dtype=np.uint8)
-        for i in range(1, n - 1, 1):
-            connectivity[i][i - 1] = 1
-            connectivity[i][i] = 1
-            connectivity[i][i + 1] = 1
         clusterings = []
-
         cluster_sizes = range(self.cluster_range[0], self.cluster_range[1], 1)
-        for i, n_cluster in enumerate(cluster_sizes):
+        fps = video_capture.get(cv2.CAP_PROP_FPS)
+        for i, labels in enumerate(adjacent_clusterings(X, cluster_sizes)):
             sign_progress(i / len(cluster_sizes))
-            if X.shape[0] > n_cluster:
-                model = AgglomerativeClustering(linkage="ward",
-                                                connectivity=connectivity,
-                                                n_clusters=n_cluster, compute_full_tree=True)
-                model.fit(X)
-                timestamps = self._generate_segments(model.labels_, frame_pos, video_capture.get(cv2.CAP_PROP_FPS))
-                clusterings.append(timestamps)
+            timestamps = self._generate_segments(labels, frame_pos, fps)
+            clusterings.append(timestamps)
+        video_capture.release()
 
         if self.return_hdf5_compatible:
             result = np.zeros(shape=self.dataset_shape, dtype=self.dataset_dtype)
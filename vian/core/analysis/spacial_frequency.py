@@ -1,6 +1,9 @@
 import numpy as np
 import cv2
 
+SPACIAL_FREQUENCY_METHODS = ["edge-mean", "color-var", "hue-var", "luminance-var"]
+
+
 def neighborhood_mean_cv(img, wlen):
     img = img.astype(np.float32)
     wmean = cv2.boxFilter(img, -1, (wlen, wlen), borderType=cv2.BORDER_REFLECT)
@@ -32,6 +35,55 @@ def neighborhood_var_cv(img, wlen, channels = None):
     return result
 
 
+def get_spacial_frequency_raw(input_img, methods = None, x2=20, x3=20):
+    """
+    Computes the unnormalized spatial frequency maps of several methods at once.
+    The color conversions are shared between the methods and no heatmaps are created.
+
+    :param input_img: A BGR uint8 image
+    :param methods: A list of methods out of SPACIAL_FREQUENCY_METHODS, by default all
+    :param x2: The first threshold of the canny edge detection
+    :param x3: The second threshold of the canny edge detection
+    :return: A dict method: map of shape (height, width), float32
+    """
+    if methods is None:
+        methods = SPACIAL_FREQUENCY_METHODS
+    result = dict()
+
+    lab = cv2.cvtColor(input_img, cv2.COLOR_BGR2LAB)
+    if "edge-mean" in methods:
+        edges = cv2.Canny(lab, x2, x3).astype(np.float32)
+        edges = np.clip(cv2.GaussianBlur(edges, (1, 1), 0), 0, 1.0)
+        result["edge-mean"] = neighborhood_mean_cv(edges, 20)
+
+    if "color-var" in methods or "luminance-var" in methods:
+        lab_f = lab.astype(np.float32)
+        if "color-var" in methods:
+            result["color-var"] = neighborhood_var_cv(lab_f, 20, channels=(1, 2))
+        if "luminance-var" in methods:
+            result["luminance-var"] = neighborhood_var_cv(lab_f, 20, channels=(0))
+
+    if "hue-var" in methods:
+        lab = cv2.cvtColor(input_img.astype(np.float32) / 255, cv2.COLOR_BGR2LAB)
+        chroma = np.linalg.norm(lab[:, :, 1:3], axis=2)
+        result["hue-var"] = neighborhood_var_cv(chroma, 20)
+
+    return result
+
+
+def get_spacial_frequency_stats(input_img, methods = None):
+    """
+    Computes the maximum and the mean of the unnormalized spatial frequency of several methods at once,
+    without creating the heatmaps.
+
+    :param input_img: A BGR uint8 image
+    :param methods: A list of methods out of SPACIAL_FREQUENCY_METHODS, by default all
+    :return: A dict method: np.array([max, mean], dtype=np.float32)
+    """
+    raw = get_spacial_frequency_raw(input_img, methods)
+    return {m: np.array([np.amax(r), np.mean(r)], dtype=np.float32) for m, r in raw.items()}
+
+
 def get_heatmap_rgb(img, to_blend = None):
     result = np.zeros(shape=(img.shape[0], img.shape[1], 3), dtype=np.uint8)
     result[:, :, 2] = ((np.clip(img, 0.5, 1.0) - 0.5) / 0.5) * 255
@@ -47,12 +99,12 @@ def get_heatmap_rgb(img, to_blend = None):
 
 def get_spacial_frequency_heatmap(input_img, blur = False, x2=20, x3=20, method = "edge-mean", normalize = True, norm_factor = None):
     # input_img = cv2.resize(input_img, None, None, 0.5,0.5, cv2.INTER_CUBIC)
-    lab = cv2.cvtColor(input_img, cv2.COLOR_BGR2LAB)
+    if method not in SPACIAL_FREQUENCY_METHODS:
+        return input_img, np.zeros_like(input_img), np.zeros_like(input_img)
+    raw = get_spacial_frequency_raw(input_img, [method], x2, x3)[method]
+
     if method == "edge-mean":
-        edges = cv2.Canny(lab, x2, x3).astype(np.float32)
-        edges = np.clip(cv2.GaussianBlur(edges, (1, 1), 0), 0, 1.0)
-        edge_mean = neighborhood_mean_cv(edges, 20)
-        raw = edge_mean
+        edge_mean = raw
         if normalize:
             if norm_factor is None:
                 norm_factor = np.amax(edge_mean)
@@ -70,8 +122,7 @@ def get_spacial_frequency_heatmap(input_img, blur = False, x2=20, x3=20, method
         result *= 255
         return color_img, result.astype(np.uint8), raw
     elif method == "color-var":
-        col_var = neighborhood_var_cv(lab.astype(np.float32), 20, channels=(1, 2))
-        raw = col_var.copy()
+        col_var = raw.copy()
         if normalize:
             if norm_factor is None:
                 norm_factor = np.amax(col_var)
@@ -84,10 +135,7 @@ def get_spacial_frequency_heatmap(input_img, blur = False, x2=20, x3=20, method
         return color_img, col_var, raw
 
     elif method == "hue-var":
-        lab = cv2.cvtColor(input_img.astype(np.float32) / 255, cv2.COLOR_BGR2LAB)
-        lch = img_lab_to_lch(lab)
-        hue_var = neighborhood_var_cv(lch.astype(np.float32), 20, channels=(1))
-        raw = hue_var.copy()
+        hue_var = raw.copy()
         if normalize:
             if norm_factor is None:
                 norm_factor = np.amax(hue_var)
@@ -100,9 +148,8 @@ def get_spacial_frequency_heatmap(input_img, blur = False, x2=20, x3=20, method
         color_img, heatm = get_heatmap_rgb(hue_var, input_img)
         return color_img, hue_var, raw
 
-    elif method == "luminance-var":
-        lum_var = neighborhood_var_cv(lab.astype(np.float32), 20, channels=(0))
-        raw = lum_var.copy()
+    else:
+        lum_var = raw.copy()
         if normalize:
             if norm_factor is None:
                 norm_factor = np.amax(lum_var)
@@ -113,8 +160,6 @@ def get_spacial_frequency_heatmap(input_img, blur = False, x2=20, x3=20, method
         lum_var = cv2.blur(lum_var, (12, 12))
         color_img, heatm = get_heatmap_rgb(lum_var, input_img)
         return color_img, lum_var, raw
-    else:
-        return input_img, np.zeros_like(input_img), np.zeros_like(input_img)
 
 
 def convolve_segmentation(values, segmentation):
@@ -13,6 +13,7 @@ from PyQt6.QtWidgets import *
 from vian.core.visualization.basic_vis import HistogramVis
 from vian.core.data.interfaces import IAnalysisJob, ParameterWidget, VisualizationTab
 from vian.core.container.hdf5_manager import vian_analysis
+from vian.core.analysis.misc import FrameReader
 
 @vian_analysis
 class ZProjectionAnalysis(IAnalysisJob):
@@ -69,11 +70,8 @@ class ZProjectionAnalysis(IAnalysisJob):
         margins = args["margins"]
         semseg = args["semseg"]
 
-        cap = cv2.VideoCapture(movie_path)
-        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
-        r, frame = cap.read()
-        if margins is not None:
-            frame = frame[margins[1]:margins[3], margins[0]:margins[2]]
+        reader = FrameReader(movie_path, margins=margins, max_width=None)
+        frame = reader.read(start)
         c = start
         z_projection = np.zeros(shape=frame.shape, dtype = np.float32)
 
@@ -84,27 +82,16 @@ class ZProjectionAnalysis(IAnalysisJob):
             bin_mask = labels_to_binary_mask(mask, labels)
 
         n = 0
-        while c < stop + self.resolution:
-            if c % self.resolution != 0:
-                c += 1
-                continue
+        # Only frames at multiples of the resolution are sampled
+        first = int(np.ceil(start / self.resolution)) * self.resolution
+        for c, frame in reader.frames(first, stop + self.resolution, self.resolution):
             sign_progress((c - start) / ((stop - start) + 1))
 
-            cap.set(cv2.CAP_PROP_POS_FRAMES, c)
-            ret, frame = cap.read()
-
-            if frame is None:
-                break
-
-            # Get sub frame if there are any margins
-            if margins is not None:
-                frame = frame[margins[1]:margins[3], margins[0]:margins[2]]
-
             # frame = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
             # z_projection += floatify_img(frame)
             z_projection += frame
-            c += 1
             n += 1
+        reader.release()
 
         z_projection = np.divide(z_projection, n)
         z_projection -= np.amin(z_projection)
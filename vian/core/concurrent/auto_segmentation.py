@@ -1,4 +1,3 @@
-from sklearn.cluster import AgglomerativeClustering
 import numpy as np
 
 from vian.core.gui.ewidgetbase import *
@@ -7,6 +6,7 @@ from vian.core.data.interfaces import IConcurrentJob
 from vian.core.data.enums import *
 from vian.core.container.project import VIANProject
 from vian.core.analysis.misc import preprocess_frame
+from vian.core.analysis.shot_segmentation import adjacent_clusterings
 from vian.core.data.computation import frame2ms, floatify_img, ms_to_frames
 
 from vian.core.gui.misc.utils import dialog_with_margin
@@ -16,17 +16,7 @@ AUTO_SEGM_CHIST = 1
 
 
 def cluster_histograms_adjacently(x, n_clusters = 2):
-    connectivity = np.zeros(shape=(x.shape[0], x.shape[0]), dtype=np.uint8)
-    for i in range(1, x.shape[0] - 1, 1):
-        connectivity[i][i - 1] = 1
-        connectivity[i][i] = 1
-        connectivity[i][i + 1] = 1
-
-    model = AgglomerativeClustering(linkage="ward",
-                                    connectivity=connectivity,
-                                    n_clusters=n_clusters, compute_full_tree=True)
-    model.fit(x)
-    return model.labels_
+    return adjacent_clusterings(x, [n_clusters])[0]
 
 
 def auto_segmentation(project:VIANProject, mode, main_window, n_segment = -1, segm_width = 10000, nth_frame = 4, n_cluster_lb =1, n_cluster_hb = 100, resolution=30):
@@ -192,22 +182,10 @@ class AutoSegmentingJobHistogram(IConcurrentJob):
                     histograms.append(np.resize(hist, new_shape=16 ** 3))
                 data_idx += 1
 
-        connectivity = np.zeros(shape=(len(histograms), len(histograms)), dtype=np.uint8)
-        for i in range(1, len(histograms) - 1, 1):
-            connectivity[i][i - 1] = 1
-            connectivity[i][i] = 1
-            connectivity[i][i + 1] = 1
-
         clusterings = []
-        for i, n_cluster in enumerate(cluster_sizes):
+        for i, labels in enumerate(adjacent_clusterings(histograms, cluster_sizes)):
             sign_progress(i / len(cluster_sizes))
-
-            if len(histograms) > n_cluster:
-                model = AgglomerativeClustering(linkage="ward",
-                                                connectivity=connectivity,
-                                                n_clusters=n_cluster, compute_full_tree=True)
-                model.fit(histograms)
-                clusterings.append(model.labels_)
+            clusterings.append(labels)
 
         frames_total = cap.get(cv2.CAP_PROP_FRAME_COUNT)
         pcounter, p_max = 0, len(np.unique(clusterings[0])) * 30
@@ -289,22 +267,10 @@ class AutoSegmentingJobAudio(IConcurrentJob):
                     histograms.append(np.resize(hist, new_shape=16 ** 3))
                 data_idx += 1
 
-        connectivity = np.zeros(shape=(len(histograms), len(histograms)), dtype=np.uint8)
-        for i in range(1, len(histograms) - 1, 1):
-            connectivity[i][i - 1] = 1
-            connectivity[i][i] = 1
-            connectivity[i][i + 1] = 1
-
         clusterings = []
-        for i, n_cluster in enumerate(cluster_sizes):
+        for i, labels in enumerate(adjacent_clusterings(histograms, cluster_sizes)):
             sign_progress(i / len(cluster_sizes))
-
-            if len(histograms) > n_cluster:
-                model = AgglomerativeClustering(linkage="ward",
-                                                connectivity=connectivity,
-                                                n_clusters=n_cluster, compute_full_tree=True)
-                model.fit(histograms)
-                clusterings.append(model.labels_)
+            clusterings.append(labels)
 
         frames_total = cap.get(cv2.CAP_PROP_FRAME_COUNT)
         pcounter, p_max = 0, len(np.unique(clusterings[0])) * 30
@@ -0,0 +1,189 @@
+"""
+A background decoder which keeps the frames around the playhead of the OpenCV frame view decoded.
+
+While the playhead moves linearly, the frames are read sequentially from the capture,
+a seek is only performed if the playhead jumps outside of the buffered window.
+"""
+
+import sys
+from collections import OrderedDict, namedtuple
+from threading import Thread, Condition, Lock
+
+import cv2
+
+from vian.core.data.log import log_debug
+
+# The maximal number of frames between two requests, for which the playback is considered to be linear
+LINEAR_PLAYBACK_MAX_STEP = 4
+
+PrefetchStats = namedtuple("PrefetchStats", ["hits", "misses", "seeks", "reads", "hit_rate"])
+
+
+class FramePrefetcher:
+    """
+    Decodes the frames in [playhead - behind, playhead + ahead] on a background thread
+    and keeps them in a ring buffer.
+
+    :param movie_path: The path to the movie
+    :param ahead: The number of frames buffered ahead of the playhead, see UserSettings.FRAME_PREFETCH_AHEAD
+    :param behind: The number of frames buffered behind the playhead, see UserSettings.FRAME_PREFETCH_BEHIND
+    :param transform: A function applied to each decoded frame before it is buffered, e.g. the overlay scaling
+    """
+    def __init__(self, movie_path, ahead, behind, transform=None):
+        self.movie_path = movie_path
+        self.transform = transform
+        self.ahead = ahead
+        self.behind = behind
+
+        self.capture = cv2.VideoCapture(movie_path)
+        self.n_frames = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        if self.n_frames <= 0:
+            # Some containers do not report the frame count, the end is found while decoding
+            self.n_frames = sys.maxsize
+
+        # The index of the frame the next capture.read() returns
+        self._capture_pos = 0
+        self._capture_lock = Lock()
+
+        self._frames = OrderedDict()
+        self._generation = 0
+        self._playhead = -1
+        self._linear = False
+        self._active = True
+        self._condition = Condition()
+
+        self.hits = 0
+        self.misses = 0
+        self.seeks = 0
+        self.reads = 0
+
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def get_frame(self, frame_idx):
+        """
+        Returns the transformed frame at frame_idx, from the buffer if available,
+        else the frame is decoded in the calling thread.
+
+        :param frame_idx: The index of the frame
+        :return: The frame or None if it can not be read
+        """
+        with self._condition:
+            step = frame_idx - self._playhead
+            self._linear = 0 < step <= LINEAR_PLAYBACK_MAX_STEP
+            self._playhead = frame_idx
+            self._drop_outside_window()
+
+            frame = self._frames.get(frame_idx)
+            generation = self._generation
+            if frame is not None:
+                self.hits += 1
+                self._condition.notify_all()
+                return frame
+            self.misses += 1
+
+        frame = self._decode(frame_idx)
+        with self._condition:
+            if frame is not None and generation == self._generation:
+                self._frames[frame_idx] = frame
+            self._condition.notify_all()
+        return frame
+
+    def clear(self):
+        """
+        Drops all buffered frames, e.g. because the transform has changed.
+        """
+        with self._condition:
+            self._frames.clear()
+            self._generation += 1
+            self._condition.notify_all()
+
+    def release(self):
+        """
+        Stops the decoder thread and releases the capture.
+        """
+        with self._condition:
+            self._active = False
+            self._frames.clear()
+            self._condition.notify_all()
+        self._thread.join()
+        with self._capture_lock:
+            self.capture.release()
+        log_debug("FramePrefetcher", self.get_stats())
+
+    def get_stats(self):
+        """
+        Returns the hits and misses of get_frame() and the number of seeks and reads performed on the capture.
+        """
+        n = self.hits + self.misses
+        return PrefetchStats(self.hits, self.misses, self.seeks, self.reads,
+                             self.hits / n if n > 0 else 0.0)
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.seeks = 0
+        self.reads = 0
+
+    def _window(self):
+        # Linear playback needs the frames ahead only, after a jump the user is as likely to step back
+        if self._linear:
+            start = self._playhead
+        else:
+            start = self._playhead - self.behind
+        return max(0, start), min(self.n_frames, self._playhead + self.ahead + 1)
+
+    def _drop_outside_window(self):
+        start, stop = self._window()
+        for idx in [idx for idx in self._frames.keys() if not start - self.behind <= idx < stop]:
+            del self._frames[idx]
+
+    def _next_missing(self):
+        """
+        Returns the index of the next frame to decode, the frames ahead of the playhead first.
+        """
+        start, stop = self._window()
+        for idx in range(max(self._playhead, 0), stop):
+            if idx not in self._frames:
+                return idx
+        for idx in range(start, self._playhead):
+            if idx not in self._frames:
+                return idx
+        return None
+
+    def _decode(self, frame_idx):
+        with self._capture_lock:
+            if frame_idx != self._capture_pos:
+                self.capture.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+                self.seeks += 1
+            ret, frame = self.capture.read()
+            self.reads += 1
+            if frame is None:
+                # The position of the capture is unknown, the next decode has to seek
+                self._capture_pos = -1
+                return None
+            self._capture_pos = frame_idx + 1
+
+        if self.transform is not None:
+            frame = self.transform(frame)
+        return frame
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._active and (self._playhead < 0 or self._next_missing() is None):
+                    self._condition.wait()
+                if not self._active:
+                    return
+                frame_idx = self._next_missing()
+                generation = self._generation
+
+            frame = self._decode(frame_idx)
+
+            with self._condition:
+                if frame is None:
+                    # Past the end of the movie, nothing to prefetch until the playhead moves
+                    self.n_frames = min(self.n_frames, frame_idx)
+                elif generation == self._generation:
+                    self._frames[frame_idx] = frame
+                    self._drop_outside_window()
@@ -6,6 +6,7 @@ from vian.core.data.computation import *
 from vian.core.analysis.spacial_frequency import get_spacial_frequency_heatmap, get_spacial_frequency_heatmap2
 from vian.core.container.project import VIANProject, IAnalysisJobAnalysis
 from vian.core.data.interfaces import SpatialOverlayDataset
+from vian.core.concurrent.frame_prefetch import FramePrefetcher
 
 from matplotlib import cm
 
@@ -130,7 +131,11 @@ class TimestepUpdateWorkerSingle(QObject):
         self.overlay_colormap = cm.get_cmap(settings.OVERLAY_VISUALIZATION_COLORMAP)
 
         self.movie_path = ""
+        self.movie_width = 0
         self.video_capture = None
+        self.frame_prefetcher = None  # type:FramePrefetcher
+        self.prefetch_ahead = settings.FRAME_PREFETCH_AHEAD
+        self.prefetch_behind = settings.FRAME_PREFETCH_BEHIND
 
         self.opencv_frame = False
         self.update_colormetry = True
@@ -150,6 +155,12 @@ class TimestepUpdateWorkerSingle(QObject):
         self.video_capture = cv2.VideoCapture(movie_path)
         ret, frame = self.video_capture.read()
         self.fps = self.video_capture.get(cv2.CAP_PROP_FPS)
+        self.movie_width = int(self.video_capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+
+        if self.frame_prefetcher is not None:
+            self.frame_prefetcher.release()
+        self.frame_prefetcher = FramePrefetcher(movie_path, self.prefetch_ahead, self.prefetch_behind,
+                                                transform=self.scale_frame)
         if frame is not None:
             self.seedsmodel = cv2.ximgproc.createSuperpixelSEEDS(frame.shape[1], frame.shape[0], 3, 200,
                                                                  num_levels=6, histogram_bins=8)
@@ -169,10 +180,30 @@ class TimestepUpdateWorkerSingle(QObject):
         self.project = project
         self.spatial_datasets = dict()
 
+        # The display size of the movie is part of the project
+        if self.frame_prefetcher is not None:
+            self.frame_prefetcher.clear()
+
         self.project.onAnalysisAdded.connect(self.on_analysis_added)
         for a in project.analysis:
             self.on_analysis_added(a)
 
+    def on_closed(self):
+        """
+        Stops the frame prefetching and releases the captures of the closed project.
+        """
+        prefetcher = self.frame_prefetcher
+        self.frame_prefetcher = None
+        if prefetcher is not None:
+            prefetcher.release()
+        if self.video_capture is not None:
+            self.video_capture.release()
+            self.video_capture = None
+
+        self.project = None
+        self.spatial_datasets = dict()
+        self.current_spatial_dataset = None
+
     @pyqtSlot(object)
     def on_analysis_added(self, analysis):
         if issubclass(analysis.__class__, IAnalysisJobAnalysis):
@@ -186,7 +217,7 @@ class TimestepUpdateWorkerSingle(QObject):
 
     @pyqtSlot(object)
     def on_settings_changed(self, settings):
-        self.overlay_frame_width = settings.OVERLAY_RESOLUTION_WIDTH
+        self.on_user_settings_changed(settings)
         self.overlay_colormap = cm.get_cmap(settings.OVERLAY_VISUALIZATION_COLORMAP)
         self.run()
 
@@ -243,6 +274,40 @@ class TimestepUpdateWorkerSingle(QObject):
 
     def on_user_settings_changed(self, settings):
         self.overlay_frame_width = settings.OVERLAY_RESOLUTION_WIDTH
+        if self.frame_prefetcher is not None:
+            self.frame_prefetcher.clear()
+
+    def scale_frame(self, frame):
+        """
+        Scales a decoded frame to the display aspect ratio and the overlay resolution,
+        this is performed by the FramePrefetcher before the frame is buffered.
+        """
+        # Ensure the display aspect ratio is correct
+        if self.project is not None and self.project.movie_descriptor.display_width is not None \
+                and self.project.movie_descriptor.display_height is not None:
+            frame = cv2.resize(frame,
+                               (self.project.movie_descriptor.display_width, self.project.movie_descriptor.display_height),
+                               interpolation=cv2.INTER_CUBIC)
+
+        fx = self.overlay_frame_width / frame.shape[1]
+        return cv2.resize(frame, None, None, fx, fx, cv2.INTER_CUBIC)
+
+    def get_source_width(self):
+        """
+        Returns the width of the frames before scale_frame(), the display width if the project sets one.
+        """
+        if self.project is not None and self.project.movie_descriptor.display_width is not None \
+                and self.project.movie_descriptor.display_height is not None:
+            return self.project.movie_descriptor.display_width
+        return self.movie_width
+
+    def get_prefetch_stats(self):
+        """
+        Returns the hit rate of the frame prefetching, see FramePrefetcher.get_stats()
+        """
+        if self.frame_prefetcher is None:
+            return None
+        return self.frame_prefetcher.get_stats()
 
     def get_opencv_frame(self, time_frame):
         """
@@ -251,20 +316,16 @@ class TimestepUpdateWorkerSingle(QObject):
         :param time_frame:
         :return:
         """
-        if self.video_capture is not None:
-            self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, time_frame)
-            ret, frame = self.video_capture.read()
+        # The prefetcher is released by on_closed() from the main thread
+        prefetcher = self.frame_prefetcher
+        if prefetcher is not None:
+            # The frame is already scaled, it is shared with the buffer and must not be modified in place
+            frame = prefetcher.get_frame(time_frame)
             if frame is None:
                 return None
-
-            # Ensure the display aspect ratio is correct
-            if self.project.movie_descriptor.display_width is not None and self.project.movie_descriptor.display_height is not None:
-                frame = cv2.resize(frame,
-                                   (self.project.movie_descriptor.display_width, self.project.movie_descriptor.display_height),
-                                   interpolation=cv2.INTER_CUBIC)
-
-            fx = self.overlay_frame_width / frame.shape[1]
-            frame = cv2.resize(frame, None, None, fx, fx, cv2.INTER_CUBIC)
+            frame = frame.copy()
+            # The scale of the buffered frame relative to the movie, as it has been applied by scale_frame()
+            fx = frame.shape[1] / self.get_source_width()
 
             # Calculate Spacial Frequency if necessary
             if self.update_spacial_frequency:
@@ -6,6 +6,8 @@ import cv2
 from vian.core.data.log import log_info, log_error
 from vian.core.data.computation import numpy_to_pixmap, generate_id
 from vian.core.data.interfaces import IProjectChangeNotify
+from vian.core.analysis.misc import FramePipeline
+from vian.core.analysis.analysis_utils import AnalysisProcessPool
 
 
 class WorkerSignals(QObject):
@@ -118,6 +120,7 @@ class MinimalThreadWorker(QRunnable):
 
 class WorkerManager(QObject, IProjectChangeNotify):
     onPushTask = pyqtSignal(object, object)
+    onPushPipeline = pyqtSignal(object)
     onStartWorker = pyqtSignal()
 
     def __init__(self, main_window):
@@ -135,6 +138,7 @@ class WorkerManager(QObject, IProjectChangeNotify):
         self.execution_thread.start()
 
         self.onPushTask.connect(self.worker.push_task)
+        self.onPushPipeline.connect(self.worker.push_pipeline)
         self.onStartWorker.connect(self.worker.run_worker)
 
         self.worker.signals.sign_create_progress_bar.connect(self.main_window.concurrent_task_viewer.add_task)
@@ -162,6 +166,22 @@ class WorkerManager(QObject, IProjectChangeNotify):
             analysis, params = self.queue.pop(0)
             self.queue_identify.pop(0)
             self.running = analysis
+
+            n_workers = self.main_window.settings.PROCESSING_WORKERS
+            if analysis.multiple_result and n_workers > 1:
+                args = analysis.prepare(*params)
+                self.onPushPipeline.emit(AnalysisProcessPool(analysis, args, n_workers))
+                return
+
+            if analysis.supports_parallel_processing() and n_workers > 1:
+                analysis.n_workers = n_workers
+                self.onPushTask.emit(analysis, analysis.prepare(*params))
+                return
+
+            if analysis.supports_frame_hook():
+                self._start_pipeline(analysis, params)
+                return
+
             args = analysis.prepare(*params)
             if analysis.multiple_result:
                 for arg in args:
@@ -172,24 +192,51 @@ class WorkerManager(QObject, IProjectChangeNotify):
         else:
             self.running = None
 
+    def _start_pipeline(self, analysis, params):
+        """
+        Collects all queued analyses which support the per-frame hook into a single FramePipeline,
+        such that each frame of the movie is only decoded once for all of them.
+        """
+        jobs = [(analysis, params)]
+        queue, queue_identify = [], []
+        parallel = self.main_window.settings.PROCESSING_WORKERS > 1
+        for q, identify in zip(self.queue, self.queue_identify):
+            if q[0].supports_frame_hook() and not (parallel and q[0].supports_parallel_processing()):
+                jobs.append(q)
+            else:
+                queue.append(q)
+                queue_identify.append(identify)
+        self.queue, self.queue_identify = queue, queue_identify
+
+        pipeline = FramePipeline()
+        for job, job_params in jobs:
+            args = job.prepare(*job_params)
+            if job.multiple_result:
+                for arg in args:
+                    pipeline.add(job, arg)
+            else:
+                pipeline.add(job, args)
+        self.onPushPipeline.emit(pipeline)
+
     @pyqtSlot(object)
     def on_worker_finished(self, finished_tasks):
-        for task_id, (analysis, result) in finished_tasks.items():
-            try:
-                if isinstance(result, list):
-                    for r in result:
-                        analysis.modify_project(self.project, r, main_window=self.main_window)
-                        a = self.project.add_analysis(r, dispatch=False)
+        with self.project.hdf5_manager.write_batch():
+            for task_id, (analysis, result) in finished_tasks.items():
+                try:
+                    if isinstance(result, list):
+                        for r in result:
+                            analysis.modify_project(self.project, r, main_window=self.main_window)
+                            a = self.project.add_analysis(r, dispatch=False)
+                            print("Result Target:", a.target_classification_object)
+                            r.unload_container()
+                    else:
+                        analysis.modify_project(self.project, result, main_window=self.main_window)
+                        a = self.project.add_analysis(result)
+                        result.unload_container()
                         print("Result Target:", a.target_classification_object)
-                        r.unload_container()
-                else:
-                    analysis.modify_project(self.project, result, main_window=self.main_window)
-                    a = self.project.add_analysis(result)
-                    result.unload_container()
-                    print("Result Target:", a.target_classification_object)
-            except Exception as e:
-                raise e
-                print("Exception in AnalysisWorker.analysis_result", str(e))
+                except Exception as e:
+                    raise e
+                    print("Exception in AnalysisWorker.analysis_result", str(e))
 
         self.project.dispatch_changed(item=self.project)
         self._start()
@@ -234,6 +281,7 @@ class AnalysisWorker(QObject):
         self.done = []
         self.aborted = False
         self._running = False
+        self.current_pipeline = None
 
     @pyqtSlot(object, object)
     def push_task(self, analysis, args):
@@ -243,6 +291,15 @@ class AnalysisWorker(QObject):
         if not self._running:
             self.run_worker()
 
+    @pyqtSlot(object)
+    def push_pipeline(self, pipeline):
+        task_id = generate_id(self.scheduled_task.keys())
+        self.scheduled_task[task_id] = (task_id, pipeline, None, self._on_progress)
+        names = sorted(set([analysis.__class__.__name__ for analysis, args in pipeline.tasks]))
+        self.signals.sign_create_progress_bar.emit(task_id, ", ".join(names), None, None)
+        if not self._running:
+            self.run_worker()
+
     @pyqtSlot()
     def run_worker(self):
         self._running = True
@@ -250,12 +307,15 @@ class AnalysisWorker(QObject):
         
         self.signals.analysisStarted.emit()
         print("Scheduled", self.scheduled_task)
-        for i, (task_id, args) in enumerate(self.scheduled_task.items()):
+        for i, (task_id, args) in enumerate(list(self.scheduled_task.items())):
             print("Performing", ) #, self.aborted, (task_id, args))
 
             if self.aborted:
                 break
             self.current_task_id = task_id
+            if isinstance(args[1], (FramePipeline, AnalysisProcessPool)):
+                self._run_pipeline(task_id, args[1], args[3])
+                continue
             result = self._run_task(*args)
             if result is not None and not self.aborted:
                 self.finished_tasks[task_id] = (args[1], result)
@@ -282,6 +342,25 @@ class AnalysisWorker(QObject):
             self.signals.sign_error.emit((exctype, value, traceback.format_exc()))
             return None
 
+    def _run_pipeline(self, task_id, pipeline, on_progress):
+        log_info("Running", pipeline.__class__.__name__, [analysis.__class__ for analysis, args in pipeline.tasks])
+        self.current_pipeline = pipeline
+        try:
+            results = pipeline.run(on_progress)
+        except Exception as e:
+            traceback.print_exc()
+            exctype, value = sys.exc_info()[:2]
+            self.signals.sign_error.emit((exctype, value, traceback.format_exc()))
+            results = []
+        finally:
+            self.current_pipeline = None
+
+        if self.aborted:
+            return
+        for i, result in enumerate(results):
+            if result is not None:
+                self.finished_tasks[(task_id, i)] = (pipeline.tasks[i][0], result)
+
     def _on_progress(self, float_value):
         self.signals.sign_task_manager_progress.emit(self.current_task_id, float_value)
 
@@ -290,5 +369,7 @@ class AnalysisWorker(QObject):
         self.finished_tasks = dict()
         self.signals.analysisEnded.emit()
 
+        if self.current_pipeline is not None:
+            self.current_pipeline.abort()
         self.aborted = True
 
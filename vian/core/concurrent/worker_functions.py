@@ -1,4 +1,6 @@
+import os
 import json
+from typing import List
 
 from PyQt6 import QtGui
 from PyQt6.QtCore import Qt
@@ -8,6 +10,8 @@ from vian.core.gui.main_window import *
 from vian.core.data.interfaces import IConcurrentJob
 from vian.core.data.computation import *
 from vian.core.container.screenshot import *
+from vian.core.container.thumbnail_store import ThumbnailStore, movie_fingerprint
+from vian.core.analysis.misc import FrameReader
 from vian.core.data.computation import frame2ms
 from vian.core.container.project import VIAN_PROJECT_EXTENSION
 
@@ -31,48 +35,64 @@ def create_screenshot(args, sign_progress):
 
     return shot
 
+
 class LoadScreenshotsJob(IConcurrentJob):
     """
     Loads the frame at the stored screenshot positions into memory to represent them.
-    It tries to load both, the annotated and the basic frame.
 
-    If the annotated fails, it will be reset to None.
+    The thumbnails are taken from the ThumbnailStore of the project if the movie has not changed,
+    the remaining screenshots are decoded in a single forward pass over the movie by a FrameReader,
+    sorted by frame position.
     """
 
     def run_concurrent(self, project, sign_progress):
         movie_path = project.movie_descriptor.get_movie_path()
-        video_capture = cv2.VideoCapture(movie_path)
-        fps = video_capture.get(cv2.CAP_PROP_FPS)
-
-        for i, scr in enumerate(project.screenshots):  # type: Screenshot
-
+        reader = FrameReader(movie_path, max_width=None)
+        fps = reader.get(cv2.CAP_PROP_FPS)
+        storage_size = (int(reader.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                        int(reader.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        # The size set_img_movie() resizes the frames to, before they are scaled to a thumbnail
+        display_size = storage_size
+        if project.movie_descriptor.display_width is not None and project.movie_descriptor.display_height is not None:
+            display_size = (project.movie_descriptor.display_width, project.movie_descriptor.display_height)
+
+        store = None
+        checksum = None
+        stored = dict()
+        if project.thumbnails_path != "" and os.path.isdir(os.path.split(project.thumbnails_path)[0]):
+            store = ThumbnailStore(project.thumbnails_path)
+            checksum = movie_fingerprint(movie_path)
+            stored = store.load(checksum, storage_size, display_size)
+
+        screenshots = sorted(project.screenshots, key=lambda s: s.frame_pos)  # type: List[Screenshot]
+        to_decode = []
+        for scr in screenshots:
+            scr.movie_timestamp = frame2ms(scr.frame_pos, fps)
+            thumbnail = stored.get(scr.frame_pos)
+            if thumbnail is not None:
+                scr.set_img_thumbnail(thumbnail, storage_size)
+            else:
+                to_decode.append(scr)
+
+        new_thumbnails = dict()
+        frame_pos, frame = -1, None
+        for i, scr in enumerate(to_decode):
             if self.aborted:
                 break
 
-            sign_progress(float(i) / len(project.screenshots))
-            video_capture.set(cv2.CAP_PROP_POS_FRAMES, scr.frame_pos)
-            scr.movie_timestamp = frame2ms(scr.frame_pos, fps)
-            ret, frame = video_capture.read()
-
-            # TODO this is related to the vian.core.containers.SVGAnnotation and AnnotationLayer and is no longer of any use
-            # a_dicts = []
-            # if scr.annotation_item_ids is not None:
-            #     for a_id in scr.annotation_item_ids:
-            #         annotation_dict = project.get_by_id(a_id)
-            #         if annotation_dict is not None:
-            #             a_dicts.append(annotation_dict.serialize())
-            # if len(a_dicts) > 0:
-            #     try:
-            #         annotation = render_annotations(frame, a_dicts[i])
-            #         if annotation is not None:
-            #             annotation = annotation.astype(np.uint8)
-            #     except:
-            #         annotation = None
-            # else:
-            #     annotation = None
+            sign_progress(float(i) / len(to_decode))
+            if scr.frame_pos != frame_pos:
+                frame = reader.read_raw(scr.frame_pos)
+                frame_pos = scr.frame_pos
 
             scr.set_img_movie(frame)
-            # scr.img_blend = annotation
+            if frame is not None and scr.img_movie is not None:
+                new_thumbnails[scr.frame_pos] = scr.img_movie
+
+        reader.release()
+
+        if store is not None and not self.aborted:
+            store.store(checksum, new_thumbnails, storage_size, display_size)
 
         return None
 
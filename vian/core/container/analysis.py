@@ -480,6 +480,22 @@ class ColormetryAnalysis(AnalysisContainer):
         except Exception as e:
             print("ColormetryAnalysis.append_data() raised ", str(e))
 
+    def append_block(self, block):
+        """
+        Stores a block of consecutive colorimetry entries as computed by ColormetryJob2.
+        """
+        try:
+            self.project.hdf5_manager.dump_colorimetry_block(block, self.end_idx)
+            done = self.project.hdf5_manager.get_colorimetry_done()
+            n_done = done.shape[0] if np.all(done) else int(np.argmin(done))
+
+            self.time_ms = self.project.hdf5_manager.get_colorimetry_times()[:n_done].tolist()
+            self.current_idx = max(n_done - 1, 0)
+            self.check_finished()
+
+        except Exception as e:
+            print("ColormetryAnalysis.append_block() raised ", str(e))
+
     def get_update(self, time_ms):
         try:
             frame_idx = int(np.floor(ms_to_frames(time_ms, self.project.movie_descriptor.fps) / self.resolution))
@@ -491,9 +507,9 @@ class ColormetryAnalysis(AnalysisContainer):
             spatial = self.project.hdf5_manager.get_colorimetry_spatial()
             times = self.project.hdf5_manager.get_colorimetry_times()
             layers = [
-                d[:, 1].astype(np.int),
+                d[:, 1].astype(int),
                 d[:, 2:5].astype(np.uint8),
-                d[:, 5].astype(np.int)
+                d[:, 5].astype(int)
             ]
             return dict(palette=layers,
                         histogram=hist,
@@ -2,13 +2,16 @@
 A VIAN Corpus is a class which represents a collection of VIAN Projects,
 all sharing a common template.
 
-
+The projects are not kept in memory, the corpus holds a CorpusProject handle for each of them,
+which only knows the summary of the project. The summaries are stored in the corpus file and are
+only read from a project file again if it has been modified.
 """
 import os
 import json
 
 from typing import Dict
 from shutil import rmtree
+from collections import namedtuple
 
 
 from PyQt6.QtCore import QObject, pyqtSignal
@@ -18,6 +21,85 @@ from .container_interfaces import IHasName
 from vian.core.data.log import log_error, log_warning, log_info
 from vian.core.data.enums import CORPUS
 
+ProjectMovieSummary = namedtuple("ProjectMovieSummary", ["movie_name", "movie_id", "movie_path", "meta_data"])
+
+
+def read_project_summary(path, uuid = None):
+    """
+    Reads the summary of a project from its file, without loading the project.
+
+    :param path: The path of the project file
+    :param uuid: The uuid of the project in the corpus, read from the file if None
+    :return: A dict as stored in CorpusProject.summary
+    """
+    with open(path, "r") as f:
+        serialization = json.load(f)
+
+    movie = serialization.get('movie_descriptor', dict())
+    stat = os.stat(path)
+    return dict(
+        uuid = uuid if uuid is not None else serialization.get('uuid'),
+        name = serialization.get('name'),
+        path = path,
+        movie_name = movie.get('movie_name'),
+        movie_id = movie.get('movie_id'),
+        movie_path = movie.get('movie_path'),
+        meta_data = movie.get('meta_data'),
+        mtime = stat.st_mtime,
+        size = stat.st_size
+    )
+
+
+def summarize_project(project:VIANProject):
+    """
+    Returns the summary of a loaded project, which has been stored to project.path.
+    """
+    stat = os.stat(project.path)
+    return dict(
+        uuid = project.uuid,
+        name = project.name,
+        path = project.path,
+        movie_name = project.movie_descriptor.movie_name,
+        movie_id = project.movie_descriptor.movie_id,
+        movie_path = project.movie_descriptor.movie_path,
+        meta_data = project.movie_descriptor.meta_data,
+        mtime = stat.st_mtime,
+        size = stat.st_size
+    )
+
+
+class CorpusProject:
+    """
+    A handle to a project of a corpus, exposing the summary of the project without loading it.
+
+    :var summary: A dict with the uuid, name, path and movie of the project
+    and the mtime and size of the project file the summary has been read from.
+    """
+    def __init__(self, summary):
+        self.summary = summary
+        self.uuid = summary['uuid']
+        self.name = summary['name']
+        self.path = summary['path']
+        self.folder = os.path.split(self.path)[0] + "/"
+        self.movie_descriptor = ProjectMovieSummary(summary['movie_name'], summary['movie_id'],
+                                                    summary['movie_path'], summary['meta_data'])
+
+    def is_up_to_date(self):
+        """
+        Returns True if the project file has not been modified since the summary has been read.
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return stat.st_mtime == self.summary['mtime'] and stat.st_size == self.summary['size']
+
+    def load(self) -> VIANProject:
+        """
+        Loads the project, the caller has to close() it when done.
+        """
+        return VIANProject().load_project(self.path)
+
 
 class Corpus(QObject, IHasName):
     onProjectAdded = pyqtSignal(object)
@@ -36,7 +118,7 @@ class Corpus(QObject, IHasName):
 
     def __init__(self, name="NewCorpus", directory="", file = None, template_movie_path = None):
         super(Corpus, self).__init__(None)
-        self.projects_loaded = dict()     # type: Dict[VIANProject.uuid:VIANProject]
+        self.projects_loaded = dict()     # type: Dict[VIANProject.uuid:CorpusProject]
         self.project_paths = dict()       # type: Dict[VIANProject.uuid:str]
         self.name = name
 
@@ -85,13 +167,14 @@ class Corpus(QObject, IHasName):
             for l in results:
                 log_info(l)
 
-            self.projects_loaded[project.uuid] = project
+            handle = CorpusProject(summarize_project(project))
+            self.projects_loaded[project.uuid] = handle
             self.project_paths[project.uuid] = project.path
-            self.onProjectAdded.emit(project)
+            self.onProjectAdded.emit(handle)
 
     def remove_project(self, project:VIANProject = None, file = None, delete_from_disk = False):
         """
-        Removes a project from the corpus, can either be given by VIANProject object or file.
+        Removes a project from the corpus, can either be given by VIANProject object, CorpusProject or file.
         :param project:
         :param file:
         :param delete_from_disk:
@@ -100,16 +183,15 @@ class Corpus(QObject, IHasName):
         if project is None and file is None:
             raise ValueError("Either project or file has to be given.")
         if project is None:
-            project = VIANProject().load_project(file)
+            project = CorpusProject(read_project_summary(file))
         if project.uuid in self.project_paths:
             self.project_paths.pop(project.uuid)
         if project.uuid in self.projects_loaded:
             self.projects_loaded.pop(project.uuid)
-        project.close()
+        if isinstance(project, VIANProject):
+            project.close()
 
-        print(self.projects_loaded, self.project_paths)
         if delete_from_disk:
-            project.close()
             pdir = project.folder
             try:
                 if os.path.isdir(pdir):
@@ -123,27 +205,50 @@ class Corpus(QObject, IHasName):
         self.template.apply_template(path, script_export=self.directory)
         self.onTemplateChanged.emit(self.template)
 
+    def iter_projects(self):
+        """
+        Loads the projects of the corpus one at a time, each project is closed before the next one is loaded.
+        Projects which have been stored meanwhile get their summary updated.
+        """
+        for uuid, handle in list(self.projects_loaded.items()):
+            project = handle.load()
+            if project is None:
+                continue
+            try:
+                yield project
+            finally:
+                project.close()
+                if not handle.is_up_to_date():
+                    self.projects_loaded[uuid] = CorpusProject(summarize_project(project))
+
     def apply_template_to_all(self):
         self.reload()
         t = self.template.get_template(True, True, True, True, True, True)
-        for uuid, p in self.projects_loaded.items():
+        for p in self.iter_projects():
             p.apply_template(template=t, merge=True)
             if p.path is not None:
                 p.store_project()
 
     def reload(self, project=None):
+        """
+        Updates the handles of all projects or the given one,
+        the summary of a project is only read again if its file has changed.
+        """
         if project is None:
-            for p in self.project_paths.values():
-                if os.path.isfile(p):
-                    project = VIANProject().load_project(p)
-                    self.projects_loaded[project.uuid] = project
+            to_reload = list(self.project_paths.items())
         else:
-            project = VIANProject().load_project(project.path)
-            self.projects_loaded[project.uuid] = project
-
-        # We don't want to keep the hdf5 files locked
-        for p in self.projects_loaded.values(): #type:VIANProject
-            p.hdf5_manager.on_close()
+            to_reload = [(project.uuid, project.path)]
+
+        for uuid, path in to_reload:
+            handle = self.projects_loaded.get(uuid)
+            if handle is not None and handle.path == path and handle.is_up_to_date():
+                continue
+            if not os.path.isfile(path):
+                continue
+            try:
+                self.projects_loaded[uuid] = CorpusProject(read_project_summary(path, uuid))
+            except Exception as e:
+                log_error("Could not read project", path, e)
 
     def get_name(self):
         return self.name
@@ -157,6 +262,7 @@ class Corpus(QObject, IHasName):
             name = self.name,
             template = self.template.store_project(return_dict=True),
             projects = self.project_paths,
+            summaries = dict([(uuid, p.summary) for uuid, p in self.projects_loaded.items()]),
             directory = self.directory,
             file = self.file
         )
@@ -170,6 +276,12 @@ class Corpus(QObject, IHasName):
         self.directory = serialization['directory']
         self.file = serialization['file']
 
+        self.projects_loaded = dict()
+        if 'summaries' in serialization:
+            for uuid, summary in serialization['summaries'].items():
+                if uuid in self.project_paths:
+                    self.projects_loaded[uuid] = CorpusProject(summary)
+
         self.reload()
         return self
 
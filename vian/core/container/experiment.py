@@ -1182,6 +1182,8 @@ class Experiment(BaseProjectEntity, IHasName):
             if container not in keyword.tagged_containers:
                 keyword.tagged_containers.append(container)
                 container._add_word(keyword)
+            if self.project is not None:
+                self.project.mark_dirty(self)
 
     def remove_tag(self, container: IClassifiable, keyword: UniqueKeyword):
         try:
@@ -1189,11 +1191,15 @@ class Experiment(BaseProjectEntity, IHasName):
             if container in keyword.tagged_containers:
                 keyword.tagged_containers.remove(container)
                 container._remove_word(keyword)
+            if self.project is not None:
+                self.project.mark_dirty(self)
         except Exception as e:
             log_error("Exception in remove_tag", e)
 
     def remove_all_tags_with_container(self, container):
         self.classification_results[:] = [tup for tup in self.classification_results if not tup[0] is container]
+        if self.project is not None:
+            self.project.mark_dirty(self)
 
     def emit_change(self):
         self.onExperimentChanged.emit(self)
@@ -0,0 +1,141 @@
+"""
+An index of tiny frame descriptors of a movie, used to find the frames matching imported stills
+without comparing each still to every frame of the movie.
+
+The index is stored in an HDF5 file of the project, in one group per movie named by the fingerprint of the movie file.
+"""
+
+import os
+
+import cv2
+import h5py
+import numpy as np
+
+from vian.core.data.log import log_error
+
+# Every FRAME_INDEX_STEP-th frame of the movie is indexed
+FRAME_INDEX_STEP = 10
+
+# The (width, height) a frame is reduced to for its descriptor
+FRAME_INDEX_SIZE = (16, 16)
+
+# The number of nearest index entries compared exactly to a still
+FRAME_INDEX_CANDIDATES = 8
+
+
+def frame_descriptor(img):
+    """
+    Returns the descriptor of an image, a tiny version of it as flat uint8 array.
+    """
+    return cv2.resize(img[:, :, :3], FRAME_INDEX_SIZE, interpolation=cv2.INTER_AREA).reshape(-1)
+
+
+class FrameIndex:
+    """
+    :var frame_pos: The indexed frame positions
+    :var descriptors: The descriptors of the indexed frames, one per row
+    """
+    def __init__(self, frame_pos, descriptors, step=FRAME_INDEX_STEP):
+        self.frame_pos = frame_pos
+        self.descriptors = descriptors
+        self.step = step
+
+    @staticmethod
+    def build(movie_path, step=FRAME_INDEX_STEP, sign_progress=None, is_aborted=None):
+        """
+        Decodes the movie once and computes the descriptor of every step-th frame.
+
+        :return: The FrameIndex or None if aborted
+        """
+        cap = cv2.VideoCapture(movie_path)
+        length = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        frame_pos = []
+        descriptors = []
+        idx = 0
+        while True:
+            if idx % step == 0:
+                if is_aborted is not None and is_aborted():
+                    return None
+                if sign_progress is not None and length > 0:
+                    sign_progress(min(idx / length, 1.0))
+
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frame_pos.append(idx)
+                descriptors.append(frame_descriptor(frame))
+
+            # Frames between the indexed ones are skipped without conversion
+            elif not cap.grab():
+                break
+            idx += 1
+
+        if len(descriptors) == 0:
+            return FrameIndex(np.zeros(0, dtype=np.int64),
+                              np.zeros((0, FRAME_INDEX_SIZE[0] * FRAME_INDEX_SIZE[1] * 3), dtype=np.uint8), step)
+        return FrameIndex(np.array(frame_pos, dtype=np.int64), np.array(descriptors, dtype=np.uint8), step)
+
+    @staticmethod
+    def load(path, checksum, step=FRAME_INDEX_STEP):
+        """
+        Returns the stored FrameIndex of a movie or None if there is no index with the given step.
+        """
+        if checksum is None or not os.path.isfile(path):
+            return None
+        try:
+            with h5py.File(path, "r") as f:
+                if checksum not in f:
+                    return None
+                grp = f[checksum]
+                if grp.attrs["step"] != step or grp["descriptors"].shape[1] != FRAME_INDEX_SIZE[0] * FRAME_INDEX_SIZE[1] * 3:
+                    return None
+                return FrameIndex(grp["frame_pos"][:], grp["descriptors"][:], step)
+        except Exception as e:
+            log_error("Could not read the frame index", path, e)
+            return None
+
+    def store(self, path, checksum):
+        if checksum is None:
+            return
+        try:
+            with h5py.File(path, "a") as f:
+                if checksum in f:
+                    del f[checksum]
+                grp = f.create_group(checksum)
+                grp.attrs["step"] = self.step
+                grp.create_dataset("frame_pos", data=self.frame_pos)
+                grp.create_dataset("descriptors", data=self.descriptors)
+        except Exception as e:
+            log_error("Could not write the frame index", path, e)
+
+    def query(self, imgs, start=None, end=None, k=FRAME_INDEX_CANDIDATES):
+        """
+        Returns the frame positions of the k nearest indexed frames for each image, nearest first.
+
+        :param imgs: A list of images
+        :param start: If given, only frames >= start are considered
+        :param end: If given, only frames < end are considered
+        :return: An array of shape (len(imgs), min(k, n_frames))
+        """
+        mask = np.ones(self.frame_pos.shape[0], dtype=bool)
+        if start is not None:
+            mask &= self.frame_pos >= start
+        if end is not None:
+            mask &= self.frame_pos < end
+        frame_pos = self.frame_pos[mask]
+        descriptors = self.descriptors[mask].astype(np.float32)
+
+        k = min(k, frame_pos.shape[0])
+        if k == 0:
+            return np.zeros((len(imgs), 0), dtype=np.int64)
+
+        query = np.array([frame_descriptor(img) for img in imgs], dtype=np.float32)
+
+        # Squared euclidean distance of each image to all descriptors
+        dist = (query ** 2).sum(axis=1)[:, np.newaxis] - 2 * query @ descriptors.T \
+               + (descriptors ** 2).sum(axis=1)[np.newaxis, :]
+
+        nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(dist, nearest, axis=1), axis=1)
+        return frame_pos[np.take_along_axis(nearest, order, axis=1)]
@@ -1,4 +1,7 @@
-from threading import Lock
+from threading import Lock, RLock
+from contextlib import contextmanager
+from collections import OrderedDict
+import time
 import h5py
 import os
 import gc
@@ -26,6 +29,11 @@ def get_all_analyses():
 
 
 DEFAULT_SIZE = (50,)
+GROWTH_FACTOR = 2
+BATCH_MAX_ROWS = 1000
+BATCH_MAX_DELAY = 5.0
+READ_CACHE_MAX_BYTES = 256 * 1024 ** 2
+COMPACT_MIN_FREE_RATIO = 0.2
 DS_MOVIE = "movie"
 DS_COL_HIST = "col_histograms"
 DS_COL_PAL = "col_palettes"
@@ -35,9 +43,14 @@ DS_COL_SPATIAL_EDGE = "col_spatial_edge"
 DS_COL_SPATIAL_COLOR = "col_spatial_color"
 DS_COL_SPATIAL_HUE = "col_spatial_hue"
 DS_COL_SPATIAL_LUMINANCE = "col_spatial_luminance"
+DS_COL_DONE = "col_done"
 
+# Palettes and histograms of the colorimetry are read in blocks of rows around the requested row
+COL_BLOCK_ROWS = 32
+COL_MAX_BLOCKS = 8
 
-HDF5_WRITE_LOCK = Lock()
+
+HDF5_WRITE_LOCK = RLock()
 HDF5_FILE_LOCK = Lock()
 
 def print_registered_analyses():
@@ -46,6 +59,58 @@ def print_registered_analyses():
         log_info("\t--- " + v.__name__)
 
 
+class HDF5ReadCache():
+    """
+    A least recently used cache of the arrays loaded from the HDF5 file, bounded by their size in bytes.
+    The cached arrays are read-only, since they are handed out to all callers.
+    """
+    def __init__(self, max_bytes=READ_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, arr):
+        arr = np.asarray(arr)
+        if arr.nbytes > self.max_bytes:
+            return arr
+        arr.setflags(write=False)
+        with self._lock:
+            if key in self._entries:
+                self.n_bytes -= self._entries.pop(key).nbytes
+            self._entries[key] = arr
+            self.n_bytes += arr.nbytes
+            while self.n_bytes > self.max_bytes:
+                k, v = self._entries.popitem(last=False)
+                self.n_bytes -= v.nbytes
+        return arr
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self.n_bytes -= self._entries.pop(key).nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.n_bytes = 0
+
+    def info(self):
+        return dict(hits=self.hits, misses=self.misses, n_entries=len(self._entries),
+                    n_bytes=self.n_bytes, max_bytes=self.max_bytes)
+
+
 class HDF5Manager():
     def __init__(self):
         self.path = None
@@ -53,6 +118,17 @@ class HDF5Manager():
         self._index = dict()
         self._uid_index = dict()
 
+        # Pending rows of an open write batch, unique_id -> (d, dataset_name)
+        self._batch = None
+        self._batch_depth = 0
+        self._batch_last_flush = 0.0
+
+        self.read_cache = HDF5ReadCache()
+
+        # Colorimetry, name -> whole (small) dataset and block index -> (palettes, histograms)
+        self._col_arrays = dict()
+        self._col_blocks = OrderedDict()
+
         #Cached
         self.col_edge_max = None
         self.col_hue_max = None
@@ -65,8 +141,9 @@ class HDF5Manager():
         init = False
         log_info("HDF5: ", self.path)
         if not os.path.isfile(self.path):
-            h5py.File(self.path, "w")
+            self._create_file(self.path).close()
             init = True
+        self._invalidate_colorimetry()
         self.h5_file = h5py.File(self.path, "r+")
         log_info("Datasets in HDF5 File:")
         for k in self.h5_file.keys():
@@ -76,6 +153,34 @@ class HDF5Manager():
                 del self.h5_file["ColorPalettes"]
         return init
 
+    @staticmethod
+    def _create_file(path):
+        """
+        Creates a new HDF5 file which persistently tracks its free space,
+        such that the space of deleted datasets is reused instead of requiring a compaction.
+        """
+        return h5py.File(path, "w", fs_strategy="fsm", fs_persist=True)
+
+    def tracks_free_space(self):
+        """
+        Returns True if the space of deleted datasets is reused by the file,
+        files created by older versions of VIAN do not track it across sessions.
+        """
+        try:
+            strategy, persist, threshold = self.h5_file.id.get_create_plist().get_file_space_strategy()
+            return bool(persist)
+        except Exception:
+            return False
+
+    def needs_compaction(self):
+        """
+        Returns True if the unused space exceeds COMPACT_MIN_FREE_RATIO of the file size.
+        """
+        size = os.path.getsize(self.path)
+        if size == 0:
+            return False
+        return self.h5_file.id.get_freespace() / size > COMPACT_MIN_FREE_RATIO
+
     def initialize_all(self, analyses = None):
         if analyses is None or len(analyses) == 0:
             analyses = ALL_REGISTERED_ANALYSES.values()
@@ -96,24 +201,97 @@ class HDF5Manager():
         for k, v in attrs.items():
             self.h5_file[name].attrs[k] = v
 
+    def _ensure_capacity(self, dataset_name, n_rows):
+        """
+        Grows the dataset geometrically such that it can hold at least n_rows.
+        """
+        ds = self.h5_file[dataset_name]
+        if ds.shape[0] < n_rows:
+            ds.resize((max(n_rows, int(ds.shape[0] * GROWTH_FACTOR)), ) + ds.shape[1:])
+
     def dump(self, d, dataset_name, unique_id):
         with HDF5_WRITE_LOCK:
             if self.h5_file is None:
                 raise IOError("HDF5 File not opened yet")
-            if dataset_name not in self.h5_file:
-                self.initialize_all()
-            if not dataset_name in self._index:
-                self._index[dataset_name] = 0
-
-            pos = self._index[dataset_name]
-            if pos > 0 and pos % DEFAULT_SIZE[0] == 0:
-                self.h5_file[dataset_name].resize((pos + DEFAULT_SIZE[0], ) + self.h5_file[dataset_name].shape[1:])
-            self.h5_file[dataset_name][pos] = d
-
-            self._uid_index[unique_id] = (dataset_name, pos)
-            self._index[dataset_name] += 1
+
+            if self._batch is not None:
+                self.read_cache.invalidate(str(unique_id))
+                self._batch[unique_id] = (d, dataset_name)
+                if len(self._batch) >= BATCH_MAX_ROWS \
+                        or time.time() - self._batch_last_flush > BATCH_MAX_DELAY:
+                    self._flush_batch()
+                return
+
+            self.dump_many([(d, dataset_name, unique_id)])
+
+    def dump_many(self, entries):
+        """
+        Writes a list of (d, dataset_name, unique_id) entries at once.
+        The rows of each dataset are written as one contiguous block and the file is flushed once.
+
+        :param entries: A list of tuples (d, dataset_name, unique_id)
+        """
+        with HDF5_WRITE_LOCK:
+            if self.h5_file is None:
+                raise IOError("HDF5 File not opened yet")
+
+            per_dataset = dict()
+            for d, dataset_name, unique_id in entries:
+                if dataset_name not in per_dataset:
+                    per_dataset[dataset_name] = []
+                per_dataset[dataset_name].append((d, unique_id))
+
+            for dataset_name, rows in per_dataset.items():
+                if dataset_name not in self.h5_file:
+                    self.initialize_all()
+                if not dataset_name in self._index:
+                    self._index[dataset_name] = 0
+
+                pos = self._index[dataset_name]
+                self._ensure_capacity(dataset_name, pos + len(rows))
+                ds = self.h5_file[dataset_name]
+                ds[pos:pos + len(rows)] = np.stack([np.asarray(d, dtype=ds.dtype) for d, uid in rows])
+
+                for i, (d, unique_id) in enumerate(rows):
+                    self._uid_index[unique_id] = (dataset_name, pos + i)
+                    self.read_cache.invalidate(str(unique_id))
+                self._index[dataset_name] += len(rows)
             self.h5_file.flush()
 
+    def _flush_batch(self):
+        with HDF5_WRITE_LOCK:
+            if self._batch is not None and len(self._batch) > 0:
+                self.dump_many([(d, dataset_name, unique_id)
+                                for unique_id, (d, dataset_name) in self._batch.items()])
+                self._batch = dict()
+            self._batch_last_flush = time.time()
+
+    @contextmanager
+    def write_batch(self):
+        """
+        Buffers all calls to dump() within the context and writes them in blocks,
+        once BATCH_MAX_ROWS are pending, BATCH_MAX_DELAY seconds have passed or the context is left.
+
+        *Example*:
+
+            with project.hdf5_manager.write_batch():
+                for r in results:
+                    project.add_analysis(r)
+        """
+        with HDF5_WRITE_LOCK:
+            if self._batch is None:
+                self._batch = dict()
+                self._batch_last_flush = time.time()
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with HDF5_WRITE_LOCK:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self._flush_batch()
+                    self._batch = None
+
     def dump_single(self, d, dataset_name, unique_id):
         with HDF5_WRITE_LOCK:
             if self.h5_file is None:
@@ -121,14 +299,20 @@ class HDF5Manager():
 
             self.initialize_dataset(unique_id, d.shape, d.dtype, dict(dataset_name=dataset_name))
             self.h5_file[unique_id][:] = d
+            self.read_cache.invalidate(str(unique_id))
             self.h5_file.flush()
 
     def load_single(self, unique_id):
         if self.h5_file is None:
             raise IOError("HDF5 File not opened yet")
-        return self.h5_file[unique_id]
+        res = self.read_cache.get(str(unique_id))
+        if res is None:
+            res = self.read_cache.put(str(unique_id), self.h5_file[unique_id][()])
+        return res
 
     def location_of(self, uuid):
+        if self._batch is not None and uuid in self._batch:
+            self._flush_batch()
         try:
             (dataset, pos) = self._uid_index[uuid]
             return dict(hdf5_dataset=dataset, hdf5_index = pos)
@@ -139,17 +323,32 @@ class HDF5Manager():
     def load(self, unique_id):
         if self.h5_file is None:
             raise IOError("HDF5 File not opened yet")
-        pos = self._uid_index[str(unique_id)]
-        res = self.h5_file[pos[0]][pos[1]]
+        if self._batch is not None and str(unique_id) in self._batch:
+            return self._batch[str(unique_id)][0]
+        res = self.read_cache.get(str(unique_id))
+        if res is None:
+            pos = self._uid_index[str(unique_id)]
+            res = self.read_cache.put(str(unique_id), self.h5_file[pos[0]][pos[1]])
         return res
 
+    def cache_info(self):
+        """
+        Returns the hit and miss counters and the size of the read cache.
+
+        :return: dict(hits, misses, n_entries, n_bytes, max_bytes)
+        """
+        return self.read_cache.info()
+
     def get_location(self, unique_id):
         if self.h5_file is None:
             raise IOError("HDF5 File not opened yet")
+        if self._batch is not None and str(unique_id) in self._batch:
+            self._flush_batch()
         pos = self._uid_index[str(unique_id)]
         return pos
 
     def set_indices(self, d):
+        self.read_cache.clear()
         for k, v in dict(d['curr_pos']).items():
             self._index[k] = v
 
@@ -173,14 +372,19 @@ class HDF5Manager():
                       DS_COL_SPATIAL_EDGE,
                       DS_COL_SPATIAL_LUMINANCE,
                       DS_COL_SPATIAL_HUE,
-                      DS_COL_SPATIAL_COLOR]:
+                      DS_COL_SPATIAL_COLOR,
+                      DS_COL_DONE]:
                 if n in self.h5_file:
                     del self.h5_file[n]
             self._index['col'] = 0
+            self._invalidate_colorimetry()
 
             gc.collect()
             self.h5_file.flush()
-            self.cleanup()
+
+            # The space of the deleted datasets is reused if the file tracks it
+            if not self.tracks_free_space():
+                self.cleanup()
 
         if DS_COL_HIST not in self.h5_file:
             self.h5_file.create_dataset(DS_COL_HIST, shape=(length, 16, 16, 16), dtype=np.float16)
@@ -199,6 +403,8 @@ class HDF5Manager():
             self.h5_file.create_dataset(DS_COL_SPATIAL_HUE, shape=(length, 2), dtype=np.float32)
         if DS_COL_SPATIAL_LUMINANCE not in self.h5_file:
             self.h5_file.create_dataset(DS_COL_SPATIAL_LUMINANCE, shape=(length, 2), dtype=np.float32)
+        if DS_COL_DONE not in self.h5_file:
+            self.h5_file.create_dataset(DS_COL_DONE, data=self.get_colorimetry_done(length).astype(np.uint8))
 
         self.h5_file.flush()
 
@@ -212,15 +418,76 @@ class HDF5Manager():
         self.h5_file[DS_COL_SPATIAL_COLOR][idx] = d['spatial_color']
         self.h5_file[DS_COL_SPATIAL_HUE][idx] = d['spatial_hue']
         self.h5_file[DS_COL_SPATIAL_LUMINANCE][idx] = d['spatial_luminance']
+        self.h5_file[DS_COL_DONE][idx] = 1
 
         self.h5_file.flush()
+        self._invalidate_colorimetry(idx, idx + 1)
+
+    def dump_colorimetry_block(self, block, length):
+        """
+        Writes a block of consecutive colorimetry entries and marks them as done.
+
+        :param block: A dict with the index of the first entry as idx and an array for each dataset
+        :param length: The total number of colorimetry entries
+        """
+        self.initialize_colorimetry(length, remove=False)
+        start = block['idx']
+        stop = start + len(block['time_ms'])
+        if stop == start:
+            return
+        with HDF5_WRITE_LOCK:
+            self.h5_file[DS_COL_PAL][start:stop] = block['palette']
+            self.h5_file[DS_COL_HIST][start:stop] = block['hist']
+            self.h5_file[DS_COL_FEAT][start:stop] = block['features']
+            self.h5_file[DS_COL_TIME][start:stop] = np.reshape(block['time_ms'], (stop - start, 1))
+            self.h5_file[DS_COL_SPATIAL_EDGE][start:stop] = block['spatial_edge']
+            self.h5_file[DS_COL_SPATIAL_COLOR][start:stop] = block['spatial_color']
+            self.h5_file[DS_COL_SPATIAL_HUE][start:stop] = block['spatial_hue']
+            self.h5_file[DS_COL_SPATIAL_LUMINANCE][start:stop] = block['spatial_luminance']
+
+            # The entries are only marked once all their data is written
+            self.h5_file.flush()
+            self.h5_file[DS_COL_DONE][start:stop] = 1
+            self.h5_file.flush()
+            self._invalidate_colorimetry(start, stop)
+
+    def get_colorimetry_done(self, length = None):
+        """
+        Returns a boolean array, which is True for each colorimetry entry that has been computed.
+        For files without done flags, all entries before the last stored time are considered done.
+        """
+        if DS_COL_DONE in self.h5_file:
+            return np.array(self.h5_file[DS_COL_DONE]).astype(bool)
+        if length is None:
+            length = self.h5_file[DS_COL_TIME].shape[0]
+        done = np.zeros(shape=length, dtype=np.uint8)
+        if DS_COL_TIME in self.h5_file:
+            done[:self.get_colorimetry_length() - 1] = 1
+        return done.astype(bool)
 
     def dump_audio(self, data):
-        self.initialize_dataset("audio", data.shape, data.dtype, dict(
-            title = "Audio Mono Channel",
-            description = "A sampled audio mono channel",
-        ))
-        self.h5_file["audio"][:] = data
+        self.dump_audio_stream([data], dtype=data.dtype)
+
+    def dump_audio_stream(self, chunks, dtype=np.float32):
+        """
+        Replaces the audio by the concatenation of the given chunks, which are written as they arrive.
+
+        :param chunks: An iterable of 1D sample arrays
+        """
+        with HDF5_WRITE_LOCK:
+            if "audio" in self.h5_file:
+                del self.h5_file["audio"]
+            self.initialize_dataset("audio", (0, ), dtype, dict(
+                title = "Audio Mono Channel",
+                description = "A sampled audio mono channel",
+            ))
+
+        ds = self.h5_file["audio"]
+        for c in chunks:
+            with HDF5_WRITE_LOCK:
+                n = ds.shape[0]
+                ds.resize((n + c.shape[0], ))
+                ds[n:] = c
         self.h5_file.flush()
 
     def get_audio(self):
@@ -229,27 +496,76 @@ class HDF5Manager():
         else:
             return None
 
+    def _invalidate_colorimetry(self, start = None, stop = None):
+        """
+        Drops the cached colorimetry, only the blocks overlapping [start, stop) if given.
+        """
+        with HDF5_WRITE_LOCK:
+            self._col_arrays.clear()
+            if start is None:
+                self._col_blocks.clear()
+            else:
+                for b in range(start // COL_BLOCK_ROWS, (stop - 1) // COL_BLOCK_ROWS + 1):
+                    self._col_blocks.pop(b, None)
+
+    def _col_array(self, name):
+        """
+        Returns a whole colorimetry dataset, which is read once and cached until the colorimetry changes.
+        These datasets only have a few values per entry.
+        """
+        with HDF5_WRITE_LOCK:
+            arr = self._col_arrays.get(name)
+            if arr is None:
+                arr = self.h5_file[name][()]
+                arr.setflags(write=False)
+                self._col_arrays[name] = arr
+            return arr
+
+    def _col_block(self, idx):
+        """
+        Returns the palettes and histograms of the block of rows containing idx.
+        """
+        b = idx // COL_BLOCK_ROWS
+        with HDF5_WRITE_LOCK:
+            block = self._col_blocks.get(b)
+            if block is None:
+                start = b * COL_BLOCK_ROWS
+                stop = start + COL_BLOCK_ROWS
+                block = (self.h5_file[DS_COL_PAL][start:stop], self.h5_file[DS_COL_HIST][start:stop])
+                for arr in block:
+                    arr.setflags(write=False)
+                self._col_blocks[b] = block
+                if len(self._col_blocks) > COL_MAX_BLOCKS:
+                    self._col_blocks.popitem(last=False)
+            else:
+                self._col_blocks.move_to_end(b)
+            return block
+
     def get_colorimetry_length(self):
-        return np.where(np.array(self.h5_file[DS_COL_TIME])> 0)[0].shape[0] + 1
+        return np.where(self._col_array(DS_COL_TIME) > 0)[0].shape[0] + 1
 
     def get_colorimetry_times(self):
-        t = np.reshape(self.h5_file[DS_COL_TIME], newshape=self.h5_file[DS_COL_TIME].shape[0])
-        return t
+        t = self._col_array(DS_COL_TIME)
+        return np.reshape(t, newshape=t.shape[0])
 
     def get_colorimetry_feat(self, idx = None):
         if idx is not None:
-            return self.h5_file[DS_COL_FEAT][idx]
+            return self._col_array(DS_COL_FEAT)[idx]
         else:
-            return self.h5_file[DS_COL_FEAT]
+            return self._col_array(DS_COL_FEAT)
 
     def get_colorimetry_pal(self, idx = None):
         if idx is not None:
-            return self.h5_file[DS_COL_PAL][idx]
+            if idx < 0:
+                idx += self.h5_file[DS_COL_PAL].shape[0]
+            return self._col_block(idx)[0][idx % COL_BLOCK_ROWS]
         else:
             return self.h5_file[DS_COL_PAL]
 
     def get_colorimetry_hist(self, idx):
-        return self.h5_file[DS_COL_HIST][idx]
+        if idx < 0:
+            idx += self.h5_file[DS_COL_HIST].shape[0]
+        return self._col_block(idx)[1][idx % COL_BLOCK_ROWS]
 
     def get_colorimetry_spatial_max(self):
         if self.h5_file is None:
@@ -267,15 +583,15 @@ class HDF5Manager():
 
     def get_colorimetry_spatial(self, idx = None):
         if idx is None:
-            col_edge =self.h5_file[DS_COL_SPATIAL_EDGE]
-            col_color = self.h5_file[DS_COL_SPATIAL_COLOR]
-            col_hue = self.h5_file[DS_COL_SPATIAL_HUE]
-            col_lum= self.h5_file[DS_COL_SPATIAL_LUMINANCE]
+            col_edge =self._col_array(DS_COL_SPATIAL_EDGE)
+            col_color = self._col_array(DS_COL_SPATIAL_COLOR)
+            col_hue = self._col_array(DS_COL_SPATIAL_HUE)
+            col_lum= self._col_array(DS_COL_SPATIAL_LUMINANCE)
         else:
-            col_edge =self.h5_file[DS_COL_SPATIAL_EDGE][idx]
-            col_color = self.h5_file[DS_COL_SPATIAL_COLOR][idx]
-            col_hue = self.h5_file[DS_COL_SPATIAL_HUE][idx]
-            col_lum= self.h5_file[DS_COL_SPATIAL_LUMINANCE][idx]
+            col_edge =self._col_array(DS_COL_SPATIAL_EDGE)[idx]
+            col_color = self._col_array(DS_COL_SPATIAL_COLOR)[idx]
+            col_hue = self._col_array(DS_COL_SPATIAL_HUE)[idx]
+            col_lum= self._col_array(DS_COL_SPATIAL_LUMINANCE)[idx]
 
         return dict(edge=col_edge,
                     color=col_color,
@@ -286,26 +602,52 @@ class HDF5Manager():
         return self.h5_file[DS_COL_HIST]
     # endregion
 
-    def cleanup(self):
+    def cleanup(self, progress_callback=None, force=False):
+        """
+        Compacts the HDF5 file by copying all datasets to a new file, which releases the space of deleted datasets.
+        The datasets are copied by the HDF5 library chunk by chunk, without loading them into memory.
+
+        The file is only rewritten if it contains enough unused space (see needs_compaction()) or force is True.
+
+        :param progress_callback: a function to signal the current Progress. usage: progress_callback(float E[0.0,..1.0])
+        :param force: if True, the file is rewritten regardless of its unused space
+        :return: True if the file has been rewritten
+        """
+        self._flush_batch()
+        self.read_cache.clear()
+        self._invalidate_colorimetry()
         with HDF5_FILE_LOCK:
-            new_file = h5py.File(self.path.replace("analyses", "temp"), mode="w")
-            for name in self.h5_file.keys():
-                ds = self.h5_file[name]
-                nds = new_file.create_dataset(name, ds.shape, ds.dtype, maxshape=(None, ) + ds.shape[1:], chunks = True)
-                nds[:] = ds[:]
+            self.h5_file.flush()
+            if not force and not self.needs_compaction():
+                return False
+
+            temp_path = self.path.replace("analyses", "temp")
+            new_file = self._create_file(temp_path)
+            names = list(self.h5_file.keys())
+            for i, name in enumerate(names):
+                self.h5_file.copy(self.h5_file[name], new_file, name=name)
+                if progress_callback is not None:
+                    progress_callback((i + 1) / len(names))
             new_file.close()
             self.h5_file.close()
             os.remove(self.path)
-            os.rename(self.path.replace("analyses", "temp"), self.path)
+            os.rename(temp_path, self.path)
             self.h5_file = h5py.File(self.path, "r+")
+        return True
 
     def get_indices(self):
+        self._flush_batch()
         return dict(curr_pos=self._index, uidmapping=self._uid_index)
 
     def on_close(self):
         if self.h5_file is None:
             return
 
+        self._flush_batch()
+        self._batch = None
+        self._batch_depth = 0
+        self.read_cache.clear()
+        self._invalidate_colorimetry()
         self.h5_file.close()
 
         self.col_edge_max = None
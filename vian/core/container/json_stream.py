@@ -0,0 +1,129 @@
+"""
+Streaming JSON output for the project file.
+
+The values of the project are encoded one at a time and written to a temporary file next to the target,
+which replaces the target once it has been written completely. Thus a save which fails while encoding
+or writing never corrupts the existing project file.
+
+If orjson is installed, it is used as encoder and numpy arrays and scalars are encoded natively,
+else the json module of the standard library is used.
+"""
+
+import os
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def numpy_default(obj):
+    """
+    Returns a json compliant value for numpy types the encoder does not handle itself.
+    """
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    elif isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, np.floating):
+        return float(obj)
+    elif isinstance(obj, np.complexfloating):
+        return {'real': float(obj.real), 'imag': float(obj.imag)}
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, np.void):
+        return None
+    raise TypeError("Object of type " + obj.__class__.__name__ + " is not JSON serializable")
+
+
+def encode_json(obj) -> bytes:
+    """
+    Encodes a value as utf-8 JSON.
+
+    With orjson, non-finite floats are encoded as null instead of NaN and Infinity,
+    which are not part of the JSON standard.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=numpy_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=numpy_default, check_circular=False).encode("utf-8")
+
+
+class JSONStreamWriter:
+    """
+    Writes a JSON object key by key to a temporary file and moves it to path when the context is left
+    without an exception.
+
+    *Example*:
+
+        with JSONStreamWriter(path) as writer:
+            writer.write_value("name", name)
+            writer.write_list("screenshots", (s.serialize() for s in screenshots))
+
+    :param path: The path of the file to write
+    """
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self._file = None
+        self._n_keys = 0
+
+    def __enter__(self):
+        self._file = open(self.tmp_path, "wb")
+        self._file.write(b"{")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                self._file.write(b"}")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+            self._file = None
+
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        elif os.path.isfile(self.tmp_path):
+            os.remove(self.tmp_path)
+        return False
+
+    def _write_key(self, key):
+        if self._n_keys > 0:
+            self._file.write(b",")
+        self._file.write(encode_json(key))
+        self._file.write(b":")
+        self._n_keys += 1
+
+    def write_value(self, key, value):
+        self._write_key(key)
+        self._file.write(encode_json(value))
+
+    def write_encoded(self, key, encoded: bytes):
+        """
+        Writes a value which has already been encoded by encode_json().
+        """
+        self._write_key(key)
+        self._file.write(encoded)
+
+    def write_list(self, key, values) -> bytes:
+        """
+        Encodes and writes the values of an iterable as JSON list, one at a time.
+
+        :return: The encoded list, which can be passed to write_encoded() to write it again
+        """
+        self._write_key(key)
+        self._file.write(b"[")
+        parts = []
+        for v in values:
+            encoded = encode_json(v)
+            if len(parts) > 0:
+                self._file.write(b",")
+            self._file.write(encoded)
+            parts.append(encoded)
+        self._file.write(b"]")
+        return b"[" + b",".join(parts) + b"]"
@@ -3,6 +3,7 @@ import shutil
 from shutil import copy2
 from typing import Union
 from threading import Lock
+from contextlib import contextmanager
 from uuid import uuid4
 
 from PyQt6.QtCore import QObject
@@ -23,6 +24,7 @@ from .experiment import *
 from .analysis import *
 from .media_objects import *
 from .node_scripts import *
+from .json_stream import JSONStreamWriter
 
 
 from typing import TYPE_CHECKING
@@ -33,6 +35,14 @@ if TYPE_CHECKING:
 # from vian.core.data.exporters import IExportDevice
 VIAN_PROJECT_EXTENSION = ".eext"
 
+# The keys of the entity lists in the project json, see VIANProject.get_entity_groups()
+PROJECT_ENTITY_GROUPS = ["annotation_layers", "screenshots", "segmentation", "analyses",
+                         "screenshot_groups", "scripts", "vocabularies", "experiments"]
+
+# Every INCREMENTAL_STORE_LIMIT-th incremental store serializes all groups,
+# such that a change which has not been signaled is not missed indefinitely
+INCREMENTAL_STORE_LIMIT = 10
+
 
 
 class VIANProject(QObject, IHasName, IClassifiable):
@@ -116,6 +126,7 @@ class VIANProject(QObject, IHasName, IClassifiable):
         IClassifiable.__init__(self)
         QObject.__init__(self)
         self.undo_manager = UndoRedoManager()
+        self.undo_manager.on_recorded.connect(self.on_undo_recorded)
         # self.streamer = main_window.project_streamer
         self.inhibit_dispatch = True
 
@@ -127,11 +138,19 @@ class VIANProject(QObject, IHasName, IClassifiable):
         self.shots_dir = ""
         self.export_dir = ""
         self.hdf5_path = ""
+        self.thumbnails_path = ""
+        self.frame_index_path = ""
 
         self.corpus_id = -1
         self.uuid = str(uuid4())
         self.id_list = dict()
 
+        # The entity groups changed since the last store and the encoded groups of the last store
+        self.dirty_groups = set(PROJECT_ENTITY_GROUPS)
+        self._store_cache = dict()
+        self._store_cache_path = None
+        self._n_incremental_stores = 0
+
         self.meta_data = dict()
 
         self.annotation_layers = []             # type: List[AnnotationLayer]
@@ -172,6 +191,10 @@ class VIANProject(QObject, IHasName, IClassifiable):
         self.inhibit_dispatch = False
         self.selected = []
         self.segment_screenshot_mapping = dict()
+
+        # Set within bulk_load(), the entities added are sorted once the bulk load has finished
+        self.bulk_loading = False
+        self.bulk_segmentations = set()
         self.headless_mode = False
 
         self.project_lock = Lock()
@@ -199,6 +222,8 @@ class VIANProject(QObject, IHasName, IClassifiable):
         self.shots_dir = root + "/shots"
         self.export_dir = root + "/export"
         self.hdf5_path = self.data_dir + "/analyses.hdf5"
+        self.thumbnails_path = self.data_dir + "/thumbnails.hdf5"
+        self.frame_index_path = self.data_dir + "/frame_index.hdf5"
 
     def create_file_structure(self):
         self.reset_file_paths(self.folder, self.path)
@@ -343,7 +368,7 @@ class VIANProject(QObject, IHasName, IClassifiable):
         self.segmentation.append(segmentation)
         segmentation.set_project(self)
 
-        if dispatch:
+        if dispatch and not self.bulk_loading:
             self.undo_manager.to_undo((self.add_segmentation, [segmentation]), (self.remove_segmentation, [segmentation]))
             self.dispatch_changed()
         self.onSegmentationAdded.emit(segmentation)
@@ -543,8 +568,9 @@ class VIANProject(QObject, IHasName, IClassifiable):
         if group == 0 and self.active_screenshot_group is not None and self.active_screenshot_group is not self.screenshot_groups[0]:
             self.active_screenshot_group.add_screenshots(screenshot)
 
-        self.sort_screenshots()
-        self.undo_manager.to_undo((self.add_screenshot, [screenshot]),(self.remove_screenshot, [screenshot]))
+        if not self.bulk_loading:
+            self.sort_screenshots()
+            self.undo_manager.to_undo((self.add_screenshot, [screenshot]),(self.remove_screenshot, [screenshot]))
 
         return screenshot
 
@@ -561,8 +587,9 @@ class VIANProject(QObject, IHasName, IClassifiable):
             for grp in self.screenshot_groups:
                 grp.screenshots.sort(key=lambda x: x.movie_timestamp, reverse=False)
 
-            for s in self.screenshots:
-                segment = s.update_scene_id(self.get_main_segmentation())
+            segments = self.get_main_segmentation().get_segments_of_times([s.movie_timestamp for s in self.screenshots])
+            for s, segment in zip(self.screenshots, segments):
+                s.scene_id = segment.ID if segment is not None else 0
                 if segment not in self.segment_screenshot_mapping:
                     self.segment_screenshot_mapping[segment] = []
                 self.segment_screenshot_mapping[segment].append(s)
@@ -707,7 +734,8 @@ class VIANProject(QObject, IHasName, IClassifiable):
                 self.global_analyses.pop(analysis.analysis_job_class)
             self.global_analyses[analysis.analysis_job_class] = analysis
 
-        self.undo_manager.to_undo((self.add_analysis, [analysis]), (self.remove_analysis, [analysis]))
+        if not self.bulk_loading:
+            self.undo_manager.to_undo((self.add_analysis, [analysis]), (self.remove_analysis, [analysis]))
 
         if dispatch:
             self.dispatch_changed()
@@ -1034,80 +1062,60 @@ class VIANProject(QObject, IHasName, IClassifiable):
     #endregion
 
     #region IO
-    def store_project(self, path = None, return_dict = False, bake=False):
+    def store_project(self, path = None, return_dict = False, bake=False, incremental=False):
         """
         Stores the project json to the given filepath.
         if no path is given, the default path is used.
 
+        The entities are serialized and written one at a time to a temporary file,
+        which replaces the project file once it has been written completely.
+
         :param str path:  The filepath to store the file
         :param bool bake:  if screenshots should be exported
         :param bool return_dict: if true, the project is returned as dict, else it is stored in the file path
+        :param bool incremental: if true, only the entity groups marked dirty since the last store are serialized,
+        the others are written as encoded during the last store. Changes which are not signaled through
+        the project (see mark_dirty()) are missed, hence this is meant for the autosave.
+        Every INCREMENTAL_STORE_LIMIT-th incremental store is a full store.
         :return: 
         """
         project = self
 
-        a_layer = []
-        screenshots = []
-        segmentations = []
-        analyses = []
-        screenshot_groups = []
-        scripts = []
-        experiments = []
-        vocabularies = []
-
-        for v in project.vocabularies:
-            vocabularies.append(v.serialize())
-
-        for a in project.annotation_layers:
-            a_layer.append(a.serialize())
-
-        for b in project.screenshots:
-            src, img = b.serialize(bake=bake)
-            screenshots.append(src)
-
-        for c in project.segmentation:
-            segmentations.append(c.serialize())
-
-        for d in project.analysis:
-            analyses.append(d.serialize(bake=bake))
-
-        for e in project.screenshot_groups:
-            screenshot_groups.append(e.serialize())
-
-        for f in project.node_scripts:
-            scripts.append(f.serialize())
-
-        for g in project.experiments:
-            experiments.append(g.serialize())
-
         if project.hdf5_manager is None:
             hdf_indices = self.hdf5_indices_loaded
         else:
             hdf_indices = project.hdf5_manager.get_indices()
 
-        data = dict(
-            path=project.path,
-            name=project.name,
-            corpus_id=project.corpus_id,
-            uuid = project.uuid,
-            annotation_layers=a_layer,
-            notes=project.notes,
-            main_segmentation_index=project.main_segmentation_index,
-            screenshots=screenshots,
-            segmentation=segmentations,
-            analyses=analyses,
-            movie_descriptor=project.movie_descriptor.serialize(),
-            version=version.__version__,
-            screenshot_groups=screenshot_groups,
-            scripts=scripts,
-            vocabularies=vocabularies,
-            experiments=experiments,
-            meta_data = project.meta_data,
-            hdf_indices = hdf_indices,
-            is_baked = bake
-        )
+        groups = self.get_entity_groups(bake=bake)
+        layout = [
+            ("path", project.path),
+            ("name", project.name),
+            ("corpus_id", project.corpus_id),
+            ("uuid", project.uuid),
+            ("annotation_layers", None),
+            ("notes", project.notes),
+            ("main_segmentation_index", project.main_segmentation_index),
+            ("screenshots", None),
+            ("segmentation", None),
+            ("analyses", None),
+            ("movie_descriptor", project.movie_descriptor.serialize()),
+            ("version", version.__version__),
+            ("screenshot_groups", None),
+            ("scripts", None),
+            ("vocabularies", None),
+            ("experiments", None),
+            ("meta_data", project.meta_data),
+            ("hdf_indices", hdf_indices),
+            ("is_baked", bake)
+        ]
 
         if return_dict:
+            data = dict()
+            for key, value in layout:
+                if key in groups:
+                    entities, serialize = groups[key]
+                    value = [serialize(e) for e in entities]
+                data[key] = value
             return data
         else:
             if path is None:
@@ -1117,55 +1125,126 @@ class VIANProject(QObject, IHasName, IClassifiable):
             numpy_path = path + "_scr"
             project_path = path + ".eext"
 
+            if not os.path.isdir(os.path.split(project_path)[0]):
+                os.makedirs(os.path.split(project_path)[0])
 
+            if bake:
+                filepath = f"{os.path.dirname(project_path)}/{self.name}_baked.eext"
+            else:
+                filepath = project_path
+
+            # The encoded groups can only be reused if they have been written to the same file unbaked
+            if bake or self._store_cache_path != filepath:
+                incremental = False
+            if incremental:
+                self._n_incremental_stores += 1
+                if self._n_incremental_stores >= INCREMENTAL_STORE_LIMIT:
+                    incremental = False
+            if not incremental:
+                self._n_incremental_stores = 0
+
+            store_cache = dict()
+            with JSONStreamWriter(filepath) as writer:
+                for key, value in layout:
+                    if key not in groups:
+                        writer.write_value(key, value)
+                    elif incremental and key not in self.dirty_groups and key in self._store_cache:
+                        store_cache[key] = self._store_cache[key]
+                        writer.write_encoded(key, store_cache[key])
+                    else:
+                        entities, serialize = groups[key]
+                        store_cache[key] = writer.write_list(key, (serialize(e) for e in entities))
 
-            try:
-                if not os.path.isdir(os.path.split(project_path)[0]):
-                    os.makedirs(os.path.split(project_path)[0])
-
-                if bake:
-                    filepath = f"{os.path.dirname(project_path)}/{self.name}_baked.eext"
-                else:
-                    filepath = project_path
-
-                # We generate the json before writing to the file
-                # to ensure we catch encoding errors without corrupting the current file
-                class NumpyEncoder(json.JSONEncoder):
-                    """ Custom encoder for numpy data types """
-
-                    def default(self, obj):
-                        if isinstance(obj, (np.int_, np.intc, np.intp, np.int8,
-                                            np.int16, np.int32, np.int64, np.uint8,
-                                            np.uint16, np.uint32, np.uint64)):
+            if not bake:
+                self._store_cache = store_cache
+                self._store_cache_path = filepath
+                self.dirty_groups = set()
 
-                            return int(obj)
+            log_info("Project Stored to", filepath)
+            return filepath
 
-                        elif isinstance(obj, (np.float_, np.float16, np.float32, np.float64)):
-                            return float(obj)
+    def get_entity_groups(self, bake=False):
+        """
+        Returns the entity lists stored in the project json.
 
-                        elif isinstance(obj, (np.complex_, np.complex64, np.complex128)):
-                            return {'real': obj.real, 'imag': obj.imag}
+        :return: A dict key: (entities, serialize function)
+        """
+        return dict(
+            annotation_layers=(self.annotation_layers, lambda a: a.serialize()),
+            screenshots=(self.screenshots, lambda b: b.serialize(bake=bake)[0]),
+            segmentation=(self.segmentation, lambda c: c.serialize()),
+            analyses=(self.analysis, lambda d: d.serialize(bake=bake)),
+            screenshot_groups=(self.screenshot_groups, lambda e: e.serialize()),
+            scripts=(self.node_scripts, lambda f: f.serialize()),
+            vocabularies=(self.vocabularies, lambda v: v.serialize()),
+            experiments=(self.experiments, lambda g: g.serialize())
+        )
 
-                        elif isinstance(obj, (np.ndarray,)):
-                            return obj.tolist()
+    def mark_dirty(self, item=None):
+        """
+        Marks the entity group of the given item as changed since the last store,
+        if no item is given or it does not belong to a group, all groups are marked.
+
+        This is called for each entity added to or removed from the id_list, for each change recorded
+        by the undo_manager, by dispatch_changed() and by the change signals of vocabularies and experiments.
+
+        :param item: The BaseProjectEntity which has changed
+        """
+        if isinstance(item, (Screenshot, ScreenshotGroup)):
+            # The screenshot groups refer to their screenshots
+            self.dirty_groups.update(["screenshots", "screenshot_groups"])
+        elif isinstance(item, (Segmentation, Segment)):
+            self.dirty_groups.add("segmentation")
+        elif isinstance(item, (AnnotationLayer, SVGAnnotation)):
+            self.dirty_groups.add("annotation_layers")
+        elif isinstance(item, AnalysisContainer):
+            self.dirty_groups.add("analyses")
+        elif isinstance(item, (NodeScript, NodeDescriptor, ConnectionDescriptor)):
+            self.dirty_groups.add("scripts")
+        elif isinstance(item, (Vocabulary, VocabularyWord)):
+            self.dirty_groups.add("vocabularies")
+        elif isinstance(item, (Experiment, ClassificationObject, UniqueKeyword)):
+            self.dirty_groups.add("experiments")
+        else:
+            self.dirty_groups.update(PROJECT_ENTITY_GROUPS)
 
-                        elif isinstance(obj, (np.bool_)):
-                            return bool(obj)
+    def on_undo_recorded(self, redo):
+        func, args = redo
+        item = getattr(func, "__self__", None)
 
-                        elif isinstance(obj, (np.void)):
-                            return None
+        # For changes made through the project, the entity is the first argument
+        if item is self and len(args) > 0:
+            item = args[0]
+        self.mark_dirty(item)
 
-                        return json.JSONEncoder.default(self, obj)
+    @contextmanager
+    def bulk_load(self):
+        """
+        Within the context, entities are added without dispatching, undo recording and sorting each of them,
+        once it is left, the segments and screenshots are sorted and assigned to each other once.
 
-                strf = json.dumps(data, cls=NumpyEncoder)
+        *Example*:
 
-                with open(filepath, 'w') as f:
-                    f.write(strf)
+            with project.bulk_load():
+                for s in screenshots:
+                    project.add_screenshot(s)
+        """
+        if self.bulk_loading:
+            yield self
+            return
 
-                return filepath
-            except Exception as e:
-                raise e
-        log_info("Project Stored to", path)
+        inhibit_dispatch = self.inhibit_dispatch
+        self.bulk_loading = True
+        self.inhibit_dispatch = True
+        try:
+            yield self
+        finally:
+            self.bulk_loading = False
+            self.inhibit_dispatch = inhibit_dispatch
+            for segmentation in self.bulk_segmentations:
+                segmentation.sort_segments()
+            self.bulk_segmentations = set()
+            self.sort_screenshots()
 
     def load_project(self, path=None, main_window = None, serialization = None, library=None, vocabulary_update_scheme = "cu"):
         """
@@ -1226,6 +1305,8 @@ class VIANProject(QObject, IHasName, IClassifiable):
         self.shots_dir = self.folder + "/shots/"
         self.data_dir = self.folder + "/data/"
         self.hdf5_path = self.data_dir + "analyses.hdf5"
+        self.thumbnails_path = self.data_dir + "thumbnails.hdf5"
+        self.frame_index_path = self.data_dir + "frame_index.hdf5"
 
         move_project_to_directory_project = False
         version = [0,0,0]
@@ -1292,106 +1373,107 @@ class VIANProject(QObject, IHasName, IClassifiable):
         self.current_annotation_layer = None
         self.movie_descriptor = MovieDescriptor(project=self).deserialize(my_dict['movie_descriptor'])
 
-        self.vocabularies = []
-        for v in my_dict['vocabularies']:
-            voc = Vocabulary("voc").deserialize(v, self)
-            self.add_vocabulary(voc)
+        with self.bulk_load():
+            self.vocabularies = []
+            for v in my_dict['vocabularies']:
+                voc = Vocabulary("voc").deserialize(v, self)
+                self.add_vocabulary(voc)
 
-        # If the vocabularies are merged by name, we have to update the unique ids in the keywords later
+            # If the vocabularies are merged by name, we have to update the unique ids in the keywords later
 
-        for a in my_dict['annotation_layers']:
-            new = AnnotationLayer().deserialize(a, self)
-            self.add_annotation_layer(new)
-
-        for i, b in enumerate(my_dict['screenshots']):
-            new = Screenshot().deserialize(b, self)
-            self.add_screenshot(new)
+            for a in my_dict['annotation_layers']:
+                new = AnnotationLayer().deserialize(a, self)
+                self.add_annotation_layer(new)
 
-        for c in my_dict['segmentation']:
-            new = Segmentation().deserialize(c, self)
-            self.add_segmentation(new)
+            for i, b in enumerate(my_dict['screenshots']):
+                new = Screenshot().deserialize(b, self)
+                self.add_screenshot(new)
 
-        try:
-            old = self.screenshot_groups
-            for o in old:
-                self.remove_screenshot_group(o)
-            self.screenshot_groups = []
+            for c in my_dict['segmentation']:
+                new = Segmentation().deserialize(c, self)
+                self.add_segmentation(new)
 
-            for e in my_dict['screenshot_groups']:
-                new = ScreenshotGroup(self).deserialize(e, self)
-                self.add_screenshot_group(group=new)
+            try:
+                old = self.screenshot_groups
+                for o in old:
+                    self.remove_screenshot_group(o)
+                self.screenshot_groups = []
 
-            self.active_screenshot_group = self.screenshot_groups[0]
-            self.screenshot_groups[0].is_current = True
+                for e in my_dict['screenshot_groups']:
+                    new = ScreenshotGroup(self).deserialize(e, self)
+                    self.add_screenshot_group(group=new)
 
-        except Exception as e:
-            self.screenshot_groups = old
-            # self.main_window.print_message("Loading Screenshot Group failed.", "Red")
-            print("Loading Vocabulary failed", e)
+                self.active_screenshot_group = self.screenshot_groups[0]
+                self.screenshot_groups[0].is_current = True
 
-        try:
-            old_script = self.node_scripts[0]
-            self.node_scripts = []
-
-            for f in my_dict['scripts']:
-                new = NodeScript().deserialize(f, self)
-                self.add_script(new)
+            except Exception as e:
+                self.screenshot_groups = old
+                # self.main_window.print_message("Loading Screenshot Group failed.", "Red")
+                print("Loading Vocabulary failed", e)
 
-            if len(self.node_scripts) == 0:
-                self.add_script(old_script)
-                self.current_script = old_script
-        except Exception as e:
-            print("Loading Node Scripts failed", e)
+            try:
+                old_script = self.node_scripts[0]
+                self.node_scripts = []
 
-        if library is not None:
-            self.sync_with_library(library, main_window=main_window, update_scheme=vocabulary_update_scheme)
+                for f in my_dict['scripts']:
+                    new = NodeScript().deserialize(f, self)
+                    self.add_script(new)
 
-        try:
-            for e in my_dict['experiments']:
-                new = Experiment().deserialize(e, self)
-                self.add_experiment(new)
+                if len(self.node_scripts) == 0:
+                    self.add_script(old_script)
+                    self.current_script = old_script
+            except Exception as e:
+                print("Loading Node Scripts failed", e)
 
-        except Exception as e:
-            print("Exception in Load Experiment", e)
-
-        # Renaming the old analyzes to analyses due to a typo
-        analyses_fix = "analyses"
-        if analyses_fix not in my_dict:
-            analyses_fix = "analyzes"
-        for d in my_dict[analyses_fix]:
-            if d is not None:
-                try:
-                    t = deprecation_serialization(d, ['vian_serialization_type', 'analysis_container_class'])
-                    new = eval(t)().deserialize(d, self)
+            if library is not None:
+                self.sync_with_library(library, main_window=main_window, update_scheme=vocabulary_update_scheme)
 
-                    if new is None:
-                        continue
+            try:
+                for e in my_dict['experiments']:
+                    new = Experiment().deserialize(e, self)
+                    self.add_experiment(new)
 
-                    if isinstance(new, ColormetryAnalysis):
-                        try:
-                            # If the Project is older than 0.6.0 we want to explicitly override the Colorimetry
-                            if int(version[1]) < 6:
-                                new = ColormetryAnalysis()
-                            self.colormetry_analysis = new
+            except Exception as e:
+                print("Exception in Load Experiment", e)
+
+            # Renaming the old analyzes to analyses due to a typo
+            analyses_fix = "analyses"
+            if analyses_fix not in my_dict:
+                analyses_fix = "analyzes"
+            for d in my_dict[analyses_fix]:
+                if d is not None:
+                    try:
+                        t = deprecation_serialization(d, ['vian_serialization_type', 'analysis_container_class'])
+                        new = eval(t)().deserialize(d, self)
+
+                        if new is None:
+                            continue
+
+                        if isinstance(new, ColormetryAnalysis):
+                            try:
+                                # If the Project is older than 0.6.0 we want to explicitly override the Colorimetry
+                                if int(version[1]) < 6:
+                                    new = ColormetryAnalysis()
+                                self.colormetry_analysis = new
+                                self.add_analysis(new)
+                                new.check_finished()
+                            except Exception as e:
+                                self.create_colormetry()
+                        else:
                             self.add_analysis(new)
-                            new.check_finished()
-                        except Exception as e:
-                            self.create_colormetry()
-                    else:
-                        self.add_analysis(new)
-                # IF the project is kept in memory only, this exception will be raised during the deserialization of
-                # the Colorimetry
-                except HDF5ManagerNotFoundException as e:
-                    log_error(e)
-                    continue
-                # If no colorimetry exists
-                except ColorimetryNotFoundException as e:
-                    self.create_colormetry()
-                    continue
-                except Exception as e:
-                    log_error(e)
-                    print("Exception in Load Analyses", str(e))
-                    continue
+                    # IF the project is kept in memory only, this exception will be raised during the deserialization of
+                    # the Colorimetry
+                    except HDF5ManagerNotFoundException as e:
+                        log_error(e)
+                        continue
+                    # If no colorimetry exists
+                    except ColorimetryNotFoundException as e:
+                        self.create_colormetry()
+                        continue
+                    except Exception as e:
+                        log_error(e)
+                        print("Exception in Load Analyses", str(e))
+                        continue
 
         # This is due to a bug which happened in 0.9.3
         # When a vocabulary was copied, only the vocabulary uuid changed but not the word uuids.
@@ -1413,7 +1495,6 @@ class VIANProject(QObject, IHasName, IClassifiable):
                 self.colormetry_analysis.clear()
         else:
             self.create_colormetry()
-        self.sort_screenshots()
         self.undo_manager.clear()
 
         if has_file:
@@ -1653,6 +1734,8 @@ class VIANProject(QObject, IHasName, IClassifiable):
             w.set_project(self)
 
         self.vocabularies.append(voc)
+        # Renaming a vocabulary or its words is not recorded by the undo_manager
+        voc.onVocabularyChanged.connect(self.mark_dirty)
 
         if dispatch:
             self.dispatch_changed()
@@ -1864,6 +1947,8 @@ class VIANProject(QObject, IHasName, IClassifiable):
 
         experiment.set_project(self)
         self.experiments.append(experiment)
+        # Includes the changes of its classification objects, which are not recorded by the undo_manager
+        experiment.onExperimentChanged.connect(self.mark_dirty)
 
         self.undo_manager.to_undo((self.add_experiment, [experiment]),
                                   (self.remove_experiment, [experiment]))
@@ -1951,18 +2036,35 @@ class VIANProject(QObject, IHasName, IClassifiable):
         # if self.hdf5_manager is not None:
         #     self.clean_hdf5()
 
-    def clean_hdf5(self, analyses = None):
+    def clean_hdf5(self, analyses = None, progress_callback = None):
         """
         Copies all analyses still relevant to a new HDF5 file.
         This is necessary since hdf5 files do not allow removal of single entries.
 
         :param analyses: Analyses to initialize.
+        :param progress_callback: a function to signal the current Progress. usage: progress_callback(float E[0.0,..1.0])
         :return:
         """
         new_h5 = HDF5Manager()
         new_h5.set_path(self.data_dir + "/clean_temp.hdf5")
         new_h5.initialize_all(analyses)
-        for a in self.analysis:
+        with new_h5.write_batch():
+            self._copy_analyses_to(new_h5, progress_callback)
+        indices = new_h5.get_indices()
+
+        self.hdf5_manager.h5_file.close()
+        new_h5.h5_file.close()
+        os.remove(self.hdf5_manager.path)
+        shutil.copy2(new_h5.path, self.hdf5_manager.path)
+        os.remove(new_h5.path)
+        self.hdf5_manager = HDF5Manager()
+        self.hdf5_manager.set_path(self.hdf5_path)
+        self.hdf5_manager.set_indices(indices)
+
+    def _copy_analyses_to(self, new_h5, progress_callback=None):
+        for i, a in enumerate(self.analysis):
+            if progress_callback is not None:
+                progress_callback(i / max(len(self.analysis), 1))
             try:
                 if isinstance(a, SemanticSegmentationAnalysisContainer):
                     if a.a_class is None:
@@ -1980,14 +2082,6 @@ class VIANProject(QObject, IHasName, IClassifiable):
                 print(e)
                 continue
 
-        self.hdf5_manager.h5_file.close()
-        new_h5.h5_file.close()
-        os.remove(self.hdf5_manager.path)
-        shutil.copy2(new_h5.path, self.hdf5_manager.path)
-        os.remove(new_h5.path)
-        self.hdf5_manager = HDF5Manager()
-        self.hdf5_manager.set_path(self.hdf5_path)
-
     def get_name(self):
         return self.name
 
@@ -2012,10 +2106,12 @@ class VIANProject(QObject, IHasName, IClassifiable):
 
     def add_to_id_list(self, container_object, item_id):
         self.id_list[item_id] = container_object
+        self.mark_dirty(container_object)
 
     def remove_from_id_list(self, container_object):
         if container_object.unique_id in self.id_list:
             self.id_list.pop(container_object.unique_id)
+        self.mark_dirty(container_object)
 
     def clean_id_list(self):
         new = dict()
@@ -2090,6 +2186,7 @@ class VIANProject(QObject, IHasName, IClassifiable):
 
     #region Dispatchers
     def dispatch_changed(self, receiver = None, item = None):
+        self.mark_dirty(item)
         if self.inhibit_dispatch is False:
             self.onProjectChanged.emit(receiver, item)
 
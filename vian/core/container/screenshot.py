@@ -236,6 +236,25 @@ class Screenshot(BaseProjectEntity, IHasName, ITimeRange, ISelectable, ITimeline
             elif img.shape[2] == 4:
                 self.onImageSet.emit(self, self.img_movie, numpy_to_pixmap(img, cvt=cv2.COLOR_BGRA2RGBA, with_alpha=True))
 
+    def set_img_thumbnail(self, thumbnail, storage_size):
+        """
+        Sets a thumbnail as previously computed by set_img_movie(), e.g. from the ThumbnailStore.
+
+        :param thumbnail: The image resized to the display aspect and the CACHE_WIDTH
+        :param storage_size: The (width, height) of the frame in the movie
+        """
+        self._preview_cache = None
+        self._masked_cache = dict()
+
+        if self.project is not None and self.project.headless_mode:
+            return
+
+        self._storage_width, self._storage_height = storage_size
+        self.img_movie = thumbnail
+
+        if self.receivers(self.onImageSet) > 0:
+            self.onImageSet.emit(self, self.img_movie, numpy_to_pixmap(thumbnail))
+
     def get_img_movie_orig_size(self):
         """
         Returns the screenshots image data in the original size.
@@ -400,6 +419,8 @@ class ScreenshotGroup(BaseProjectEntity, IHasName, ISelectable):
             s.screenshot_group = self
             self.onScreenshotAdded.emit(s)
             self.project.onScreenshotAdded.emit(s)
+        if self.project is not None:
+            self.project.mark_dirty(self)
         # self.dispatch_on_changed(item=self)
 
     def remove_screenshots(self, shots):
@@ -409,6 +430,8 @@ class ScreenshotGroup(BaseProjectEntity, IHasName, ISelectable):
             if s in self.screenshots:
                 self.screenshots.remove(s)
                 self.onScreenshotRemoved.emit(s)
+        if self.project is not None:
+            self.project.mark_dirty(self)
 
     def get_type(self):
         return SCREENSHOT_GROUP
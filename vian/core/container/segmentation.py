@@ -1,3 +1,6 @@
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
 import numpy as np
 
 from vian.core.container.media_objects import FileMediaObject, DataMediaObject
@@ -9,6 +12,104 @@ from PyQt6.QtCore import pyqtSignal
 from .annotation_body import AnnotationBody, Annotatable
 
 
+class SegmentIndex:
+    """
+    A sorted index over the segments of a Segmentation, answering point and range queries with bisect.
+
+    Point and range queries use the bounds of Segment.get_start() and Segment.get_end(). All queries
+    return the same segments as scanning the segments list would, if the list is not sorted by start,
+    they fall back to scanning it.
+
+    :param segments: The segments to index
+    """
+    def __init__(self, segments):
+        self.segments = list(segments)
+        self.raw_starts = [s.start for s in self.segments]
+        self.starts = [max(s, 0) for s in self.raw_starts]
+        self.ends = [max(s.end, s.start + 1) for s in self.segments]
+
+        # The maximal end of all segments up to each position, the first position where it exceeds a time
+        # is the first segment reaching over that time
+        self.max_ends = list(accumulate(self.ends, max))
+        self.is_sorted = all(a <= b for a, b in zip(self.raw_starts, self.raw_starts[1:]))
+
+    def __len__(self):
+        return len(self.segments)
+
+    def insert(self, position, segment):
+        """
+        Inserts a segment at position, as done in the segments list of the Segmentation.
+        """
+        start = segment.start
+        end = max(segment.end, segment.start + 1)
+        if self.is_sorted:
+            self.is_sorted = (position == 0 or self.raw_starts[position - 1] <= start) and \
+                             (position == len(self.segments) or start <= self.raw_starts[position])
+
+        self.segments.insert(position, segment)
+        self.raw_starts.insert(position, start)
+        self.starts.insert(position, max(start, 0))
+        self.ends.insert(position, end)
+
+        previous = self.max_ends[position - 1] if position > 0 else end
+        self.max_ends.insert(position, max(previous, end))
+        # The following maxima only change up to the first one exceeding the new end
+        for i in range(position + 1, len(self.max_ends)):
+            if self.max_ends[i] >= end:
+                break
+            self.max_ends[i] = end
+
+    def segment_at(self, time_ms):
+        """
+        Returns the first segment containing time_ms or None.
+        """
+        if not self.is_sorted:
+            for s, start, end in zip(self.segments, self.starts, self.ends):
+                if start <= time_ms < end:
+                    return s
+            return None
+
+        i = bisect_right(self.max_ends, time_ms)
+        if i < len(self.segments) and self.starts[i] <= time_ms:
+            return self.segments[i]
+        return None
+
+    def segments_in_range(self, start, end):
+        """
+        Returns all segments overlapping the time range [start, end).
+        """
+        if not self.is_sorted:
+            return [s for s, s0, s1 in zip(self.segments, self.starts, self.ends) if s0 < end and s1 > start]
+
+        lo = bisect_right(self.max_ends, start)
+        hi = bisect_left(self.starts, end)
+        return [self.segments[i] for i in range(lo, hi) if self.ends[i] > start]
+
+    def last_starting_before(self, time_ms):
+        """
+        Returns the position of the last segment with a start < time_ms or -1.
+        """
+        if not self.is_sorted:
+            result = -1
+            for i, s in enumerate(self.raw_starts):
+                if s < time_ms:
+                    result = i
+            return result
+        return bisect_left(self.raw_starts, time_ms) - 1
+
+    def first_starting_after(self, time_ms):
+        """
+        Returns the position of the first segment with a start > time_ms or -1.
+        """
+        if not self.is_sorted:
+            for i, s in enumerate(self.raw_starts):
+                if s > time_ms:
+                    return i
+            return -1
+        i = bisect_right(self.raw_starts, time_ms)
+        return i if i < len(self.segments) else -1
+
+
 class Segmentation(BaseProjectEntity, IHasName, ISelectable, ITimelineItem, ILockable, AutomatedTextSource):
     """
     :var name: The Name of the Segmentation
@@ -42,19 +143,65 @@ class Segmentation(BaseProjectEntity, IHasName, ISelectable, ITimelineItem, ILoc
         self.timeline_visibility = True
         self.strip_height = -1
 
+        # Built on demand by get_segment_index()
+        self._segment_index = None
+
         for s in self.segments:
             s.segmentation = self
 
+    def get_segment_index(self) -> SegmentIndex:
+        """
+        Returns the SegmentIndex of the segments, it is rebuilt if the segments have changed since.
+        """
+        if self._segment_index is None or len(self._segment_index) != len(self.segments):
+            self._segment_index = SegmentIndex(self.segments)
+        return self._segment_index
+
+    def invalidate_segment_index(self):
+        """
+        Has to be called whenever segments are added, removed or their start or end changes.
+        """
+        self._segment_index = None
+
     def get_segment_of_time(self, time_ms):
         """
         Returns a Segment containing the given time ms, if none exists returns None
         :param time_ms:
         :return:
         """
+        return self.get_segment_index().segment_at(time_ms)
+
+    def get_segments_of_times(self, times):
+        """
+        Returns the result of get_segment_of_time() for each of the given times.
+
+        :param times: A list of times in ms
+        :return: A list of Segments or None, in the order of times
+        """
+        if len(times) == 0:
+            return []
+        index = self.get_segment_index()
+        return [index.segment_at(t) for t in times]
+
+    def get_segments_in_range(self, start, end):
+        """
+        Returns all Segments overlapping the time range [start, end) in ms.
+        """
+        return self.get_segment_index().segments_in_range(start, end)
+
+    def get_overlapping_segments(self, other):
+        """
+        Returns the pairs of overlapping segments of this and another Segmentation.
+
+        :param other: A Segmentation
+        :return: A list of tuples (segment, other_segment)
+        """
+        index = other.get_segment_index()
+        result = []
         for s in self.segments:
-            if s.get_start() <= time_ms < s.get_end():
-                return s
-        return None
+            for o in index.segments_in_range(s.get_start(), s.get_end()):
+                result.append((s, o))
+        return result
 
     def create_segment2(self, start, stop, mode:SegmentCreationMode = SegmentCreationMode.BACKWARD,
                         body = "",
@@ -62,11 +209,10 @@ class Segmentation(BaseProjectEntity, IHasName, ISelectable, ITimelineItem, ILoc
                         inhibit_overlap = True, minimal_length = 5, unique_id = -1):
 
         # If the Segment is smaller than the minimal_length, don't do anything
+        index = self.get_segment_index()
         if mode == SegmentCreationMode.BACKWARD:
-            last = None
-            for i, s in enumerate(self.segments):
-                if s.start < start:
-                    last = s
+            i = index.last_starting_before(start)
+            last = self.segments[i] if i >= 0 else None
             if last is not None:
                 start = last.end
             else:
@@ -76,13 +222,19 @@ class Segmentation(BaseProjectEntity, IHasName, ISelectable, ITimelineItem, ILoc
         elif mode == SegmentCreationMode.FORWARD:
             next = None
             last = None
-            for s in self.segments:
-                if s.start < start:
-                    last = s
-                if s.start > start and next is None:
-                    next = s
-                if last is not None and next is not None:
-                    break
+            if index.is_sorted:
+                i = index.last_starting_before(start)
+                last = self.segments[i] if i >= 0 else None
+                i = index.first_starting_after(start)
+                next = self.segments[i] if i >= 0 else None
+            else:
+                for s in self.segments:
+                    if s.start < start:
+                        last = s
+                    if s.start > start and next is None:
+                        next = s
+                    if last is not None and next is not None:
+                        break
 
             if next is None:
                 stop = self.project.movie_descriptor.duration
@@ -96,13 +248,11 @@ class Segmentation(BaseProjectEntity, IHasName, ISelectable, ITimelineItem, ILoc
             if inhibit_overlap:
                 last = None
                 next = None
-                for i, s in enumerate(self.segments):
-                    if s.start < start:
-                        last = s
-                        if len(self.segments) > i + 1:
-                            next = self.segments[i + 1]
-                        else:
-                            next = None
+                i = index.last_starting_before(start)
+                if i >= 0:
+                    last = self.segments[i]
+                    if len(self.segments) > i + 1:
+                        next = self.segments[i + 1]
 
                 if last is not None and last.end > start:
                     start = last.end
@@ -131,17 +281,21 @@ class Segmentation(BaseProjectEntity, IHasName, ISelectable, ITimelineItem, ILoc
         if self.project is not None:
             segment.set_project(self.project)
 
-        if len(self.segments) == 0:
+        # During a bulk load, the segments are sorted and the screenshots assigned once it has finished
+        if self.project is not None and self.project.bulk_loading:
             self.segments.append(segment)
-        else:
-            for i, s in enumerate(self.segments):
-                if s.start > segment.start:
-                    self.segments.insert(i, segment)
-                    break
+            self.invalidate_segment_index()
+            self.project.bulk_segmentations.add(self)
+            self.onSegmentAdded.emit(segment)
+            self.project.onSegmentAdded.emit(segment)
+            return
 
-                if i == len(self.segments) - 1:
-                    self.segments.append(segment)
-                    break
+        index = self.get_segment_index()
+        i = index.first_starting_after(segment.start)
+        if i < 0:
+            i = len(self.segments)
+        self.segments.insert(i, segment)
+        index.insert(i, segment)
 
         self.update_segment_ids()
         self.project.sort_screenshots()
@@ -156,6 +310,7 @@ class Segmentation(BaseProjectEntity, IHasName, ISelectable, ITimelineItem, ILoc
         import time
         t = time.time()
         self.segments.remove(segment)
+        self.invalidate_segment_index()
 
         print("Remove Segment", time.time() - t)
         t = time.time()
@@ -183,6 +338,7 @@ class Segmentation(BaseProjectEntity, IHasName, ISelectable, ITimelineItem, ILoc
         if segm in self.segments:
             old_end = segm.get_end()
             segm.end = time
+            self.invalidate_segment_index()
             # new = self.create_segment(time, old_end)
             new = self.create_segment2(time, old_end, mode=SegmentCreationMode.INTERVAL, dispatch=False)
             self.project.undo_manager.to_undo((self.cut_segment, [segm, time]), (self.merge_segments, [segm, new]))
@@ -223,6 +379,14 @@ class Segmentation(BaseProjectEntity, IHasName, ISelectable, ITimelineItem, ILoc
             self.project.undo_manager.to_undo((self.merge_segments, [a, b]), (self.cut_segment, [segm, cut_t]))
             self.dispatch_on_changed()
 
+    def sort_segments(self):
+        """
+        Sorts the segments by their start, segments with equal starts keep their order.
+        """
+        self.segments.sort(key=lambda x: x.start)
+        self.invalidate_segment_index()
+        self.update_segment_ids()
+
     def update_segment_ids(self):
         for i, s in enumerate(self.segments):
             s.ID = i + 1
@@ -242,6 +406,7 @@ class Segmentation(BaseProjectEntity, IHasName, ISelectable, ITimelineItem, ILoc
                 center = int(round((start + end) / 2, 0))
                 s.end = center
                 self.segments[i + 1].start = center
+        self.invalidate_segment_index()
 
         self.dispatch_on_changed()
 
@@ -280,6 +445,7 @@ class Segmentation(BaseProjectEntity, IHasName, ISelectable, ITimelineItem, ILoc
             new.deserialize(s, self.project)
             new.segmentation = self
             self.segments.append(new)
+        self.invalidate_segment_index()
 
         if 'locked' in serialization:
             self.locked = serialization['locked']
@@ -408,6 +574,7 @@ class Segment(BaseProjectEntity, ITimeRange, IHasName, ISelectable, ITimelineIte
             start = self.end - self.MIN_SIZE
         self.project.undo_manager.to_undo((self.set_start, [start]), (self.set_start, [self.start]))
         self.start = start
+        self.segmentation.invalidate_segment_index()
         self.segmentation.update_segment_ids()
         self.project.sort_screenshots()
 
@@ -427,6 +594,7 @@ class Segment(BaseProjectEntity, ITimeRange, IHasName, ISelectable, ITimelineIte
         self.delete_analyses()
 
         self.end = end
+        self.segmentation.invalidate_segment_index()
         self.segmentation.update_segment_ids()
         self.project.sort_screenshots()
         self.onSegmentChanged.emit(self)
@@ -442,6 +610,8 @@ class Segment(BaseProjectEntity, ITimeRange, IHasName, ISelectable, ITimelineIte
         self.project.undo_manager.to_undo((self.move, [start, end]), (self.move, [self.start, self.end]))
         self.start = start
         self.end = end
+        if self.segmentation is not None:
+            self.segmentation.invalidate_segment_index()
 
         # Since the region has changed, we delete the analysis
         self.delete_analyses()
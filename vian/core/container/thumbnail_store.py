@@ -0,0 +1,128 @@
+"""
+A per-project store of the screenshot thumbnails, such that re-opening a project
+does not have to decode the movie at each screenshot position.
+
+The thumbnails are kept in an HDF5 file, in one group per movie, named by the fingerprint of the movie file.
+"""
+
+import os
+import hashlib
+
+import h5py
+import numpy as np
+
+from vian.core.data.log import log_error
+
+# The number of bytes read from the beginning and the end of the movie for its fingerprint
+FINGERPRINT_BLOCK_SIZE = 1024 * 1024
+
+
+def movie_fingerprint(movie_path):
+    """
+    Returns a checksum of the movie file.
+
+    Hashing a full movie takes minutes, hence only the size and the first and last
+    FINGERPRINT_BLOCK_SIZE bytes are hashed, which changes if the movie is replaced or re-encoded.
+
+    :param movie_path: The path to the movie
+    :return: The hex digest or None if the movie does not exist
+    """
+    if movie_path is None or not os.path.isfile(movie_path):
+        return None
+
+    size = os.path.getsize(movie_path)
+    md5 = hashlib.md5(str(size).encode())
+    with open(movie_path, "rb") as f:
+        md5.update(f.read(FINGERPRINT_BLOCK_SIZE))
+        if size > FINGERPRINT_BLOCK_SIZE:
+            f.seek(max(FINGERPRINT_BLOCK_SIZE, size - FINGERPRINT_BLOCK_SIZE))
+            md5.update(f.read(FINGERPRINT_BLOCK_SIZE))
+    return md5.hexdigest()
+
+
+class ThumbnailStore:
+    """
+    Stores the thumbnails of a movie by frame position.
+
+    All thumbnails of a movie have the same storage and display size, if either changes (e.g. because the
+    display size of the movie has been edited), the stored thumbnails of the movie are discarded.
+
+    :param path: The path of the HDF5 file
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, checksum, storage_size, display_size):
+        """
+        Returns a dict frame_pos: thumbnail of the stored thumbnails of the movie.
+
+        :param storage_size: The (width, height) of the frames in the movie
+        :param display_size: The (width, height) the frames are resized to before they are scaled to a thumbnail
+        :return: The thumbnails or an empty dict if they have been stored for another storage or display size
+        """
+        if checksum is None or not os.path.isfile(self.path):
+            return dict()
+        try:
+            with h5py.File(self.path, "r") as f:
+                if checksum not in f:
+                    return dict()
+                grp = f[checksum]
+                if not self._matches(grp, storage_size, display_size):
+                    return dict()
+                frame_pos = grp["frame_pos"][:]
+                images = grp["images"][:]
+        except Exception as e:
+            log_error("Could not read the thumbnail store", self.path, e)
+            return dict()
+
+        return dict((int(p), img) for p, img in zip(frame_pos, images))
+
+    def store(self, checksum, thumbnails, storage_size, display_size):
+        """
+        Adds thumbnails to the store.
+
+        :param checksum: The fingerprint of the movie as returned by movie_fingerprint()
+        :param thumbnails: A dict frame_pos: thumbnail
+        :param storage_size: The (width, height) of the frames in the movie
+        :param display_size: The (width, height) the frames have been resized to before they were scaled
+        """
+        if checksum is None or len(thumbnails) == 0:
+            return
+
+        frame_pos = np.array(list(thumbnails.keys()), dtype=np.int64)
+        images = np.array(list(thumbnails.values()), dtype=np.uint8)
+        try:
+            with h5py.File(self.path, "a") as f:
+                if checksum in f:
+                    grp = f[checksum]
+                    if grp["images"].shape[1:] != images.shape[1:] \
+                            or not self._matches(grp, storage_size, display_size):
+                        del f[checksum]
+
+                if checksum not in f:
+                    grp = f.create_group(checksum)
+                    grp.attrs["storage_size"] = np.array(storage_size, dtype=np.int64)
+                    grp.attrs["display_size"] = np.array(display_size, dtype=np.int64)
+                    grp.create_dataset("frame_pos", shape=(0,), maxshape=(None,), dtype=np.int64)
+                    grp.create_dataset("images", shape=(0,) + images.shape[1:], maxshape=(None,) + images.shape[1:],
+                                       chunks=(1,) + images.shape[1:], dtype=np.uint8)
+
+                grp = f[checksum]
+                known = np.isin(frame_pos, grp["frame_pos"][:])
+                frame_pos, images = frame_pos[~known], images[~known]
+
+                n = grp["frame_pos"].shape[0]
+                grp["frame_pos"].resize((n + frame_pos.shape[0],))
+                grp["images"].resize((n + frame_pos.shape[0],) + images.shape[1:])
+                grp["frame_pos"][n:] = frame_pos
+                grp["images"][n:] = images
+        except Exception as e:
+            log_error("Could not write the thumbnail store", self.path, e)
+
+    @staticmethod
+    def _matches(grp, storage_size, display_size):
+        # Stores written before the display size has been recorded are discarded
+        if "display_size" not in grp.attrs:
+            return False
+        return tuple(grp.attrs["storage_size"].tolist()) == tuple(storage_size) \
+            and tuple(grp.attrs["display_size"].tolist()) == tuple(display_size)
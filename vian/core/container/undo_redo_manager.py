@@ -3,6 +3,9 @@ from PyQt6.QtCore import QObject, pyqtSignal
 class UndoRedoManager(QObject):
     on_changed = pyqtSignal()
 
+    # Emitted with the redo (function, args) of each recorded change
+    on_recorded = pyqtSignal(object)
+
     def __init__(self):
         super(UndoRedoManager, self).__init__()
         self.undo_stack = []
@@ -30,6 +33,7 @@ class UndoRedoManager(QObject):
         else:
             self.clear_redo()
             self.undo_stack.append((redo, undo))
+        self.on_recorded.emit(redo)
         self.on_changed.emit()
 
     def to_redo(self, redo, undo):
@@ -5,9 +5,9 @@ moviepy.
 
 import sys
 import os
-import librosa
 import numpy as np
-from vian.core.misc.ffmpeg_executor import ffmpeg_convert
+from vian.core.misc.ffmpeg_executor import ffmpeg_convert, ffmpeg_read_audio
+from vian.core.analysis.audio.audio_features import AUDIO_SAMPLE_RATE
 from moviepy.editor import *
 from typing import List, Tuple
 from PyQt6.QtCore import QObject, pyqtSlot, pyqtSignal
@@ -80,8 +80,8 @@ class AudioHandler(QObject):
                            callback=self.on_extraction_progress)
 
         print("Storing Audio in HDF5")
-        y, sr = librosa.load(project_audio_path)
-        self.project.hdf5_manager.dump_audio(y)
+        # The samples are streamed into the HDF5 file, the audio of a movie does not fit into memory
+        self.project.hdf5_manager.dump_audio_stream(ffmpeg_read_audio(project_audio_path, sample_rate=AUDIO_SAMPLE_RATE))
         print("Audio Ready")
         self.audioExtractingEnded.emit()
 
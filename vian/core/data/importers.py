@@ -18,6 +18,9 @@ from vian.core.container.project import *
 from vian.core.visualization.feature_plot import *
 from vian.core.visualization.image_plots import *
 from vian.core.data.csv_helper import CSVFile
+from vian.core.container.frame_index import FrameIndex, FRAME_INDEX_CANDIDATES
+from vian.core.container.thumbnail_store import movie_fingerprint
+from vian.core.analysis.misc import FrameReader
 
 class ImportDevice:
     def import_(self, project, path):
@@ -165,9 +168,15 @@ class ELANProjectImporter():
         return movie_path, segmentations
 
 
+# The shares of the import progress taken by building the FrameIndex, and within matching by decoding the candidates
+FRAME_INDEX_PROGRESS = 0.5
+CANDIDATES_PROGRESS = 0.8
+
+
 class ScreenshotImporter(IConcurrentJob):
     def __init__(self, args):
         super(ScreenshotImporter, self).__init__(args=args)
+        self.frame_index = None
 
     def run_concurrent(self, args, sign_progress):
         mode = args['mode']
@@ -176,12 +185,23 @@ class ScreenshotImporter(IConcurrentJob):
         segment_ids = args['segment_ids']
         segment_ranges = args['segment_ranges']
         timestamps = args['timestamps']
+        index_path = args.get('index_path')
 
         if mode == 0:
             return self.mode_time(movie_path, timestamps, scr_paths, sign_progress)
 
-        elif mode == 1:
+        # The FrameIndex is built once for all stills, matching them reports the remaining progress
+        if self.get_frame_index(movie_path, index_path, lambda p: sign_progress(p * FRAME_INDEX_PROGRESS)) is None:
+            return "aborted"
+
+        def match_progress(first, n):
+            # Maps the progress of matching n stills, starting with the first-th, onto the whole import
+            return lambda p: sign_progress(FRAME_INDEX_PROGRESS + (1.0 - FRAME_INDEX_PROGRESS)
+                                           * (first + p * n) / max(len(scr_paths), 1))
+
+        if mode == 1:
             result = []
+            n_matched = 0
             for u in np.unique(np.array(segment_ids)).tolist():
                 indices = np.where(np.array(segment_ids) == u)[0]
                 p_paths = []
@@ -189,18 +209,23 @@ class ScreenshotImporter(IConcurrentJob):
                     if i in indices:
                         p_paths.append(p)
                 try:
-                    result.extend(self.mode_complete(movie_path,
-                                                     p_paths,
-                                                sign_progress,
-                                                segment_ranges[u][0],
-                                                segment_ranges[u][1]))
+                    r = self.mode_complete(movie_path,
+                                           p_paths,
+                                           match_progress(n_matched, len(p_paths)),
+                                           segment_ranges[u][0],
+                                           segment_ranges[u][1],
+                                           index_path=index_path)
+                    if r == "aborted":
+                        return r
+                    result.extend(r)
                 except IndexError as e:
                     log_warning("There is no Segment with Index:" + u + " in the Segmentation, skipped images:" + str(p_paths))
+                n_matched += len(p_paths)
 
             return result
 
         else:
-            return self.mode_complete(movie_path, scr_paths, sign_progress)
+            return self.mode_complete(movie_path, scr_paths, match_progress(0, len(scr_paths)), index_path=index_path)
 
     def mode_time(self, movie_path, timestamps, scr_names, sign_progress):
         cap = cv2.VideoCapture(movie_path)
@@ -217,25 +242,41 @@ class ScreenshotImporter(IConcurrentJob):
 
         return result
 
-    def mode_complete(self, movie_path, scr_paths, sign_progress, start = None, end = None):
-
-        cap = cv2.VideoCapture(movie_path)
-        length = cap.get(cv2.CAP_PROP_FRAME_COUNT)
-        width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
-        height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+    def get_frame_index(self, movie_path, index_path, sign_progress):
+        """
+        Returns the FrameIndex of the movie, it is built once and stored at index_path if given.
+        """
+        if self.frame_index is not None:
+            return self.frame_index
+
+        checksum = None
+        if index_path is not None:
+            checksum = movie_fingerprint(movie_path)
+            self.frame_index = FrameIndex.load(index_path, checksum)
+
+        if self.frame_index is None:
+            self.frame_index = FrameIndex.build(movie_path, sign_progress=sign_progress, is_aborted=lambda: self.aborted)
+            if self.frame_index is not None and index_path is not None:
+                self.frame_index.store(index_path, checksum)
+        return self.frame_index
+
+    def mode_complete(self, movie_path, scr_paths, sign_progress, start = None, end = None, index_path = None):
+        """
+        Matches the stills to the frames of the movie, the nearest frames of the FrameIndex are compared exactly.
+        If none of these frames can be decoded, the next-nearest indexed frames are tried.
+
+        Only the downscaled candidates are kept for the comparison, the matched frames are read again
+        at the source resolution afterwards.
+        """
+        index = self.get_frame_index(movie_path, index_path, sign_progress)
+        if index is None:
+            return "aborted"
+
+        reader = FrameReader(movie_path, max_width=None)
+        width = reader.get(cv2.CAP_PROP_FRAME_WIDTH)
+        height = reader.get(cv2.CAP_PROP_FRAME_HEIGHT)
 
-        if start is not None and end is not None:
-            length = end - start
-        else:
-            start = 0
-
-        segm_length = 5000
-        if length < segm_length:
-            segm_length = length
-
-        resolution = 10
         quality = 0.3
-
         width = int(width * quality)
         height = int(height * quality)
 
@@ -246,56 +287,79 @@ class ScreenshotImporter(IConcurrentJob):
             img = cv2.imread(p)
             scrs.append(img)
 
-        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
-        frame_counter = -1
-        n_segments = int(np.ceil(length / segm_length))
-
-        match_table = np.zeros(shape=(n_segments, len(scrs), 2))
+        # The downscaled candidates by frame position
+        frames = dict()
+        decoded = set()
+        progress = [0.0]
 
-        new_scr = []
-        for scr in scrs:
-            new_scr.append(cv2.resize(scr, (int(width), int(height)), interpolation=cv2.INTER_CUBIC))
-
-        scrs = np.array(new_scr, dtype=np.float32)
-
-        for i in range(n_segments):
-            frames = []
-            # frame_idxs = []
-            for j in range(segm_length):
+        def decode(frame_idxs, progress_stop):
+            # The candidates are decoded in the order of the movie, each frame at most once
+            frame_idxs = sorted(set(frame_idxs) - decoded)
+            progress_start = progress[0]
+            for i, frame_idx in enumerate(frame_idxs):
                 if self.aborted:
-                    return "aborted"
-                if j % 20 == 0:
-                    sign_progress(round((((i * segm_length) + j) / length), 2))
-                ret, frame = cap.read()
-                frame_counter += 1
-                if j % resolution != 0:
-                    continue
-
-                if ret and frame_counter < length:
-                    frame = cv2.resize(frame, (int(width), int(height)), interpolation=cv2.INTER_CUBIC)
-                    frames.append(frame)
-
-                else:
-                    break
+                    return False
+                sign_progress(progress_start + (progress_stop - progress_start) * i / len(frame_idxs))
+                decoded.add(frame_idx)
+                frame = reader.read_raw(frame_idx)
+                if frame is not None:
+                    frames[frame_idx] = cv2.resize(frame, (width, height), interpolation=cv2.INTER_CUBIC)
+            progress[0] = progress_stop
+            return True
+
+        k = FRAME_INDEX_CANDIDATES
+        candidates = index.query(scrs, start, end, k=k).tolist()
+        # The fallbacks below share the last tenth of the progress of the candidates
+        if not decode([f for c in candidates for f in c], CANDIDATES_PROGRESS * 0.9):
+            reader.release()
+            return "aborted"
+
+        # The stills of which no candidate could be decoded are queried again with more candidates,
+        # until all indexed frames in the range have been tried
+        missing = [i for i, c in enumerate(candidates) if not any(f in frames for f in c)]
+        while len(missing) > 0 and all(len(candidates[i]) == k for i in missing):
+            k *= 2
+            for i, c in zip(missing, index.query([scrs[i] for i in missing], start, end, k=k).tolist()):
+                candidates[i] = c
+            # Each fallback takes half of the remaining progress
+            if not decode([f for i in missing for f in candidates[i]], (progress[0] + CANDIDATES_PROGRESS) / 2):
+                reader.release()
+                return "aborted"
+            missing = [i for i in missing if not any(f in frames for f in candidates[i])]
+
+        matches = []
+        for i, scr in enumerate(scrs):
+            frame_idxs = [f for f in candidates[i] if f in frames][:FRAME_INDEX_CANDIDATES]
+            if len(frame_idxs) == 0:
+                log_warning("No frame of the movie could be decoded for the still", scr_names[i], "it is skipped")
+                continue
 
-            frames = np.array(frames, dtype=np.float32)
-            for j in range(scrs.shape[0]):
-                match, rate = find_closest(scrs[j], frames)
-                match = (match * resolution) + (segm_length * i)
-                match_table[i, j] = [match, rate]
+            scr = cv2.resize(scr, (width, height), interpolation=cv2.INTER_CUBIC).astype(np.float32)
+            segment = np.array([frames[f] for f in frame_idxs], dtype=np.float32)
+            match, rate = find_closest(scr, segment)
+            frame_idx = frame_idxs[match]
+            log_info("RESULT, ", frame_idx)
+            matches.append((frame_idx, scr_names[i]))
+        frames.clear()
+
+        # The matched frames are read again at the source resolution, in the order of the movie
+        matched_frames = dict()
+        matched_idxs = sorted(set(m[0] for m in matches))
+        for i, frame_idx in enumerate(matched_idxs):
+            if self.aborted:
+                reader.release()
+                return "aborted"
+            sign_progress(CANDIDATES_PROGRESS + (1.0 - CANDIDATES_PROGRESS) * i / len(matched_idxs))
+            matched_frames[frame_idx] = reader.read_raw(frame_idx)
+        reader.release()
+        sign_progress(1.0)
 
         result = []
-        for i in range(scrs.shape[0]):
-            # best_value = np.amin(match_table[:, i, 1])
-            best_idx = np.argmin(match_table[:, i, 1])
-            frame_idx = match_table[best_idx, i, 0]
-            log_info("RESULT, ", frame_idx, frame_idx + start)
-            frame_idx = frame_idx + start
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-            ret, frame = cap.read()
-
-            result.append([frame_idx, frame, scr_names[i]])
-
+        for frame_idx, name in matches:
+            if matched_frames[frame_idx] is None:
+                log_warning("The matched frame", frame_idx, "of the still", name, "could not be read, it is skipped")
+                continue
+            result.append([frame_idx, matched_frames[frame_idx], name])
         return result
 
     def modify_project(self, project:VIANProject, result, sign_progress = None, main_window = None):
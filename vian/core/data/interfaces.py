@@ -10,13 +10,13 @@ from PyQt6.QtWidgets import *
 from PyQt6.QtCore import QObject, pyqtSlot, pyqtSignal
 from PyQt6.QtGui import QColor
 from vian.core.data.enums import DataSerialization
-from scipy.signal import savgol_filter, resample
 from vian.core.data.log import log_debug, log_info, log_error
 from vian.core.container.container_interfaces import ITimelineItem
 from vian.core.container.analysis import AnalysisContainer
 from vian.core.container.project import Screenshot, ScreenshotGroup, Segment, Segmentation, SVGAnnotation, AnnotationLayer, \
     ITimeRange
 from vian.core.data.computation import ms_to_frames
+from vian.core.data.lod_pyramid import LODPyramid
 
 from typing import TYPE_CHECKING
 
@@ -25,6 +25,7 @@ if TYPE_CHECKING:
     from vian.core.container.analysis import AnalysisContainer
 
 VisualizationTab = namedtuple("VisualizationTab", ["name", "widget", "use_filter", "controls"])
+FrameRequest = namedtuple("FrameRequest", ["movie_path", "margins", "frame_positions", "state"])
 
 
 class IProjectChangeNotify():
@@ -89,42 +90,54 @@ class TimelineDataset(ITimelineItem):
 
     def __init__(self, name, data, ms_to_idx=1.0, vis_type=VIS_TYPE_LINE, vis_color=QColor(98, 161, 169)):
         self.data = data
-        self.d_max = np.amax(self.data)
+        self.lod = LODPyramid(data)
+        self.d_max = self.lod.get_max()
         self.strip_height = 45
         self.name = name
         self.ms_to_idx = ms_to_idx
         self.vis_type = vis_type
         self.vis_color = vis_color
 
-    def get_data_range(self, t_start, t_end, norm=True, filter_window=1):
+    def append_data(self, values):
+        """
+        Appends samples to the dataset and updates the level of detail pyramid.
+        """
+        self.data = np.concatenate([self.data, values])
+        self.lod.append(values)
+        self.d_max = self.lod.get_max()
+
+    def get_data_range(self, t_start, t_end, norm=True, filter_window=1, max_points=None):
+        mins, maxs, data, ms = self.get_lod_range(t_start, t_end, norm, filter_window, max_points)
+        return data, ms
+
+    def get_lod_range(self, t_start, t_end, norm=True, filter_window=1, max_points=None):
+        """
+        Returns the minimum, maximum and mean of the blocks of samples between t_start and t_end.
+
+        The blocks are read from the level of detail pyramid, they span at least filter_window samples,
+        and at most max_points blocks are returned. Both is rounded to a power of two samples per block.
+
+        :return: mins, maxs, means, and the time of each block in ms
+        """
         idx_a = int(np.floor(t_start / self.ms_to_idx))
         idx_b = int(np.ceil(t_end / self.ms_to_idx))
 
         offset = (t_start / self.ms_to_idx) - int(np.floor(t_start / self.ms_to_idx))
 
-        ms = np.array(list(range(idx_a, idx_b)))
-        ms = np.multiply(ms, self.ms_to_idx)
-        ms = np.subtract(ms, offset)
-
-        data = np.array(self.data[idx_a:idx_b].copy())
+        samples_per_point = filter_window
+        if max_points is not None and max_points > 0:
+            samples_per_point = max(samples_per_point, (idx_b - idx_a) / max_points)
 
+        mins, maxs, data, starts = self.lod.get_range(idx_a, idx_b, self.lod.get_level(samples_per_point))
         if data.shape[0] == 0:
-            return np.array([]), np.array([])
-
-        frac = data.shape[0] / 20
-        if data.shape[0] > frac:
-            k = filter_window
-
-            data = resample(data, data[0::k].shape[0])
-            ms = ms[0::k]
-        if norm:
-            tmax = np.amax([np.amax(resample(self.data, data[0::filter_window].shape[0])), np.amax(data)])
-            data /= tmax
-        try:
-            return data, ms
-        except Exception as e:
-            log_error(e)
-        return np.array([]), np.array([])
+            return np.array([]), np.array([]), np.array([]), np.array([])
+
+        ms = np.subtract(np.multiply(starts, self.ms_to_idx), offset)
+        if norm and self.d_max != 0:
+            mins = mins / self.d_max
+            maxs = maxs / self.d_max
+            data = data / self.d_max
+        return mins, maxs, data, ms
 
     def get_value_at_time(self, ms):
         ms = np.multiply(ms, self.ms_to_idx)
@@ -273,6 +286,59 @@ class IAnalysisJob(QObject):
             sign_progress = self.dummy_callback
         return args, sign_progress
 
+    def supports_frame_hook(self):
+        """
+        Returns True if the analysis implements the per-frame hook (begin_frames, process_frame, end_frames).
+        Such analyses can be run together in a FramePipeline, which decodes each frame only once
+        and hands it to all analyses requesting it.
+
+        :return: bool
+        """
+        return type(self).begin_frames is not IAnalysisJob.begin_frames
+
+    def supports_parallel_processing(self):
+        """
+        Returns True if process() can split the job onto a pool of n_workers processes.
+        The AnalysisWorker sets n_workers to the PROCESSING_WORKERS of the settings and runs such analyses
+        by process() instead of a FramePipeline, if more than one worker is configured.
+
+        :return: bool
+        """
+        return False
+
+    def begin_frames(self, args) -> FrameRequest:
+        """
+        The per-frame alternative to IAnalysisJob.process(), executed in a separate thread.
+        Determines which frames are needed for the given arguments and sets up the state
+        which is handed to process_frame() and end_frames().
+
+        :param args: the Arguments as they would be handed to IAnalysisJob.process()
+        :return: A FrameRequest(movie_path, margins, frame_positions, state)
+        """
+        raise NotImplementedError("IAnalysisJob:begin_frames not implemented")
+
+    def process_frame(self, state, frame_pos, frame):
+        """
+        Called for every requested frame in ascending order of the frame position.
+        The frame is cropped to the letterbox margins but not downscaled, it is shared
+        with other analyses and must **NOT** be modified in place.
+
+        :param state: the state as returned in the FrameRequest of begin_frames()
+        :param frame_pos: the position of the frame
+        :param frame: the BGR frame
+        :return: None
+        """
+        raise NotImplementedError("IAnalysisJob:process_frame not implemented")
+
+    def end_frames(self, state):
+        """
+        Called once all requested frames have been processed.
+
+        :param state: the state as returned in the FrameRequest of begin_frames()
+        :return: The same as IAnalysisJob.process() would return for the arguments.
+        """
+        raise NotImplementedError("IAnalysisJob:end_frames not implemented")
+
     def modify_project(self, project, result, main_window=None):
         """
         If your Analysis should perform any modifications to the project, except storing the analysis,
@@ -0,0 +1,111 @@
+"""
+A min/max/mean multi-resolution pyramid of a one dimensional signal, such that any range of the signal
+can be reduced to a given number of points without visiting each of its samples.
+
+Level 0 holds the samples, each block of level L aggregates the 2 ** L consecutive samples
+[i * 2 ** L, (i + 1) * 2 ** L), the last block of a level may be shorter.
+"""
+
+import numpy as np
+
+
+def _reduce_pairs(values, ufunc, fill):
+    """
+    Reduces each two consecutive values with ufunc, an odd number of values is padded with fill.
+    """
+    if values.shape[0] % 2 == 1:
+        values = np.append(values, fill)
+    return ufunc.reduce(values.reshape(-1, 2), axis=1)
+
+
+class LODPyramid:
+    """
+    :var mins: The minimum of each block, one array per level
+    :var maxs: The maximum of each block, one array per level
+    :var sums: The sum of each block, one array per level
+    :var n: The number of samples
+    """
+    def __init__(self, data):
+        self.mins = []
+        self.maxs = []
+        self.sums = []
+        self.n = 0
+        self.append(data)
+
+    def append(self, values):
+        """
+        Appends samples to the signal, only the last block of each level and the new blocks are computed.
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        if values.shape[0] == 0:
+            return
+
+        first = self.n
+        if self.n > 0:
+            samples = np.concatenate([self.sums[0], values])
+        else:
+            samples = values.copy()
+        self.n = samples.shape[0]
+        self._set_level(0, samples, samples, samples)
+
+        level = 1
+        while self.sums[level - 1].shape[0] > 1:
+            # The first block of this level containing a changed block of the previous level
+            first //= 2
+            offset = 2 * first
+            mins = _reduce_pairs(self.mins[level - 1][offset:], np.minimum, np.inf)
+            maxs = _reduce_pairs(self.maxs[level - 1][offset:], np.maximum, -np.inf)
+            sums = _reduce_pairs(self.sums[level - 1][offset:], np.add, 0.0)
+            if level < len(self.sums):
+                mins = np.concatenate([self.mins[level][:first], mins])
+                maxs = np.concatenate([self.maxs[level][:first], maxs])
+                sums = np.concatenate([self.sums[level][:first], sums])
+            self._set_level(level, mins, maxs, sums)
+            level += 1
+
+    def _set_level(self, level, mins, maxs, sums):
+        if level < len(self.sums):
+            self.mins[level] = mins
+            self.maxs[level] = maxs
+            self.sums[level] = sums
+        else:
+            self.mins.append(mins)
+            self.maxs.append(maxs)
+            self.sums.append(sums)
+
+    def n_levels(self):
+        return len(self.sums)
+
+    def get_max(self):
+        """
+        Returns the maximum of all samples, or 0.0 if there are none.
+        """
+        if self.n == 0:
+            return 0.0
+        return float(self.maxs[-1][0])
+
+    def get_level(self, samples_per_point):
+        """
+        Returns the finest level whose blocks span at least samples_per_point samples.
+        """
+        if self.n == 0 or samples_per_point <= 1:
+            return 0
+        return int(np.clip(np.ceil(np.log2(samples_per_point)), 0, len(self.sums) - 1))
+
+    def get_range(self, idx_a, idx_b, level):
+        """
+        Returns the blocks of a level which overlap the samples [idx_a, idx_b).
+
+        :return: mins, maxs, means and the index of the first sample of each block
+        """
+        size = 2 ** level
+        idx_a = int(np.clip(idx_a, 0, self.n))
+        idx_b = int(np.clip(idx_b, idx_a, self.n))
+        b_a = idx_a // size
+        b_b = (idx_b + size - 1) // size
+
+        starts = np.arange(b_a, b_b, dtype=np.int64) * size
+        if self.n == 0:
+            return np.zeros(0), np.zeros(0), np.zeros(0), starts
+        counts = np.minimum(size, self.n - starts)
+        return self.mins[level][b_a:b_b], self.maxs[level][b_a:b_b], self.sums[level][b_a:b_b] / counts, starts
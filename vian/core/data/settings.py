@@ -130,6 +130,7 @@ class UserSettings():
 
         self.MULTI_EXPERIMENTS = False
         self.PROCESSING_WIDTH = 1920
+        self.PROCESSING_WORKERS = 1
 
         self.UPDATE_SOURCE = ""#"\\\\130.60.131.134\\team\\Software\\VIAN\\OSX\\"
 
@@ -168,6 +169,10 @@ class UserSettings():
         self.OVERLAY_RESOLUTION_WIDTH = 1200
         self.OVERLAY_VISUALIZATION_COLORMAP = "viridis"
 
+        # The number of frames the OpenCV frame view decodes ahead of and behind the playhead
+        self.FRAME_PREFETCH_AHEAD = 32
+        self.FRAME_PREFETCH_BEHIND = 8
+
         self.dock_widgets_data = []
 
     def set_contributor(self, contributor):
@@ -63,7 +63,7 @@ class CorpusDockWidget(EDockWidget):
         self.list.onSelectionChanged.connect(self.on_selection_changed)
 
         self.corpus = None  # type: Optional[Corpus]
-        self.current_project = None # type: Optional[VIANProject]
+        self.current_project = None # type: Optional[CorpusProject]
 
     def on_new_corpus(self):
         location = QFileDialog().getExistingDirectory(self, directory=self.main_window.settings.DIR_CORPORA)
@@ -186,9 +186,12 @@ class CorpusDockWidget(EDockWidget):
 
     def save_current_project(self):
         if self.current_project is not None:
-            self.current_project.movie_descriptor.meta_data = self.filmography.get_filmography()
-            self.current_project.store_project()
+            project = self.current_project.load()
+            project.movie_descriptor.meta_data = self.filmography.get_filmography()
+            project.store_project()
+            project.close()
             self.corpus.reload(self.current_project)
+            self.current_project = self.corpus.projects_loaded.get(self.current_project.uuid)
 
     def on_save_triggered(self):
         if self.corpus is not None:
@@ -165,7 +165,8 @@ class DialogScreenshotImport(EDialogWidget):
             scr_paths = scr_paths,
             segment_ids = segment_ids,
             segment_ranges = segment_ranges,
-            timestamps = timestamps
+            timestamps = timestamps,
+            index_path = project.frame_index_path if os.path.isdir(project.data_dir) else None
         )
 
         importer = ScreenshotImporter(args)
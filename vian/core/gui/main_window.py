@@ -533,7 +533,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
         # Autosave
         self.autosave_timer = QTimer()
-        self.autosave_timer.timeout.connect(self.on_save_project, no_receiver_check=False)
+        self.autosave_timer.timeout.connect(self.on_autosave_project, no_receiver_check=False)
         self.update_autosave_timer(do_start=False)
 
         self.time = 0
@@ -627,7 +627,8 @@ class MainWindow(QtWidgets.QMainWindow):
     def toggle_colormetry(self):
         log_debug("toggle colormetry", self.project.movie_descriptor.fps / 2)
         if self.colormetry_running is False:
-            job = ColormetryJob2(int(self.project.movie_descriptor.fps / 2), self, self.settings.PROCESSING_WIDTH)
+            job = ColormetryJob2(int(self.project.movie_descriptor.fps / 2), self, self.settings.PROCESSING_WIDTH,
+                                 n_workers=self.settings.PROCESSING_WORKERS)
             args = job.prepare(self.project)
             self.actionColormetry.setText("Pause Colorimetry")
             worker = MinimalThreadWorker(job.run_concurrent, args, True)
@@ -644,7 +645,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def on_colormetry_push_back(self, data):
         if self.project is not None and self.project.colormetry_analysis is not None:
-            self.project.colormetry_analysis.append_data(data[0])
+            self.project.colormetry_analysis.append_block(data[0])
             self.timeline.timeline.set_colormetry_progress(data[1])
 
     def on_colormetry_finished(self, res):
@@ -2026,6 +2027,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
             self.flask_server.on_closed()
             self.player.stop()
+            self.frame_update_worker.on_closed()
             self.abortAllConcurrentThreads.emit()
 
             if self.colormetry_running:
@@ -2075,7 +2077,7 @@ class MainWindow(QtWidgets.QMainWindow):
         except FileNotFoundError:
             self.close_project()
 
-    def on_save_project(self, open_dialog=False, sync = False):
+    def on_save_project(self, open_dialog=False, sync = False, incremental = False):
         if self.project is None:
             return
 
@@ -2105,7 +2107,7 @@ class MainWindow(QtWidgets.QMainWindow):
             path = self.project.path
             args = [self.project, self.project.path]
 
-        self.project.store_project(path)
+        self.project.store_project(path, incremental=incremental)
 
         log_info("Saving to:", path)
         self.settings.add_to_recent_files(self.project)
@@ -2113,6 +2115,10 @@ class MainWindow(QtWidgets.QMainWindow):
 
         return
 
+    def on_autosave_project(self):
+        # Only the entities changed since the last save are serialized, saving explicitly stores all of them
+        self.on_save_project(incremental=True)
+
     def on_save_project_as(self):
         self.on_save_project(True)
     #endregion
@@ -48,6 +48,7 @@ class TimelineVisualization(TimelineBar):
         control.sp_filter.valueChanged.connect(partial(self.render_image))
 
         self.last_data = None
+        self.last_envelope = None
         self.t_start = 0
         self.t_end = 0
         self.hover_dot_size = int(self.fontMetrics().height() * 0.8)
@@ -66,9 +67,12 @@ class TimelineVisualization(TimelineBar):
 
         filter_window = self.control.sp_filter.value()
 
-        data, ms = self.dataset.get_data_range(t_start, t_end, filter_window=filter_window)
+        # At most one point per pixel is read from the level of detail pyramid of the dataset
+        mins, maxs, data, ms = self.dataset.get_lod_range(t_start, t_end, filter_window=filter_window,
+                                                          max_points=self.width())
 
         self.last_data = data, ms
+        self.last_envelope = mins, maxs
 
         qimage = QtGui.QImage(self.size(), QtGui.QImage.Format.Format_ARGB32_Premultiplied)
         qimage.fill(QtCore.Qt.GlobalColor.transparent)
@@ -146,6 +150,21 @@ class TimelineLinePlot(TimelineVisualization):
     def render_image(self):
         qimage, qp, data, t_start, t_end, ms = super(TimelineLinePlot, self).render_image()
 
+        # If a point aggregates several samples, their range is drawn behind the line
+        mins, maxs = self.last_envelope
+        if data.shape[0] > 1 and np.any(mins != maxs):
+            envelope = QPolygonF()
+            for i in range(data.shape[0]):
+                envelope.append(QPointF((ms[i] - t_start) / self.timeline.scale, self.height() - (maxs[i] * self.height())))
+            for i in reversed(range(data.shape[0])):
+                envelope.append(QPointF((ms[i] - t_start) / self.timeline.scale, self.height() - (mins[i] * self.height())))
+            c = QColor(self.dataset.vis_color)
+            c.setAlpha(70)
+            qp.setPen(Qt.PenStyle.NoPen)
+            qp.setBrush(c)
+            qp.drawPolygon(envelope)
+            qp.setBrush(Qt.BrushStyle.NoBrush)
+
         pen = QtGui.QPen()
         pen.setColor(self.dataset.vis_color)
         pen.setWidthF(3.0)
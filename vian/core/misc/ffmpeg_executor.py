@@ -5,6 +5,7 @@ https://stackoverflow.com/questions/7632589/getting-realtime-output-from-ffmpeg-
 
 import subprocess
 import re
+import numpy as np
 from typing import Iterator
 
 DUR_REGEX = re.compile(
@@ -78,4 +79,28 @@ def run_ffmpeg_command(cmd: "list[str]") -> Iterator[float]:
 
 def ffmpeg_convert(input, output, callback):
     for progress in run_ffmpeg_command(["ffmpeg", "-i", input, output]):
-        callback(progress)
\ No newline at end of file
+        callback(progress)
+
+
+def ffmpeg_read_audio(input, sample_rate=22050, chunk_size=22050 * 60):
+    """
+    Decodes the audio of a file to mono float32 samples at the given sample rate.
+    Yields arrays of chunk_size samples (the last one may be shorter), such that the audio is never read completely.
+    """
+    p = subprocess.Popen(
+        ["ffmpeg", "-v", "error", "-i", input, "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "-"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        while True:
+            data = p.stdout.read(chunk_size * 4)
+            if len(data) == 0:
+                break
+            yield np.frombuffer(data[:len(data) - len(data) % 4], dtype=np.float32)
+    finally:
+        p.stdout.close()
+        stderr = p.stderr.read()
+        p.stderr.close()
+        if p.wait() != 0:
+            raise RuntimeError("Error reading audio from {}: {}".format(input, stderr.decode("utf8", errors="replace")))
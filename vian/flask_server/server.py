@@ -1,6 +1,8 @@
 import os
 import sys
 import cv2
+import base64
+import time
 from functools import partial
 import json
 import platform
@@ -14,7 +16,7 @@ from PyQt6.QtWidgets import QLabel
 from PyQt6.QtWebEngineWidgets import QWebEngineView
 from PyQt6.QtWebEngineCore import QWebEngineSettings, QWebEngineProfile, QWebEnginePage
 from PyQt6 import QtGui
-from flask import Flask, render_template, send_file, url_for, jsonify, request, make_response
+from flask import Flask, render_template, send_file, url_for, jsonify, request, make_response, Response
 
 from vian.core.data.interfaces import IAnalysisJob
 from vian.core.data.log import log_error, log_info
@@ -45,9 +47,28 @@ import mimetypes
 mimetypes.add_type('application/javascript', '.js')
 mimetypes.add_type('application/json', '.json')
 
-from threading import Lock
+from threading import Lock, Condition
 UPDATE_LOCK = Lock()
 
+# Changes are sent to the /screenshot-events/ stream once no further change happened for
+# EVENT_DEBOUNCE seconds, but at most EVENT_MAX_DELAY seconds after the first one
+EVENT_DEBOUNCE = 0.25
+EVENT_MAX_DELAY = 1.0
+
+# Seconds after which an idle stream sends a comment, such that closed connections are detected
+EVENT_KEEP_ALIVE = 15.0
+
+
+# The depth the palettes are merged to for the web visualizations
+PALETTE_MERGE_DEPTH = 15
+
+# The columns of the derived features of the screenshots, encoded as float32 by the binary delta format
+SCREENSHOT_FEATURE_COLUMNS = ["a", "b", "luminance", "chroma", "hue", "saturation"]
+
+# The number of removed screenshots remembered for the deltas, once exceeded the older half is dropped
+# and clients which have not seen these removals get all entries
+REMOVED_REVISIONS_LIMIT = 1000
+
 
 class ScreenshotData:
     def __init__(self):
@@ -67,6 +88,104 @@ class ScreenshotData:
         self.selected_but_not_analyzed_uuids_ColorPaletteAnalysis = []
         self.segment_starts = []
         self.segment_ends = []
+        self.segment_ids = []
+
+
+class ScreenshotEntry:
+    """
+    The derived features of a single screenshot, computed once from its analyses.
+
+    :var key: The analyses and the time the entry has been computed from, the entry is recomputed if it changes
+    :var has_features: False if the screenshot has no ColorFeatureAnalysis
+    :var has_palette: False if the screenshot has no ColorPaletteAnalysis
+    :var palette: The palette at PALETTE_MERGE_DEPTH, a list of dicts with bgr, lab and amount
+    """
+    def __init__(self, uuid, key, time):
+        self.uuid = uuid
+        self.key = key
+        self.time = time
+
+        self.has_features = False
+        self.a = 0.0
+        self.b = 0.0
+        self.luminance = 0.0
+        self.chroma = 0.0
+        self.hue = 0.0
+        self.saturation = 0.0
+
+        self.has_palette = False
+        self.palette = []
+
+
+def screenshot_entry_key(s:Screenshot):
+    """
+    Returns the analyses of a screenshot used by the web visualizations and the entry key computed from them.
+    """
+    features = s.get_connected_analysis(ColorFeatureAnalysis)
+    palettes = s.get_connected_analysis(ColorPaletteAnalysis)
+    key = (features[0].unique_id if len(features) > 0 else None,
+           palettes[0].unique_id if len(palettes) > 0 else None,
+           s.get_start())
+    return features, palettes, key
+
+
+def compute_screenshot_entry(s:Screenshot, features, palettes, key):
+    """
+    Reads the analyses of a screenshot and computes its ScreenshotEntry.
+
+    :return: A ScreenshotEntry or None if the ColorFeatureAnalysis could not be read
+    """
+    entry = ScreenshotEntry(s.unique_id, key, ms2datetime(s.get_start()))
+
+    if len(features) > 0:
+        try:
+            arr = features[0].get_adata()['color_lab']
+        except Exception as e:
+            log_error(e)
+            return None
+        d = np.nan_to_num(arr).tolist()
+        lch = np.nan_to_num(lab_to_lch(arr, human_readable=True))
+        entry.has_features = True
+        entry.a = d[1]
+        entry.b = d[2]
+        entry.luminance = d[0]
+        entry.chroma = float(lch[1])
+        entry.hue = float(lch[2])
+        entry.saturation = float(np.nan_to_num(lab_to_sat(arr)))
+
+    if len(palettes) > 0:
+        entry.has_palette = True
+        try:
+            pal = get_palette_at_merge_depth(palettes[0].get_adata(), depth=PALETTE_MERGE_DEPTH)
+        except Exception as e:
+            log_error(e)
+            pal = None
+        if pal is not None:
+            entry.palette = pal
+    return entry
+
+
+def encode_screenshot_entries(entries, binary=False):
+    """
+    Encodes a list of ScreenshotEntry column-wise, such that the keys are not repeated for each entry.
+
+    :param binary: If True, the feature columns are encoded as base64 strings of little endian float32 arrays
+    :return: A dict of columns
+    """
+    columns = dict(
+        uuids=[e.uuid for e in entries],
+        time=[e.time for e in entries],
+        has_features=[e.has_features for e in entries],
+        has_palette=[e.has_palette for e in entries],
+        palettes=[e.palette for e in entries]
+    )
+    for c in SCREENSHOT_FEATURE_COLUMNS:
+        values = [getattr(e, c) for e in entries]
+        if binary:
+            columns[c] = base64.b64encode(np.array(values, dtype="<f4").tobytes()).decode("ascii")
+        else:
+            columns[c] = values
+    return columns
 
 
 class ServerData:
@@ -76,6 +195,25 @@ class ServerData:
         self._recompute_screenshot_cache = False
         self._screenshot_cache = dict(revision = 0, data=ScreenshotData())
 
+        # (key, entry) by uuid, reused until the analyses or the time of their screenshot change
+        self._entry_cache = dict()
+
+        # The entries of the currently selected screenshots, by uuid in the order of the screenshots
+        self._entries = dict()
+        # The revisions in which each entry has last been added or changed and in which entries have been removed
+        self._entry_revisions = dict()
+        self._removed_revisions = dict()
+        self._segments = dict(segment_starts=[], segment_ends=[], segment_ids=[])
+        self._segments_revision = 0
+        # Clients with an older revision have seen another project or missed pruned removals and get all entries
+        self._reset_revision = 0
+
+        self._exported_uuids = set()
+
+        # Counts the changes of the project, waited for by the /screenshot-events/ streams
+        self._changes = Condition()
+        self._change_id = 0
+
         self._project_closed = False
         self.selected_uuids = None
         self.settings = None
@@ -84,110 +222,157 @@ class ServerData:
         if self._recompute_screenshot_cache:
             self._recompute_screenshot_cache = False
             self.update_screenshot_data()
-            self._screenshot_cache['revision'] += 1
 
-        if revision != self._screenshot_cache['revision']:
-            return dict(update=True,
-                        revision = self._screenshot_cache['revision'],
-                        data=self._screenshot_cache['data'].__dict__)
-        else:
-            return dict(update=False,
-                        revision = self._screenshot_cache['revision'],
-                        data=dict())
+        with UPDATE_LOCK:
+            if revision != self._screenshot_cache['revision']:
+                return dict(update=True,
+                            revision = self._screenshot_cache['revision'],
+                            data=dict(self._screenshot_cache['data'].__dict__))
+            else:
+                return dict(update=False,
+                            revision = self._screenshot_cache['revision'],
+                            data=dict())
 
-    def update_screenshot_data(self):
-        a = []
-        b = []
-        chroma = []
-        luminance = []
-        saturation = []
-        time = []
-        hue = []
+    def get_screenshot_delta(self, revision = 0, binary = False):
+        """
+        Returns the entries which have been added, changed or removed since the given revision.
 
-        palettes = []
+        If the revision has been issued for another project or is older than the pruned removals,
+        see REMOVED_REVISIONS_LIMIT, all entries are returned and reset is True.
 
-        uuids = []
+        :param revision: The last revision the client has received
+        :param binary: If True, the feature columns are encoded by encode_screenshot_entries() as binary
+        """
+        if self._recompute_screenshot_cache:
+            self._recompute_screenshot_cache = False
+            self.update_screenshot_data()
 
-        segment_starts = []
-        segment_ends = []
-        segment_ids = []
+        with UPDATE_LOCK:
+            current = self._screenshot_cache['revision']
+            reset = revision < self._reset_revision or revision > current
+            if reset:
+                changed = list(self._entries.values())
+                removed = []
+            else:
+                changed = [e for uuid, e in self._entries.items() if self._entry_revisions[uuid] > revision]
+                removed = [uuid for uuid, r in self._removed_revisions.items() if r > revision]
 
-        selected_but_not_analyzed_uuids_ColorFeatureAnalysis = []
-        selected_but_not_analyzed_uuids_ColorPaletteAnalysis = []
-        #print("selected screenshots", self.selected_uuids)
+            if reset or self._segments_revision > revision:
+                segments = self._segments
+            else:
+                segments = None
+
+            return dict(update=reset or len(changed) > 0 or len(removed) > 0 or segments is not None,
+                        revision=current,
+                        reset=reset,
+                        changed=encode_screenshot_entries(changed, binary),
+                        removed=removed,
+                        segments=segments)
+
+    def get_screenshot_entry(self, s:Screenshot):
+        """
+        Returns the cached ScreenshotEntry of a screenshot and only reads its analyses if they have changed.
+        """
+        features, palettes, key = screenshot_entry_key(s)
+        cached = self._entry_cache.get(s.unique_id)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        entry = compute_screenshot_entry(s, features, palettes, key)
+        self._entry_cache[s.unique_id] = (key, entry)
+        return entry
 
-        for i, s in enumerate(self.project.screenshots):
-            if self.selected_uuids is not None and s.unique_id not in self.selected_uuids:
-                continue
+    def update_screenshot_data(self):
+        """
+        Updates the entries of the selected screenshots and increments the revision if any of them changed.
+        """
+        if self.project is None:
+            return
 
-            t = s.get_connected_analysis(ColorFeatureAnalysis)
-            if len(t) > 0:
-                try:
-                    arr = t[0].get_adata()['color_lab']
-                except Exception as e:
-                    log_error(e)
+        with UPDATE_LOCK:
+            entries = dict()
+            for s in self.project.screenshots:
+                if self.selected_uuids is not None and s.unique_id not in self.selected_uuids:
                     continue
-                d = arr.tolist()
-                a.append(d[1])
-                b.append(d[2])
-                uuids.append(s.unique_id)
-                time.append(ms2datetime(s.get_start()))
-                lch = lab_to_lch(arr, human_readable=True)
-                luminance.append(float(arr[0]))
-                chroma.append(float(lch[1]))
-                hue.append(float(lch[2]))
-                saturation.append(float(lab_to_sat(arr)))
-            else:
-                selected_but_not_analyzed_uuids_ColorFeatureAnalysis.append(s.unique_id)
-
-            t2 = s.get_connected_analysis(ColorPaletteAnalysis)
-            if len(t2) > 0:
-                try:
-                    arr = t2[0].get_adata()
-                except Exception as e:
-                    log_error(e)
-                    continue
-                pal = get_palette_at_merge_depth(arr, depth=15)
-                if pal is not None:
-                    palettes.extend(pal)
+                entry = self.get_screenshot_entry(s)
+                if entry is not None:
+                    entries[s.unique_id] = entry
+
+            segments = dict(segment_starts=[], segment_ends=[], segment_ids=[])
+            if self.project.get_main_segmentation() is not None:
+                for s in self.project.get_main_segmentation().segments:
+                    segments['segment_starts'].append(int(s.get_start()))
+                    segments['segment_ends'].append(int(s.get_end()))
+                    segments['segment_ids'].append(s.ID)
+
+            changed = [uuid for uuid, e in entries.items() if self._entries.get(uuid) is not e]
+            removed = [uuid for uuid in self._entries.keys() if uuid not in entries]
+            segments_changed = segments != self._segments
+            order_changed = list(entries.keys()) != [uuid for uuid in self._entries.keys() if uuid in entries]
+
+            if len(changed) == 0 and len(removed) == 0 and not segments_changed and not order_changed:
+                return
+
+            revision = self._screenshot_cache['revision'] + 1
+            for uuid in changed:
+                self._entry_revisions[uuid] = revision
+                self._removed_revisions.pop(uuid, None)
+            for uuid in removed:
+                self._entry_revisions.pop(uuid, None)
+                self._removed_revisions[uuid] = revision
+            if len(self._removed_revisions) > REMOVED_REVISIONS_LIMIT:
+                self._prune_removed_revisions()
+            if segments_changed:
+                self._segments = segments
+                self._segments_revision = revision
+            self._entries = entries
+
+            self._screenshot_cache['revision'] = revision
+            self._screenshot_cache['data'] = self._build_screenshot_data()
+        self.export_screenshots()
+
+    def _prune_removed_revisions(self):
+        """
+        Drops the older half of the removed entries and moves the reset revision past them.
+        """
+        revisions = sorted(self._removed_revisions.values())
+        pruned = revisions[len(revisions) - REMOVED_REVISIONS_LIMIT // 2 - 1]
+        self._removed_revisions = {uuid: r for uuid, r in self._removed_revisions.items() if r > pruned}
+        self._reset_revision = max(self._reset_revision, pruned)
+
+    def _build_screenshot_data(self):
+        """
+        Assembles the full payload of /screenshot-data/ from the current entries.
+        """
+        data = ScreenshotData()
+        for e in self._entries.values():
+            if e.has_features:
+                data.a.append(e.a)
+                data.b.append(e.b)
+                data.uuids.append(e.uuid)
+                data.time.append(e.time)
+                data.luminance.append(e.luminance)
+                data.chroma.append(e.chroma)
+                data.hue.append(e.hue)
+                data.saturation.append(e.saturation)
             else:
-                selected_but_not_analyzed_uuids_ColorPaletteAnalysis.append(s.unique_id)
+                data.selected_but_not_analyzed_uuids_ColorFeatureAnalysis.append(e.uuid)
 
-        if self.project.get_main_segmentation() is not None:
-            for s in self.project.get_main_segmentation().segments:
-                segment_starts.append(int(s.get_start()))
-                segment_ends.append(int(s.get_end()))
-                segment_ids.append(s.ID)
+            if e.has_palette:
+                data.palettes.extend(e.palette)
+            else:
+                data.selected_but_not_analyzed_uuids_ColorPaletteAnalysis.append(e.uuid)
 
-        data = ScreenshotData()
-        data.a = np.nan_to_num(a).tolist()
-        data.b = np.nan_to_num(b).tolist()
-        data.chroma = np.nan_to_num(chroma).tolist()
-        data.luminance = np.nan_to_num(luminance).tolist()
-        data.saturation = np.nan_to_num(saturation).tolist()
-        data.hue = np.nan_to_num(hue).tolist()
-        data.time = np.nan_to_num(time).tolist()
-
-        data.uuids = uuids
-        data.palettes = palettes
-
-        data.selected_but_not_analyzed_uuids_ColorFeatureAnalysis = selected_but_not_analyzed_uuids_ColorFeatureAnalysis
-        data.selected_but_not_analyzed_uuids_ColorPaletteAnalysis = selected_but_not_analyzed_uuids_ColorPaletteAnalysis
-
-        data.segment_starts = segment_starts
-        data.segment_ends = segment_ends
-        data.segment_ids = segment_ids
-
-        self._screenshot_cache['has_changed'] = True
-        self._screenshot_cache['data'] = data
-        self.export_screenshots()
+        data.segment_starts = self._segments['segment_starts']
+        data.segment_ends = self._segments['segment_ends']
+        data.segment_ids = self._segments['segment_ids']
+        return data
 
     def set_project(self, project:VIANProject, onAnalyseColorFeatureSignal, onAnalyseColorPaletteSignal):
         self.project = project
         self.onAnalyseColorFeatureSignal = onAnalyseColorFeatureSignal
         self.onAnalyseColorPaletteSignal = onAnalyseColorPaletteSignal
 
-        self._screenshot_cache = dict(revision = 0, data=ScreenshotData())
+        self._reset_entries()
 
         self.project.onScreenshotAdded.connect(self.on_screenshot_added)
         self.project.onAnalysisAdded.connect(partial(self.queue_update))
@@ -197,11 +382,55 @@ class ServerData:
         for s in self.project.screenshots:
             s.onScreenshotChanged.connect(partial(self.queue_update))
 
-        self._screenshot_cache['revision'] += 1
         self.update_screenshot_data()
+        self.notify_changed()
+
+    def _reset_entries(self):
+        """
+        Drops all entries, the revision keeps increasing such that clients of the previous project get all entries.
+        """
+        with UPDATE_LOCK:
+            revision = self._screenshot_cache['revision'] + 1
+            self._screenshot_cache = dict(revision = revision, data=ScreenshotData())
+            self._reset_revision = revision
+            self._entry_cache = dict()
+            self._entries = dict()
+            self._entry_revisions = dict()
+            self._removed_revisions = dict()
+            self._segments = dict(segment_starts=[], segment_ends=[], segment_ids=[])
+            self._segments_revision = revision
+            self._exported_uuids = set()
 
     def queue_update(self):
         self._recompute_screenshot_cache = True
+        self.notify_changed()
+
+    def notify_changed(self):
+        with self._changes:
+            self._change_id += 1
+            self._changes.notify_all()
+
+    def get_change_id(self):
+        with self._changes:
+            return self._change_id
+
+    def wait_for_changes(self, change_id, timeout = EVENT_KEEP_ALIVE):
+        """
+        Blocks until changes after change_id have happened and have settled, see EVENT_DEBOUNCE.
+
+        :param change_id: The last change id the caller has seen
+        :return: The id of the last change or None if nothing changed within timeout
+        """
+        with self._changes:
+            if not self._changes.wait_for(lambda: self._change_id != change_id, timeout):
+                return None
+
+            deadline = time.monotonic() + EVENT_MAX_DELAY
+            while True:
+                last = self._change_id
+                remaining = min(EVENT_DEBOUNCE, deadline - time.monotonic())
+                if remaining <= 0 or not self._changes.wait_for(lambda: self._change_id != last, remaining):
+                    return self._change_id
 
     def update(self):
         if self._project_closed:
@@ -215,7 +444,8 @@ class ServerData:
             return False
 
     def on_screenshot_added(self, s:Screenshot):
-        s.onScreenshotChanged.connect(partial(self.update_screenshot_data))
+        s.onScreenshotChanged.connect(partial(self.queue_update))
+        self.queue_update()
 
     def screenshot_url(self, s:Screenshot = None, uuid = None):
         if self.project is None:
@@ -231,19 +461,23 @@ class ServerData:
             return None
 
     def export_screenshots(self):
+        """
+        Writes the thumbnails of screenshots which have not been exported since the project has been set.
+        """
         ps = []
         rdir = os.path.join(self.project.export_dir, "screenshot_thumbnails")
         if not os.path.isdir(rdir):
             os.mkdir(rdir)
 
         for s in self.project.screenshots:
-            if s.img_movie is None:
+            if s.unique_id in self._exported_uuids or s.img_movie is None:
                 continue
 
             if s.img_movie.shape[0] > 100:
                 p = os.path.join(rdir, str(s.unique_id) + ".jpg")
                 if not os.path.isfile(p):
                     cv2.imwrite(p, s.img_movie)
+                self._exported_uuids.add(s.unique_id)
                 ps.append(p)
         return ps
 
@@ -258,7 +492,7 @@ class ServerData:
 
     def _clear(self):
         self.project = None  # type: VIANProject
-        self._screenshot_cache = dict(revision = 0, data=ScreenshotData())
+        self._reset_entries()
 
 
 _server_data = ServerData()
@@ -272,7 +506,7 @@ class FlaskServer(QObject):
 
     @pyqtSlot()
     def run_server(self):
-        app.run(host='127.0.0.1', port=VIAN_PORT)
+        app.run(host='127.0.0.1', port=VIAN_PORT, threaded=True)
 
     def on_loaded(self, project):
         global _server_data
@@ -401,13 +635,43 @@ def screenshot(uuid):
 
 @app.route("/screenshot-data/<int:revision>")
 def screenshot_data(revision):
-    if _server_data.project is None:
-        return json.dumps(_server_data.get_screenshot_data(revision))
-    else:
-        ret = _server_data.get_screenshot_data(revision)
-        if 'uuids' in ret['data']:
-            ret['data']['urls'] = [url_for("screenshot", uuid=u) for u in ret['data']['uuids']]
-        return json.dumps(_server_data.get_screenshot_data(revision))
+    ret = _server_data.get_screenshot_data(revision)
+    if _server_data.project is not None and 'uuids' in ret['data']:
+        ret['data']['urls'] = [url_for("screenshot", uuid=u) for u in ret['data']['uuids']]
+    return json.dumps(ret)
+
+
+@app.route("/screenshot-data-delta/<int:revision>")
+def screenshot_data_delta(revision):
+    """
+    Returns the screenshots added, changed or removed since revision, see ServerData.get_screenshot_delta().
+    With ?format=binary the feature columns are sent as base64 encoded float32 arrays.
+    """
+    ret = _server_data.get_screenshot_delta(revision, binary=request.args.get("format") == "binary")
+    if _server_data.project is not None:
+        ret['changed']['urls'] = [url_for("screenshot", uuid=u) for u in ret['changed']['uuids']]
+    return json.dumps(ret)
+
+
+@app.route("/screenshot-events/")
+def screenshot_events():
+    """
+    A stream of server-sent events, sending a "changed" event with the change id whenever the project has changed.
+    The clients fetch /screenshot-data-delta/ when they receive it, instead of polling.
+    """
+    def stream():
+        change_id = _server_data.get_change_id()
+        yield "retry: 2000\nevent: changed\ndata: " + str(change_id) + "\n\n"
+        while True:
+            new_id = _server_data.wait_for_changes(change_id)
+            if new_id is None:
+                yield ": keep-alive\n\n"
+            else:
+                change_id = new_id
+                yield "event: changed\ndata: " + str(change_id) + "\n\n"
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.route("/set-selection/", methods=['POST'])
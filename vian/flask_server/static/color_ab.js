@@ -163,31 +163,6 @@ class ColorAB {
         }
     }
 
-    poll(pollTime) {
-        var that = this;
-        this.source.change.emit();
-        $.ajax({
-            type: 'GET',
-            contentType: 'application/json',
-            dataType: 'json',
-            url: "/screenshot-data/",
-            success: function (e) {
-                if (e.changes || that.source.data.x.length == 0) {
-                    that.source.data.x = e.data.a;
-                    that.source.data.y = e.data.b;
-                    that.source.data.image = e.data.urls
-                }
-            },
-            error: function (error, timeout) {
-                console.log(error);
-            },
-            complete: function () {
-                setTimeout(function () { that.poll(pollTime); }, pollTime);
-            }
-        });
-
-    }
-
     onSelectionChanged(source, selection) {
         if (this.selectionCallback != null) {
             let uuids = [];
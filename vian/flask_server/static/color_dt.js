@@ -122,48 +122,6 @@ class ColorDT {
         this.plot.outline_line_color = foreground;
     }
 
-    poll(pollTime) {
-        var that = this;
-        this.source.change.emit();
-        $.ajax({
-            type: 'GET',
-            contentType: 'application/json',
-            dataType: 'json',
-            url: "/screenshot-data/",
-            success: function (e) {
-                if (that.source.data.x.length != e.data.time.length) {
-                    let time = []
-                    for (var i = 0; i < e.data.time.length; i++){
-                        time.push(new Date(e.data.time[i]))
-                    }
-
-                    that.source.data.x = e.data.time;
-                    that.source.data.y = e.data.luminance;
-
-                    that.source.data.sat = e.data.saturation;
-                    that.source.data.lum = e.data.luminance;
-                    that.source.data.chroma = e.data.chroma;
-                    that.source.data.hue = e.data.hue;
-
-                    that.source.data.a = e.data.a;
-                    that.source.data.b = e.data.b;
-
-                    that.source.data.url = e.data.urls;
-
-                    that.segment_starts = e.data.segment_starts;
-                    that.segment_ends = e.data.segment_ends;
-                }
-            },
-            error: function (error, timeout) {
-                console.log(error);
-            },
-            complete: function(){
-                setTimeout(function(){that.poll(pollTime); }, pollTime);
-            }
-
-        });
-    }
-
     plotRangesChangedCallback(){
         //remove all boxes
         for (var i =0; i < this.boxannotations.length; i++){
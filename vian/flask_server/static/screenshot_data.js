@@ -0,0 +1,112 @@
+// The last revision received from /screenshot-data-delta/
+var screenshot_revision = 0;
+
+// The screenshots received from /screenshot-data-delta/ by uuid and the segments of the main segmentation
+var screenshot_entries = {};
+var screenshot_segments = {segment_starts: [], segment_ends: [], segment_ids: []};
+
+function applyScreenshotDelta(delta) {
+    if (delta.reset) {
+        screenshot_entries = {};
+    }
+    delta.removed.forEach((uuid) => {
+        delete screenshot_entries[uuid];
+    });
+    let changed = delta.changed;
+    changed.uuids.forEach((uuid, i) => {
+        let entry = {};
+        for (const key in changed) {
+            entry[key] = changed[key][i];
+        }
+        screenshot_entries[uuid] = entry;
+    });
+    if (delta.segments != null) {
+        screenshot_segments = delta.segments;
+    }
+}
+
+function getScreenshotData() {
+    // Assembles the entries in the layout of /screenshot-data/
+    let data = {
+        a: [], b: [], urls: [], saturation: [], luminance: [], chroma: [], hue: [], time: [], uuids: [],
+        palettes: [],
+        selected_but_not_analyzed_uuids_ColorFeatureAnalysis: [],
+        selected_but_not_analyzed_uuids_ColorPaletteAnalysis: [],
+        segment_starts: screenshot_segments.segment_starts,
+        segment_ends: screenshot_segments.segment_ends,
+        segment_ids: screenshot_segments.segment_ids
+    };
+    let entries = Object.values(screenshot_entries);
+    entries.sort((x, y) => x.time - y.time);
+    entries.forEach((e) => {
+        if (e.has_features) {
+            data.a.push(e.a);
+            data.b.push(e.b);
+            data.urls.push(e.urls);
+            data.saturation.push(e.saturation);
+            data.luminance.push(e.luminance);
+            data.chroma.push(e.chroma);
+            data.hue.push(e.hue);
+            data.time.push(e.time);
+            data.uuids.push(e.uuids);
+        } else {
+            data.selected_but_not_analyzed_uuids_ColorFeatureAnalysis.push(e.uuids);
+        }
+        if (e.has_palette) {
+            data.palettes.push(...e.palettes);
+        } else {
+            data.selected_but_not_analyzed_uuids_ColorPaletteAnalysis.push(e.uuids);
+        }
+    });
+    return data;
+}
+
+var screenshot_fetch_running = false;
+var screenshot_fetch_pending = false;
+
+function fetchScreenshotDelta() {
+    // Hidden tabs fetch once they become visible again
+    if (screenshot_fetch_running || document.hidden) {
+        screenshot_fetch_pending = true;
+        return;
+    }
+    screenshot_fetch_running = true;
+    screenshot_fetch_pending = false;
+    $.ajax({
+        type: 'GET',
+        dataType: 'json',
+        url: "/screenshot-data-delta/" + screenshot_revision,
+        success: function (e) {
+            if (e.update) {
+                applyScreenshotDelta(e);
+                $(document).trigger("screenshotPollUpdate", [getScreenshotData()]);
+            }
+            screenshot_revision = e.revision;
+        },
+        error: function (jqXHR, textStatus, errorThrown) {
+            console.log("Error", jqXHR, textStatus, errorThrown);
+        },
+        complete: function () {
+            screenshot_fetch_running = false;
+            if (screenshot_fetch_pending) {
+                fetchScreenshotDelta();
+            }
+        }
+    });
+}
+
+function updateScreenshotVis(pollTime) {
+    if (!!window.EventSource) {
+        // The server pushes a "changed" event after each change of the project, also when connecting
+        let source = new EventSource("/screenshot-events/");
+        source.addEventListener("changed", function () { fetchScreenshotDelta(); });
+        document.addEventListener("visibilitychange", function () {
+            if (!document.hidden && screenshot_fetch_pending) {
+                fetchScreenshotDelta();
+            }
+        });
+    } else {
+        fetchScreenshotDelta();
+        setTimeout(function () { updateScreenshotVis(pollTime); }, pollTime);
+    }
+}
@@ -207,7 +207,8 @@ source_time = ColumnDataSource(data=dict(x=[0]))
 source_spatial1 = ColumnDataSource(data=dict(xs=[], ys=[]))
 source_spatial2 = ColumnDataSource(data=dict(xs=[], ys=[]))
 
-for k, p in corpus.projects_loaded.items():
+for k, handle in corpus.projects_loaded.items():
+    p = handle.load()
     s_name = p.name.replace("True", "").replace("False", "")
     old_path = p.movie_descriptor.movie_path
     p.movie_descriptor.movie_path = os.path.join("videos", os.path.split(old_path)[1])
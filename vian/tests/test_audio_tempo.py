@@ -0,0 +1,23 @@
+import unittest
+
+import numpy as np
+
+try:
+    import librosa
+    from vian.core.analysis.audio.audio_tempo import onset_strength_envelope
+except ImportError:
+    librosa = None
+
+
+@unittest.skipIf(librosa is None, "librosa is not installed")
+class TestOnsetStrengthEnvelope(unittest.TestCase):
+    def test_chunked(self):
+        sr = 22050
+        length = sr * 200
+        clicks = librosa.clicks(times=np.arange(0, 200, 0.5), sr=sr, length=length)
+        audio = clicks + 0.01 * np.random.default_rng(0).normal(size=length)
+
+        full = librosa.onset.onset_strength(y=audio.astype(np.float32), sr=sr, hop_length=512)
+        chunked = onset_strength_envelope(audio, sr, hop_length=512, chunk_size=sr * 60)
+        self.assertEqual(chunked.shape, full.shape)
+        np.testing.assert_allclose(chunked, full, atol=1e-4)
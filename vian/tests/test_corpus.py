@@ -0,0 +1,64 @@
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from vian.tests.utils import *
+from vian.core.container.corpus import Corpus, CorpusProject
+
+
+class TestCorpus(unittest.TestCase):
+    def setUp(self) -> None:
+        self.test_temp_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "temp_corpus")
+        if not os.path.exists(self.test_temp_folder):
+            os.mkdir(self.test_temp_folder)
+
+        self.corpus = Corpus("TestCorpus", directory=self.test_temp_folder)
+        for i in range(3):
+            project = VIANProject("Project" + str(i), folder=os.path.join(self.test_temp_folder, "Project" + str(i)))
+            project.__enter__()
+            project.movie_descriptor.movie_id = str(i) + "_1_1"
+            project.store_project()
+            project.close()
+            self.corpus.project_paths[project.uuid] = project.path
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.test_temp_folder)
+
+    def test_reload_summaries(self):
+        with mock.patch.object(VIANProject, "load_project") as load_project:
+            self.corpus.reload()
+            load_project.assert_not_called()
+
+        self.assertEqual(sorted(p.name for p in self.corpus.projects_loaded.values()),
+                         ["Project0", "Project1", "Project2"])
+        for uuid, p in self.corpus.projects_loaded.items():
+            self.assertIsInstance(p, CorpusProject)
+            self.assertEqual(p.movie_descriptor.movie_id, p.name[-1] + "_1_1")
+            self.assertEqual(p.path, self.corpus.project_paths[uuid])
+
+    def test_stored_summaries(self):
+        self.corpus.reload()
+        path = os.path.join(self.test_temp_folder, "TestCorpus")
+        self.corpus.save(path)
+
+        # Unchanged projects are not read again
+        with mock.patch("vian.core.container.corpus.read_project_summary") as read_project_summary:
+            corpus = Corpus().load(path + Corpus.CORPUS_FILE_EXTENSION)
+            read_project_summary.assert_not_called()
+        self.assertEqual(len(corpus.projects_loaded), 3)
+
+    def test_apply_template_to_all(self):
+        self.corpus.template.create_vocabulary("TemplateVocabulary")
+        self.corpus.reload()
+        self.corpus.apply_template_to_all()
+
+        for handle in self.corpus.projects_loaded.values():
+            self.assertTrue(handle.is_up_to_date())
+            project = handle.load()
+            self.assertIn("TemplateVocabulary", [v.name for v in project.vocabularies])
+            project.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+try:
+    from vian.flask_server.server import ServerData, EVENT_DEBOUNCE, EVENT_MAX_DELAY
+except ImportError:
+    ServerData = None
+
+
+class StubScreenshot:
+    def __init__(self, unique_id, start):
+        self.unique_id = unique_id
+        self.start = start
+        self.img_movie = None
+
+    def get_start(self):
+        return self.start
+
+    def get_connected_analysis(self, analysis):
+        return []
+
+
+class StubSegment:
+    def __init__(self, ID, start, end):
+        self.ID = ID
+        self.start = start
+        self.end = end
+
+    def get_start(self):
+        return self.start
+
+    def get_end(self):
+        return self.end
+
+
+class StubSegmentation:
+    def __init__(self, segments):
+        self.segments = segments
+
+
+class StubProject:
+    def __init__(self, export_dir):
+        self.export_dir = export_dir
+        self.screenshots = []
+        self.segmentation = StubSegmentation([])
+
+    def get_main_segmentation(self):
+        return self.segmentation
+
+
+@unittest.skipIf(ServerData is None, "QtWebEngine is not installed")
+class TestServerEvents(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server_data = ServerData()
+
+    def test_coalesce(self):
+        change_id = self.server_data.get_change_id()
+
+        def queue():
+            for i in range(20):
+                self.server_data.queue_update()
+                time.sleep(0.01)
+
+        thread = threading.Thread(target=queue)
+        thread.start()
+        new_id = self.server_data.wait_for_changes(change_id, timeout=5.0)
+        thread.join()
+
+        # All updates arrive within the debounce interval and are sent as a single event
+        self.assertEqual(new_id, change_id + 20)
+        self.assertTrue(self.server_data._recompute_screenshot_cache)
+        self.assertIsNone(self.server_data.wait_for_changes(new_id, timeout=0.1))
+
+    def test_max_delay(self):
+        change_id = self.server_data.get_change_id()
+        stop = threading.Event()
+
+        def queue():
+            while not stop.is_set():
+                self.server_data.queue_update()
+                time.sleep(EVENT_DEBOUNCE / 5)
+
+        thread = threading.Thread(target=queue)
+        thread.start()
+        t = time.monotonic()
+        new_id = self.server_data.wait_for_changes(change_id, timeout=5.0)
+        elapsed = time.monotonic() - t
+        stop.set()
+        thread.join()
+
+        # Continuous updates still send an event after EVENT_MAX_DELAY
+        self.assertGreater(new_id, change_id)
+        self.assertLess(elapsed, EVENT_MAX_DELAY + EVENT_DEBOUNCE)
+
+
+@unittest.skipIf(ServerData is None, "QtWebEngine is not installed")
+class TestScreenshotDelta(unittest.TestCase):
+    def setUp(self) -> None:
+        self.export_dir = tempfile.mkdtemp()
+        self.project = StubProject(self.export_dir)
+        self.project.screenshots = [StubScreenshot(i, i * 1000) for i in range(5)]
+
+        self.server_data = ServerData()
+        self.server_data.project = self.project
+        self.server_data.update_screenshot_data()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.export_dir)
+
+    def test_changed_removed(self):
+        delta = self.server_data.get_screenshot_delta(0)
+        self.assertTrue(delta['update'])
+        self.assertEqual(delta['changed']['uuids'], [0, 1, 2, 3, 4])
+        revision = delta['revision']
+
+        delta = self.server_data.get_screenshot_delta(revision)
+        self.assertFalse(delta['update'])
+        self.assertEqual(delta['revision'], revision)
+
+        # Unchanged screenshots do not increment the revision
+        self.server_data.update_screenshot_data()
+        self.assertFalse(self.server_data.get_screenshot_delta(revision)['update'])
+
+        self.project.screenshots[1].start = 1500
+        self.project.screenshots.pop(3)
+        self.server_data.update_screenshot_data()
+        delta = self.server_data.get_screenshot_delta(revision)
+        self.assertTrue(delta['update'])
+        self.assertFalse(delta['reset'])
+        self.assertEqual(delta['revision'], revision + 1)
+        self.assertEqual(delta['changed']['uuids'], [1])
+        self.assertEqual(delta['removed'], [3])
+        self.assertIsNone(delta['segments'])
+
+        # A removed screenshot which is added again is sent as changed
+        self.project.screenshots.append(StubScreenshot(3, 3000))
+        self.server_data.update_screenshot_data()
+        delta = self.server_data.get_screenshot_delta(revision + 1)
+        self.assertEqual(delta['changed']['uuids'], [3])
+        self.assertEqual(delta['removed'], [])
+        delta = self.server_data.get_screenshot_delta(revision)
+        self.assertEqual(delta['changed']['uuids'], [1, 3])
+        self.assertEqual(delta['removed'], [])
+
+    def test_segments(self):
+        revision = self.server_data.get_screenshot_delta(0)['revision']
+        self.project.segmentation.segments = [StubSegment(1, 0, 2000), StubSegment(2, 2000, 5000)]
+        self.server_data.update_screenshot_data()
+
+        delta = self.server_data.get_screenshot_delta(revision)
+        self.assertTrue(delta['update'])
+        self.assertEqual(delta['changed']['uuids'], [])
+        self.assertEqual(delta['segments'], dict(segment_starts=[0, 2000], segment_ends=[2000, 5000], segment_ids=[1, 2]))
+        self.assertIsNone(self.server_data.get_screenshot_delta(delta['revision'])['segments'])
+
+    def test_reset_revision(self):
+        revision = self.server_data.get_screenshot_delta(0)['revision']
+
+        # A client of the previous project gets all entries of the new one
+        self.server_data._reset_entries()
+        self.project.screenshots = [StubScreenshot(i, i * 1000) for i in range(5, 8)]
+        self.server_data.update_screenshot_data()
+        delta = self.server_data.get_screenshot_delta(revision)
+        self.assertTrue(delta['reset'])
+        self.assertEqual(delta['changed']['uuids'], [5, 6, 7])
+        self.assertEqual(delta['removed'], [])
+
+        # As does a client with a revision from the future, e.g. of a restarted server
+        self.assertTrue(self.server_data.get_screenshot_delta(delta['revision'] + 1)['reset'])
+        self.assertFalse(self.server_data.get_screenshot_delta(delta['revision'])['update'])
+
+    def test_prune_removed(self):
+        revision = self.server_data.get_screenshot_delta(0)['revision']
+        with mock.patch("vian.flask_server.server.REMOVED_REVISIONS_LIMIT", 4):
+            for uuid in [0, 1, 2, 3, 4]:
+                self.project.screenshots = [s for s in self.project.screenshots if s.unique_id != uuid]
+                self.server_data.update_screenshot_data()
+
+        # The removals of the two older revisions have been dropped
+        self.assertEqual(len(self.server_data._removed_revisions), 2)
+        self.assertEqual(self.server_data._reset_revision, revision + 3)
+        self.assertTrue(self.server_data.get_screenshot_delta(revision + 2)['reset'])
+
+        delta = self.server_data.get_screenshot_delta(revision + 3)
+        self.assertFalse(delta['reset'])
+        self.assertEqual(delta['removed'], [3, 4])
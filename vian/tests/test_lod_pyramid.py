@@ -0,0 +1,67 @@
+import time
+import unittest
+
+import numpy as np
+
+from vian.core.data.lod_pyramid import LODPyramid
+from vian.core.data.interfaces import TimelineDataset
+
+
+class TestLODPyramid(unittest.TestCase):
+    def setUp(self) -> None:
+        self.data = np.random.default_rng(0).normal(size=1001)
+
+    def test_levels(self):
+        pyramid = LODPyramid(self.data)
+        self.assertEqual(pyramid.get_max(), np.amax(self.data))
+        for level in range(pyramid.n_levels()):
+            size = 2 ** level
+            mins, maxs, means, starts = pyramid.get_range(100, 700, level)
+            for i, s in enumerate(starts):
+                block = self.data[s:s + size]
+                self.assertEqual(mins[i], np.amin(block))
+                self.assertEqual(maxs[i], np.amax(block))
+                self.assertAlmostEqual(means[i], np.mean(block))
+            self.assertLessEqual(starts[0], 100)
+            self.assertGreater(starts[-1] + size, 699)
+
+    def test_append(self):
+        pyramid = LODPyramid(self.data[:3])
+        for a, b in [(3, 4), (4, 64), (64, 65), (65, 1001)]:
+            pyramid.append(self.data[a:b])
+        full = LODPyramid(self.data)
+        self.assertEqual(pyramid.n_levels(), full.n_levels())
+        for level in range(full.n_levels()):
+            np.testing.assert_array_equal(pyramid.mins[level], full.mins[level])
+            np.testing.assert_array_equal(pyramid.maxs[level], full.maxs[level])
+            np.testing.assert_allclose(pyramid.sums[level], full.sums[level])
+
+    def test_empty(self):
+        pyramid = LODPyramid([])
+        self.assertEqual(pyramid.get_max(), 0.0)
+        self.assertEqual(pyramid.get_range(0, 10, pyramid.get_level(4))[2].shape[0], 0)
+
+
+class TestTimelineDataset(unittest.TestCase):
+    def test_data_range(self):
+        data = np.abs(np.random.default_rng(0).normal(size=10000))
+        dataset = TimelineDataset("Test", data, ms_to_idx=40.0)
+
+        values, ms = dataset.get_data_range(0, 4000)
+        np.testing.assert_allclose(values, data[:100] / np.amax(data))
+        np.testing.assert_allclose(ms, np.arange(100) * 40.0)
+
+        values, ms = dataset.get_data_range(0, 400000, max_points=500)
+        self.assertLessEqual(values.shape[0], 500)
+        self.assertGreater(values.shape[0], 250)
+
+    def test_render_benchmark(self):
+        data = np.abs(np.random.default_rng(0).normal(size=2000000))
+        t = time.time()
+        dataset = TimelineDataset("Test", data, ms_to_idx=40.0)
+        t_build = time.time() - t
+
+        t = time.time()
+        for start in range(0, 40000000, 400000):
+            dataset.get_data_range(start, start + 40000000, filter_window=2, max_points=1920)
+        print("\nBuilding the pyramid", round(t_build, 4), "s, 100 zoomed out ranges", round(time.time() - t, 4), "s")
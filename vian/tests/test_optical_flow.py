@@ -0,0 +1,35 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from vian.core.analysis.motion.optical_flow import OpticalFlowAnalysis, FLOW_DENSE, FLOW_SPARSE
+
+
+def translated_pair(shift, width=1280, height=720):
+    """
+    Returns two BGR frames of a textured image with an untextured upper half, the second moved by shift pixels.
+    """
+    rng = np.random.default_rng(0)
+    image = cv2.GaussianBlur(rng.uniform(0, 255, (height, width + shift)).astype(np.float32), (0, 0), 4)
+    image = cv2.normalize(image, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    image[:height // 2] = 128
+    image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    return image[:, :width].copy(), image[:, shift:shift + width].copy()
+
+
+class TestOpticalFlow(unittest.TestCase):
+    def test_translation_magnitude(self):
+        for shift in [4, 12]:
+            a, b = translated_pair(shift)
+            for mode in [FLOW_DENSE, FLOW_SPARSE]:
+                analysis = OpticalFlowAnalysis(resolution=30, mode=mode)
+                state = analysis._new_state(2)
+                analysis.process_frame(state, 0, a)
+                analysis.process_frame(state, 1, b)
+                # The magnitude is measured in pixels of the source frames
+                self.assertAlmostEqual(state['magnitudes'][0], shift, delta=0.05 * shift, msg=mode)
+
+
+if __name__ == '__main__':
+    unittest.main()
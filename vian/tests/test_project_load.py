@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import shutil
+import unittest
+
+from vian.tests.utils import *
+from vian.core.container.project import INCREMENTAL_STORE_LIMIT
+
+
+class TestProjectLoading(unittest.TestCase):
+    def test_bulk_load(self):
+        """
+        Loading a project in bulk has to yield the same order and segment assignment as adding each entity
+        """
+        serialization = get_large_project(200, 500).store_project(return_dict=True)
+        project = VIANProject().load_project(serialization=serialization)
+
+        segmentation = project.get_main_segmentation()
+        self.assertEqual(len(project.screenshots), 500)
+        self.assertEqual(len(project.undo_manager.undo_stack), 0)
+        self.assertFalse(project.bulk_loading)
+
+        timestamps = [s.movie_timestamp for s in project.screenshots]
+        self.assertEqual(timestamps, sorted(timestamps))
+        for s in project.screenshots:
+            segment = segmentation.get_segment_of_time(s.movie_timestamp)
+            self.assertEqual(s.scene_id, segment.ID)
+            self.assertIn(s, project.segment_screenshot_mapping[segment])
+            self.assertIs(project.get_by_id(s.unique_id), s)
+
+    def test_bulk_add_segments(self):
+        project = get_large_project(0, 0)
+        segmentation = project.get_main_segmentation()
+        with project.bulk_load():
+            for start in [3000, 1000, 2000, 0]:
+                segmentation.add_segment(Segment(start=start, end=start + 1000, segmentation=segmentation))
+            project.add_screenshot(Screenshot(timestamp=2500))
+            self.assertTrue(project.inhibit_dispatch)
+
+        self.assertEqual([s.start for s in segmentation.segments], [0, 1000, 2000, 3000])
+        self.assertEqual([s.ID for s in segmentation.segments], [1, 2, 3, 4])
+        self.assertEqual(project.screenshots[0].scene_id, 3)
+        self.assertFalse(project.inhibit_dispatch)
+        self.assertEqual(len(project.undo_manager.undo_stack), 0)
+
+    def test_load_benchmark(self):
+        serialization = get_large_project(5000, 10000).store_project(return_dict=True)
+        t = time.time()
+        project = VIANProject().load_project(serialization=serialization)
+        print("Loading 5000 Segments and 10000 Screenshots:", round(time.time() - t, 2), "s")
+        self.assertEqual(len(project.screenshots), 10000)
+
+
+class TestProjectStoring(unittest.TestCase):
+    def setUp(self) -> None:
+        self.test_temp_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "temp_store")
+        if not os.path.exists(self.test_temp_folder):
+            os.mkdir(self.test_temp_folder)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.test_temp_folder)
+
+    def test_store_incremental(self):
+        project = get_large_project(50, 100)
+        path = project.store_project(os.path.join(self.test_temp_folder, "project.eext"))
+        self.assertEqual(len(project.dirty_groups), 0)
+
+        project.get_main_segmentation().segments[3].set_notes("Changed")
+        self.assertEqual(project.dirty_groups, {"segmentation"})
+        project.store_project(path, incremental=True)
+
+        with open(path) as f:
+            stored = json.load(f)
+        self.assertEqual(stored, json.loads(json.dumps(project.store_project(return_dict=True))))
+        self.assertEqual(stored['segmentation'][0]['segments'][3]['notes'], "Changed")
+
+        # Renames are not recorded by the undo manager, they are signaled by the vocabularies and experiments
+        voc = project.create_vocabulary("V")
+        word = voc.create_word("old")
+        experiment = project.get_default_experiment()
+        project.store_project(path, incremental=True)
+
+        word.set_name("new")
+        voc.set_name("V2")
+        experiment.set_name("Exp2")
+        self.assertEqual(project.dirty_groups, {"vocabularies", "experiments"})
+        project.store_project(path, incremental=True)
+
+        with open(path) as f:
+            stored = json.load(f)
+        self.assertEqual([v['name'] for v in stored['vocabularies']], ["V2"])
+        self.assertEqual([w['name'] for w in stored['vocabularies'][0]['words']], ["new"])
+        self.assertEqual([e['name'] for e in stored['experiments']], ["Exp2"])
+
+    def test_store_incremental_limit(self):
+        project = get_large_project(50, 100)
+        path = project.store_project(os.path.join(self.test_temp_folder, "project.eext"))
+
+        # A change the project is not notified about is stored by the next full store
+        for i in range(INCREMENTAL_STORE_LIMIT):
+            project.name = "Name" + str(i)
+            project.screenshots[0].title = "Unsignaled" + str(i)
+            project.store_project(path, incremental=True)
+            with open(path) as f:
+                stored = json.load(f)
+            self.assertEqual(stored['name'], "Name" + str(i))
+            if i < INCREMENTAL_STORE_LIMIT - 1:
+                self.assertNotEqual(stored['screenshots'][0]['name'], "Unsignaled" + str(i))
+        self.assertEqual(stored['screenshots'][0]['name'], "Unsignaled" + str(INCREMENTAL_STORE_LIMIT - 1))
+
+    def test_store_atomic(self):
+        project = get_large_project(50, 100)
+        path = project.store_project(os.path.join(self.test_temp_folder, "project.eext"))
+        with open(path, "rb") as f:
+            before = f.read()
+
+        # A failing serialization must not touch the existing file
+        project.meta_data['invalid'] = object()
+        with self.assertRaises(TypeError):
+            project.store_project(path)
+
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), before)
+        self.assertFalse(os.path.exists(path + ".tmp"))
+
+
+if __name__ == '__main__':
+    unittest.main()
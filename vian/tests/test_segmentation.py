@@ -0,0 +1,51 @@
+import random
+import unittest
+
+from vian.tests.utils import *
+from vian.core.data.enums import SegmentCreationMode
+
+
+class TestSegmentIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        random.seed(0)
+        self.project = get_large_project(0, 0)
+        self.segmentation = self.project.get_main_segmentation()
+        for i in range(200):
+            start = random.randint(0, 100000)
+            self.segmentation.create_segment2(start, start + random.randint(10, 2000),
+                                              mode=SegmentCreationMode.INTERVAL, dispatch=False)
+
+    def test_point_queries(self):
+        for t in range(0, 102000, 97):
+            expected = None
+            for s in self.segmentation.segments:
+                if s.get_start() <= t < s.get_end():
+                    expected = s
+                    break
+            self.assertIs(self.segmentation.get_segment_of_time(t), expected)
+
+    def test_range_queries(self):
+        for t in range(0, 102000, 997):
+            expected = [s for s in self.segmentation.segments if s.get_start() < t + 3000 and s.get_end() > t]
+            self.assertEqual(self.segmentation.get_segments_in_range(t, t + 3000), expected)
+
+    def test_index_updates(self):
+        segment = self.segmentation.segments[10]
+        segment.move(segment.start + 50, segment.end + 50)
+        self.assertIs(self.segmentation.get_segment_of_time(segment.get_end() - 1), segment)
+
+        self.segmentation.remove_segment(segment, dispatch=False)
+        self.assertNotIn(segment, self.segmentation.get_segments_in_range(segment.get_start(), segment.get_end()))
+
+    def test_overlapping_segments(self):
+        other = self.project.create_segmentation("Other")
+        other.create_segment2(0, 50000, mode=SegmentCreationMode.INTERVAL, dispatch=False)
+
+        pairs = self.segmentation.get_overlapping_segments(other)
+        expected = [s for s in self.segmentation.segments if s.get_start() < 50000]
+        self.assertEqual([a for a, b in pairs], expected)
+        self.assertTrue(all(b is other.segments[0] for a, b in pairs))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import os
+import shutil
+import unittest
+
+import numpy as np
+
+from vian.core.container.thumbnail_store import ThumbnailStore
+
+
+class TestThumbnailStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.test_temp_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "temp_thumbnails")
+        if not os.path.exists(self.test_temp_folder):
+            os.mkdir(self.test_temp_folder)
+        self.store = ThumbnailStore(os.path.join(self.test_temp_folder, "thumbnails.hdf5"))
+        self.thumbnails = dict((p, np.full((140, 250, 3), p, dtype=np.uint8)) for p in [10, 20, 30])
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.test_temp_folder)
+
+    def test_load(self):
+        self.store.store("movie", self.thumbnails, (1920, 1080), (1920, 1080))
+        stored = self.store.load("movie", (1920, 1080), (1920, 1080))
+        self.assertEqual(sorted(stored.keys()), [10, 20, 30])
+        np.testing.assert_array_equal(stored[20], self.thumbnails[20])
+        self.assertEqual(self.store.load("other", (1920, 1080), (1920, 1080)), dict())
+
+    def test_display_size(self):
+        self.store.store("movie", self.thumbnails, (1920, 1080), (1920, 1080))
+
+        # Thumbnails of the same shape scaled from another display size are not used
+        self.assertEqual(self.store.load("movie", (1920, 1080), (1440, 810)), dict())
+        self.assertEqual(self.store.load("movie", (1280, 720), (1920, 1080)), dict())
+
+        # And are replaced once the thumbnails of the new display size are stored
+        self.store.store("movie", {40: self.thumbnails[10]}, (1920, 1080), (1440, 810))
+        self.assertEqual(list(self.store.load("movie", (1920, 1080), (1440, 810)).keys()), [40])
+        self.assertEqual(self.store.load("movie", (1920, 1080), (1920, 1080)), dict())
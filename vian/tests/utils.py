@@ -52,3 +52,31 @@ def get_VIANProject1_exporter():
         project.add_screenshot(Screenshot(timestamp=ss * time_elapsed/50))
 
     return project
+
+
+def get_large_project(n_segments=5000, n_screenshots=10000, segment_duration=1000):
+    """
+    Returns a synthetic project with a main segmentation of n_segments and n_screenshots spread over the segments.
+    The entities are added to the lists directly, such that creating the project is fast.
+    """
+    project: VIANProject = VIANProject()
+
+    segmentation = Segmentation("Main Segmentation")
+    segmentation.set_project(project)
+    project.segmentation.append(segmentation)
+    for s in range(n_segments):
+        segment = Segment(ID=s + 1, start=s * segment_duration, end=(s + 1) * segment_duration,
+                          segmentation=segmentation)
+        segment.set_project(project)
+        segmentation.segments.append(segment)
+
+    duration = n_segments * segment_duration
+    for ss in range(n_screenshots):
+        # A step coprime to the duration, such that the screenshots are not in order
+        t = (ss * 997) % duration
+        shot = Screenshot(title="Shot " + str(ss), timestamp=t, frame_pos=t // 40)
+        shot.set_project(project)
+        project.screenshots.append(shot)
+        project.screenshot_groups[0].screenshots.append(shot)
+
+    return project